@@ -2,16 +2,32 @@
 app.py
 
 Flask app for OtterGuessr2:
- - /maps -> returns a list of .geojson files in assets/maps
+ - /maps -> returns a list of .geojson files in assets/maps (cached, ETag; ?details=1 adds metadata)
+ - /maps/<name>/geometry -> simplified map outline as GeoJSON, encoded polylines or compact binary
  - /heartbeat -> quick connectivity check
  - /create_game, /submit_guess, /finish_game -> custom game logic
- - /download_game_data -> optional
+   ("mapName": "World" samples across every map, see world_index;
+    "seed" / "seeded": true give deterministic rounds, see seeded_rounds)
+ - /start_game, /join_game, /end_game -> session routes (custom_game_routes blueprint);
+   /submit_guess with a sessionId goes to the session handler
+ - /download_game_data -> optional (?compact=1 for non-indented JSON)
+ - /replay -> the rounds of (mapFile, seed, roundCount, algoVersion), regenerated on demand
+ - /challenges/... -> shared and daily challenges with leaderboards (challenge_routes blueprint)
+ - /export_games -> every stored game as streamed (gzip) NDJSON
+ - /store_stats -> live games, evictions and memory estimate of the game stores (+ SQLite stats)
+ - /pool_stats -> round-location pool depth, hit/miss counts and refill latency,
+                 plus Street View resolver cache stats
+ - /metrics -> Prometheus text format: per-route latency, geometry loads, sampling attempts,
+               Street View lookups, store sizes/evictions, pools (see metrics.py)
+
+Log level: OTTERGUESSR_LOG_LEVEL (default INFO; DEBUG logs every request's details).
 """
 
+import hmac
 import logging
 import os
 
-from flask import Flask, jsonify, request, send_file, make_response
+from flask import Flask, Response, jsonify, request, send_file, make_response, stream_with_context
 from flask_cors import CORS
 
 from game_logic import (
@@ -21,15 +37,34 @@ from game_logic import (
     export_game_data,
     GAMES
 )
+from game_export import STORES, gzip_chunks, iter_ndjson
+from geometry_export import get_variant, level_for_zoom
+from geometry_registry import get_map_geometry, warm_up
+from map_catalog import MAP_CATALOG
+from metrics import instrument_flask, render as render_metrics
+from seeded_rounds import ALGO_VERSION, parse_round_count, parse_seed, rounds_payload
+from world_index import is_world
+from round_pool import ROUND_POOLS
+from custom_game_routes import active_games, custom_mode_bp, submit_session_guess
+from challenge_routes import challenge_bp
+from streetview_resolver import get_resolver
 
 app = Flask(__name__)
 CORS(app)  # Enable cross-origin requests from Flutter
+instrument_flask(app)
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("OTTERGUESSR_LOG_LEVEL", "INFO").upper())
 
 # Directory for .geojson maps
 GEOJSON_FOLDER = os.path.join(os.path.dirname(__file__), "assets", "maps")
 
+# How long clients may reuse a /maps response before revalidating it
+MAPS_MAX_AGE_S = int(os.environ.get("OTTERGUESSR_MAPS_MAX_AGE_S", 300))
+
+# Optional: parse all maps up front so the first /create_game per map is as fast as the rest
+if os.environ.get("OTTERGUESSR_WARM_MAPS", "").lower() in ("1", "true", "yes"):
+    warm_up(GEOJSON_FOLDER)
+
 @app.route('/')
 def index():
     """Basic debug route."""
@@ -45,42 +80,96 @@ def get_map_list():
     """
     Returns a JSON list of all .geojson filenames in assets/maps/.
     Example: ["Austria.geojson", "Argentina.geojson", "Antarctica.geojson"]
+    With ?details=1: [{"name", "displayName", "bounds", "area", "vertexCount", "centroid"}, ...]
+    Served from the cached catalogue with a strong ETag; If-None-Match gets a 304.
     """
+    details = request.args.get("details", "").lower() in ("1", "true", "yes")
     try:
-        filenames = [
-            f for f in os.listdir(GEOJSON_FOLDER)
-            if f.lower().endswith('.geojson')
-        ]
-        logging.debug(f"[/maps] Found {len(filenames)} .geojson files.")
-        return jsonify(filenames), 200
+        body, etag = MAP_CATALOG.listing(details=details)
     except Exception as e:
         logging.exception("[/maps] Error listing .geojson files.")
         return jsonify({"error": str(e)}), 500
 
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(body, 200)
+        response.mimetype = "application/json"
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={MAPS_MAX_AGE_S}, must-revalidate"
+    return response
+
+@app.route('/maps/<name>/geometry', methods=['GET'])
+def get_map_geometry_endpoint(name):
+    """
+    Returns the union outline of one map, precomputed and pre-compressed.
+    Query: ?level=full|high|medium|low (or ?zoom=<map zoom>), ?encoding=geojson|polyline|binary
+    Example: /maps/Austria/geometry?zoom=6&encoding=polyline
+    """
+    filename = name if name.lower().endswith('.geojson') else f"{name}.geojson"
+    if filename not in MAP_CATALOG.names():
+        return jsonify({"error": f"Map file not found: {name}"}), 404
+
+    zoom = request.args.get("zoom")
+    try:
+        level = level_for_zoom(zoom) if zoom is not None else request.args.get("level", "full")
+        encoding = request.args.get("encoding", "geojson")
+        map_geom = get_map_geometry(os.path.join(GEOJSON_FOLDER, filename))
+        variant = get_variant(map_geom, level, encoding)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.exception("[/maps/geometry] Could not build geometry for %s", filename)
+        return jsonify({"error": str(e)}), 500
+
+    if request.if_none_match.contains(variant.etag):
+        response = make_response("", 304)
+    else:
+        content_encoding, body = variant.pick(request.accept_encodings)
+        response = make_response(body, 200)
+        response.mimetype = variant.content_type
+        if content_encoding != "identity":
+            response.headers["Content-Encoding"] = content_encoding
+    response.set_etag(variant.etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = f"public, max-age={MAPS_MAX_AGE_S}, must-revalidate"
+    return response
+
 @app.route('/create_game', methods=['POST'])
 def create_game_endpoint():
     """
     Creates a new game: random points in the polygon from .geojson.
     Expects JSON: { "mapName": "Austria.geojson", "timeLimit": 60, "roundCount": 5, "mode": "Classic" }
-    Returns { "message": "Game created", "gameId": "<uuid>" }
+    Optional: "seed" (+ "algoVersion") to play a seed's rounds, or "seeded": true for a new seed.
+    Returns { "message": "Game created", "gameId": "<uuid>" } (+ "seed", "algoVersion" if seeded)
     """
     data = request.get_json(force=True)
     map_name = data.get("mapName", "").strip()
     time_limit = int(data.get("timeLimit", 60))
-    round_count = int(data.get("roundCount", 5))
     mode = data.get("mode", "Classic")  # future usage
+    try:
+        round_count = parse_round_count(data.get("roundCount", 5))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
 
-    logging.debug(f"[/create_game] mapName={map_name}, timeLimit={time_limit}, roundCount={round_count}, mode={mode}")
+    logging.debug("[/create_game] mapName=%s, timeLimit=%s, roundCount=%s, mode=%s", map_name, time_limit, round_count, mode)
 
     geo_path = os.path.join(GEOJSON_FOLDER, map_name)
-    if not os.path.isfile(geo_path):
-        logging.error(f"[/create_game] Map file not found: {map_name}")
+    if not os.path.isfile(geo_path) and not is_world(map_name):
+        logging.error("[/create_game] Map file not found: %s", map_name)
         return jsonify({"error": f"Map file not found: {map_name}"}), 400
+    try:
+        seed, algo_version = parse_seed(data)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
 
     try:
-        game_id = create_custom_game(geo_path, time_limit, round_count)
-        logging.debug(f"[/create_game] Created gameId={game_id}")
-        return jsonify({"message": "Game created", "gameId": game_id}), 201
+        game_id = create_custom_game(geo_path, time_limit, round_count, seed, algo_version)
+        logging.debug("[/create_game] Created gameId=%s", game_id)
+        payload = {"message": "Game created", "gameId": game_id}
+        if seed is not None:
+            payload.update(seed=seed, algoVersion=algo_version)
+        return jsonify(payload), 201
     except Exception as e:
         logging.exception("[/create_game] Exception while creating game.")
         return jsonify({"error": str(e)}), 500
@@ -91,20 +180,24 @@ def submit_guess_endpoint():
     Submit a guess for a specific round.
     JSON: { "gameId": "...", "roundIndex": 0, "userLat": 48.2, "userLng": 16.36 }
     Returns { "distanceKm", "score", "roundIndex", "correctLat", "correctLng", "totalPointsSoFar" }
+    A body with "sessionId" instead is a /start_game session guess (see custom_game_routes).
     """
     data = request.get_json(force=True)
+    if "sessionId" in data:
+        payload, status = submit_session_guess(data)
+        return jsonify(payload), status
     game_id = data.get("gameId")
     round_index = int(data.get("roundIndex", 0))
     user_lat = float(data.get("userLat", 0.0))
     user_lng = float(data.get("userLng", 0.0))
 
-    logging.debug(f"[/submit_guess] gameId={game_id}, roundIndex={round_index}, lat={user_lat}, lng={user_lng}")
+    logging.debug("[/submit_guess] gameId=%s, roundIndex=%s, lat=%s, lng=%s", game_id, round_index, user_lat, user_lng)
 
     try:
         partial = record_guess(game_id, round_index, user_lat, user_lng)
         return jsonify(partial), 200
     except ValueError as ve:
-        logging.error(f"[/submit_guess] ValueError: {ve}")
+        logging.error("[/submit_guess] ValueError: %s", ve)
         return jsonify({"error": str(ve)}), 400
     except Exception as e:
         logging.exception("[/submit_guess] Error.")
@@ -125,13 +218,13 @@ def finish_game_endpoint():
     """
     data = request.get_json(force=True)
     game_id = data.get("gameId")
-    logging.debug(f"[/finish_game] gameId={game_id}")
+    logging.debug("[/finish_game] gameId=%s", game_id)
 
     try:
         final_data = finish_game(game_id)
         return jsonify(final_data), 200
     except ValueError as ve:
-        logging.error(f"[/finish_game] ValueError: {ve}")
+        logging.error("[/finish_game] ValueError: %s", ve)
         return jsonify({"error": str(ve)}), 400
     except Exception as e:
         logging.exception("[/finish_game] Error finalizing game.")
@@ -140,20 +233,21 @@ def finish_game_endpoint():
 @app.route('/download_game_data', methods=['GET'])
 def download_game_data():
     """
-    GET /download_game_data?gameId=XXX
-    Returns the entire game data as JSON for replays.
+    GET /download_game_data?gameId=XXX[&compact=1]
+    Returns the entire game data as JSON for replays (indented, or compact with compact=1).
     """
     game_id = request.args.get("gameId", "")
     if not game_id:
         logging.error("[/download_game_data] Missing gameId param.")
         return jsonify({"error": "Missing gameId"}), 400
     if game_id not in GAMES:
-        logging.error(f"[/download_game_data] Invalid gameId={game_id}")
+        logging.error("[/download_game_data] Invalid gameId=%s", game_id)
         return jsonify({"error": "Invalid gameId"}), 404
 
+    compact = request.args.get("compact", "").lower() in ("1", "true", "yes")
     try:
-        data_str = export_game_data(game_id)
-        response = make_response(data_str)
+        data = export_game_data(game_id, compact=compact)
+        response = make_response(data)
         response.headers["Content-Disposition"] = f"attachment; filename=game_{game_id}.json"
         response.mimetype = "application/json"
         return response
@@ -161,5 +255,85 @@ def download_game_data():
         logging.exception("[/download_game_data] Export error.")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/replay', methods=['GET'])
+def replay():
+    """
+    GET /replay?mapFile=Austria.geojson&seed=123&roundCount=5[&algoVersion=1]
+    The rounds of a seeded game or matchJson, regenerated from its seed. Cacheable: the same
+    query always gives the same rounds (as long as the map is unchanged).
+    """
+    map_file = request.args.get("mapFile", "")
+    try:
+        seed = int(request.args["seed"])
+        round_count = parse_round_count(request.args.get("roundCount", 5))
+        algo_version = int(request.args.get("algoVersion", ALGO_VERSION))
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Invalid replay parameters: {e}"}), 400
+    if not os.path.isfile(os.path.join(GEOJSON_FOLDER, map_file)) and not is_world(map_file):
+        return jsonify({"error": f"Map file not found: {map_file}"}), 404
+
+    try:
+        payload = rounds_payload(map_file, seed, round_count, algo_version)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    response = jsonify(payload)
+    response.headers["Cache-Control"] = f"public, max-age={MAPS_MAX_AGE_S}"
+    return response
+
+@app.route('/export_games', methods=['GET'])
+def export_games():
+    """
+    GET /export_games?store=games|sessions[&finished=1][&gzip=1]
+    Streams every stored game as NDJSON (one /download_game_data or /end_game object per line),
+    optionally gzip-compressed. Requires ?token= (or X-Export-Token) matching OTTERGUESSR_EXPORT_TOKEN;
+    without that setting the endpoint is disabled (404), since the export contains live games' answers.
+    """
+    token = os.environ.get("OTTERGUESSR_EXPORT_TOKEN")
+    if not token:
+        return jsonify({"error": "Not found"}), 404
+    if not hmac.compare_digest(request.args.get("token") or request.headers.get("X-Export-Token", ""), token):
+        return jsonify({"error": "Forbidden"}), 403
+
+    store = request.args.get("store", "games")
+    if store not in STORES:
+        return jsonify({"error": f"Unknown store: {store}"}), 400
+    finished_only = request.args.get("finished", "").lower() in ("1", "true", "yes")
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+
+    lines = iter_ndjson(store, finished_only=finished_only)
+    filename = f"{store}.ndjson"
+    if compress:
+        lines = gzip_chunks(lines)
+        filename += ".gz"
+    response = Response(stream_with_context(lines),
+                        mimetype="application/gzip" if compress else "application/x-ndjson")
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+@app.route('/store_stats', methods=['GET'])
+def store_stats():
+    """Live games, evictions and estimated bytes of the /create_game and session stores."""
+    stats = {"games": GAMES.stats(), "sessions": active_games.stats()}
+    if GAMES.backend is not None:
+        stats["persistence"] = GAMES.backend.stats()
+    return jsonify(stats), 200
+
+@app.route('/pool_stats', methods=['GET'])
+def pool_stats():
+    """Depth, hits/misses and refill latency of every round-location pool, plus resolver stats."""
+    stats = ROUND_POOLS.stats()
+    stats["streetView"] = get_resolver().stats()
+    return jsonify(stats), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Every metric of this process in the Prometheus text format."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+# Session routes (/start_game, /join_game, /end_game). Registered after the app's own routes,
+# so /submit_guess keeps matching submit_guess_endpoint, which serves both modes.
+app.register_blueprint(custom_mode_bp)
+app.register_blueprint(challenge_bp)
+
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
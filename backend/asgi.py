@@ -0,0 +1,331 @@
+"""
+asgi.py
+
+Async serving mode (Starlette, optional dependency), same API as app.py:
+ - /create_game, /submit_guess, /finish_game and the session routes /start_game,
+   /join_game/<sessionId>/<roundNumber>, /end_game are native async handlers
+ - multiplayer rooms (ASGI only, see multiplayer.py): POST /rooms creates a room,
+   GET /rooms/<roomId> returns its state, /rooms/<roomId>/ws?name=<name> is the WebSocket
+ - native routes are timed into the same /metrics histogram as the Flask routes
+ - every other route (/maps, /download_game_data, /export_games, stats, ...) falls through
+   to the Flask app, run in a thread
+
+Blocking work never runs on the event loop: map parsing, point sampling and game-store
+access (shard locks, SQLite group commits) go to one bounded thread pool, while Street View
+lookups on a round-pool miss run as coroutines on the loop (streetview_resolver.lookup_async).
+Shapely and NumPy release the GIL for the heavy parts, so threads are used rather than
+processes; the parsed geometry has to live in this process anyway.
+
+Usage (from backend/):
+  pip install starlette uvicorn
+  uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+Config (env):
+  OTTERGUESSR_ASGI_WORKERS  -> size of the blocking-work thread pool (default min(32, cpus + 4))
+  OTTERGUESSR_ASGI_PRELOAD  -> "0" skips preloading maps from the map bundle at startup
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+from app import GEOJSON_FOLDER, app as flask_app
+from custom_game_routes import (
+    MAPS_DIR,
+    end_session,
+    join_session,
+    store_new_session,
+    submit_session_guess
+)
+from game_export import dumps
+from game_logic import finish_game, record_guess, store_new_game
+from metrics import REQUEST_SECONDS, span, trace
+from multiplayer import ROOMS, parse_client_message
+from seeded_rounds import parse_round_count, parse_seed, take_rounds_async
+from world_index import is_world, load_map
+from round_pool import ROUND_POOLS
+
+ASGI_WORKERS = int(os.environ.get("OTTERGUESSR_ASGI_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+ASGI_PRELOAD = os.environ.get("OTTERGUESSR_ASGI_PRELOAD", "1").lower() not in ("0", "false", "no")
+
+_BLOCKING = concurrent.futures.ThreadPoolExecutor(max_workers=ASGI_WORKERS, thread_name_prefix="asgi-blocking")
+
+
+async def run_blocking(fn, *args):
+    """Runs fn(*args) on the bounded pool and awaits the result."""
+    return await asyncio.get_running_loop().run_in_executor(_BLOCKING, functools.partial(fn, *args))
+
+
+def _json(payload, status=200):
+    return Response(dumps(payload), status_code=status, media_type="application/json")
+
+
+async def _body(request):
+    """Parsed JSON body, or {} if it is missing or not an object."""
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def create_game(request):
+    """Async /create_game (see app.create_game_endpoint)."""
+    data = await _body(request)
+    map_name = str(data.get("mapName", "")).strip()
+    try:
+        time_limit = int(data.get("timeLimit", 60))
+        round_count = parse_round_count(data.get("roundCount", 5))
+    except (TypeError, ValueError) as e:
+        return _json({"error": str(e)}, 400)
+    logging.debug("[asgi /create_game] mapName=%s, timeLimit=%s, roundCount=%s", map_name, time_limit, round_count)
+
+    geo_path = os.path.join(GEOJSON_FOLDER, map_name)
+    if not map_name or not (os.path.isfile(geo_path) or is_world(map_name)):
+        logging.error("[asgi /create_game] Map file not found: %s", map_name)
+        return _json({"error": f"Map file not found: {map_name}"}, 400)
+    try:
+        seed, algo_version = parse_seed(data)
+    except ValueError as ve:
+        return _json({"error": str(ve)}, 400)
+
+    try:
+        with trace("create_custom_game"):
+            with span("load_geometry"):
+                map_geom = await run_blocking(load_map, geo_path)
+            with span("take_rounds"):
+                pooled = await take_rounds_async(map_geom, round_count, seed, algo_version, run_blocking)
+            with span("store_game"):
+                game_id = await run_blocking(store_new_game, geo_path, time_limit, pooled, seed, algo_version)
+        payload = {"message": "Game created", "gameId": game_id}
+        if seed is not None:
+            payload.update(seed=seed, algoVersion=algo_version)
+        return _json(payload, 201)
+    except Exception as e:
+        logging.exception("[asgi /create_game] Exception while creating game.")
+        return _json({"error": str(e)}, 500)
+
+
+async def submit_guess(request):
+    """Async /submit_guess; a body with "sessionId" is a session guess, as in app.py."""
+    data = await _body(request)
+    if "sessionId" in data:
+        payload, status = await run_blocking(submit_session_guess, data)
+        return _json(payload, status)
+
+    try:
+        round_index = int(data.get("roundIndex", 0))
+        user_lat = float(data.get("userLat", 0.0))
+        user_lng = float(data.get("userLng", 0.0))
+        partial = await run_blocking(record_guess, data.get("gameId"), round_index, user_lat, user_lng)
+        return _json(partial)
+    except ValueError as ve:
+        logging.error("[asgi /submit_guess] ValueError: %s", ve)
+        return _json({"error": str(ve)}, 400)
+    except Exception as e:
+        logging.exception("[asgi /submit_guess] Error.")
+        return _json({"error": str(e)}, 500)
+
+
+async def finish_game_endpoint(request):
+    """Async /finish_game."""
+    data = await _body(request)
+    try:
+        return _json(await run_blocking(finish_game, data.get("gameId")))
+    except ValueError as ve:
+        logging.error("[asgi /finish_game] ValueError: %s", ve)
+        return _json({"error": str(ve)}, 400)
+    except Exception as e:
+        logging.exception("[asgi /finish_game] Error finalizing game.")
+        return _json({"error": str(e)}, 500)
+
+
+async def start_game(request):
+    """Async /start_game (see custom_game_routes.start_session)."""
+    data = await _body(request)
+    map_file = data.get("mapFile", "")
+    time_limit = data.get("timeLimit", 60)
+    mode = data.get("mode", "Custom")
+    try:
+        round_count = parse_round_count(data.get("roundCount", 5))
+        seed, algo_version = parse_seed(data)
+    except ValueError as ve:
+        return _json({"error": str(ve)}, 400)
+
+    try:
+        map_geom = await run_blocking(load_map, os.path.join(MAPS_DIR, map_file))
+    except Exception as e:
+        logging.error("[asgi /start_game] parse error: %s", e)
+        return _json({"error": f"Could not parse .geojson: {str(e)}"}, 400)
+
+    try:
+        pooled = await take_rounds_async(map_geom, round_count, seed, algo_version, run_blocking)
+        return _json(await run_blocking(store_new_session, mode, map_file, time_limit, pooled, seed, algo_version))
+    except Exception as e:
+        logging.exception("[asgi /start_game] Exception while creating session.")
+        return _json({"error": str(e)}, 500)
+
+
+async def join_game(request):
+    """Async /join_game/<sessionId>/<roundNumber>."""
+    payload, status = await run_blocking(
+        join_session, request.path_params["sessionId"], request.path_params["roundNumber"])
+    return _json(payload, status)
+
+
+async def end_game(request):
+    """Async /end_game."""
+    data = await _body(request)
+    payload, status = await run_blocking(end_session, data.get("sessionId"))
+    return _json(payload, status)
+
+
+async def create_room(request):
+    """POST /rooms {mapName, timeLimit, roundCount} -> {roomId}; rounds come from the round pool."""
+    data = await _body(request)
+    map_name = str(data.get("mapName", "")).strip()
+    try:
+        time_limit = int(data.get("timeLimit", 60))
+        round_count = parse_round_count(data.get("roundCount", 5))
+        if time_limit <= 0:
+            raise ValueError("timeLimit must be positive.")
+    except (TypeError, ValueError) as e:
+        return _json({"error": str(e)}, 400)
+
+    geo_path = os.path.join(GEOJSON_FOLDER, map_name)
+    if not map_name or not (os.path.isfile(geo_path) or is_world(map_name)):
+        logging.error("[asgi /rooms] Map file not found: %s", map_name)
+        return _json({"error": f"Map file not found: {map_name}"}, 400)
+
+    try:
+        map_geom = await run_blocking(load_map, geo_path)
+        pooled = await ROUND_POOLS.take_async(map_geom, round_count, run_blocking)
+        room = ROOMS.create(map_name, time_limit, pooled)
+    except ValueError as ve:
+        return _json({"error": str(ve)}, 503)
+    except Exception as e:
+        logging.exception("[asgi /rooms] Exception while creating room.")
+        return _json({"error": str(e)}, 500)
+    logging.info("[asgi /rooms] Room %s created: %s, %s rounds, %ss", room.id, map_name, round_count, time_limit)
+    return _json({"roomId": room.id, "roundCount": round_count, "timeLimit": time_limit}, 201)
+
+
+async def get_room(request):
+    """GET /rooms/<roomId> -> current room state (same as the WebSocket snapshot)."""
+    room = ROOMS.get(request.path_params["roomId"])
+    if room is None:
+        return _json({"error": "Room not found"}, 404)
+    return _json(room.snapshot())
+
+
+async def room_socket(websocket):
+    """
+    One player's WebSocket. Outgoing messages go through the player's queue (see
+    multiplayer.Player); this coroutine only reads and applies client messages.
+    """
+    room = ROOMS.get(websocket.path_params["roomId"])
+    await websocket.accept()
+    if room is None:
+        await websocket.close(code=4404, reason="Room not found")
+        return
+    try:
+        player = room.join(websocket, websocket.query_params.get("name"))
+    except ValueError as ve:
+        await websocket.close(code=4409, reason=str(ve))
+        return
+
+    try:
+        while player.connected:
+            try:
+                data = await websocket.receive_json()
+            except ValueError:
+                data = None
+            error = parse_client_message(room, player, data)
+            if error is not None:
+                player.offer(dumps(error).decode("utf-8"), room)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        room.leave(player)
+
+
+async def heartbeat(request):
+    return _json({"status": "ok", "message": "Backend is reachable!"})
+
+
+class RequestTimer:
+    """
+    ASGI middleware timing the native HTTP routes into REQUEST_SECONDS. Requests that fall
+    through to the Flask mount are timed by the Flask app itself (metrics.instrument_flask).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            # Set by the router on a match
+            route = scope.get("route")
+            if route is not None and not isinstance(route, Mount):
+                REQUEST_SECONDS.observe(time.perf_counter() - start, route.path, scope["method"], str(status[0]))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    if ASGI_PRELOAD:
+        from wsgi import preload_maps
+        await run_blocking(preload_maps)
+    yield
+    _BLOCKING.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route("/heartbeat", heartbeat, methods=["GET"]),
+        Route("/create_game", create_game, methods=["POST"]),
+        Route("/submit_guess", submit_guess, methods=["POST"]),
+        Route("/finish_game", finish_game_endpoint, methods=["POST"]),
+        Route("/start_game", start_game, methods=["POST"]),
+        Route("/join_game/{sessionId}/{roundNumber:int}", join_game, methods=["GET"]),
+        Route("/end_game", end_game, methods=["POST"]),
+        Route("/rooms", create_room, methods=["POST"]),
+        Route("/rooms/{roomId}", get_room, methods=["GET"]),
+        WebSocketRoute("/rooms/{roomId}/ws", room_socket),
+        # Everything else is served by the Flask app
+        Mount("/", app=WSGIMiddleware(flask_app))
+    ],
+    middleware=[
+        Middleware(RequestTimer),
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,224 @@
+"""
+bench_api.py
+
+Latency (p50/p95/p99) and throughput of the game API under a local load generator.
+
+By default the real Flask app (app.py incl. the custom_mode_bp session routes) is served
+in this process by werkzeug's threaded server on a free port, and hit over HTTP by
+--concurrency client threads with keep-alive connections. Client and server then share
+one GIL, so absolute numbers are pessimistic; compare runs made the same way. --url
+points the same load at any running server instead (gunicorn, uvicorn asgi:app, ...).
+
+Phases, each measured on its own:
+ - create_game per map (--maps, default a small map vs. Canada/Russia/Antarctica)
+ - submit_guess for every round of every created game
+ - finish_game, download_game_data (indented and ?compact=1) for every game
+ - the session flow: start_game, join_game, submit_guess (sessionId), end_game
+
+The first --warmup requests of each create_game/start_game phase are not measured
+(map parsing, sampler build and the first round-pool refill show up in bench_micro.py).
+
+Usage (from backend/):
+  python benchmarks/bench_api.py --games 200 --concurrency 8 --out results/api.json
+  python benchmarks/bench_api.py --url http://127.0.0.1:8000
+"""
+
+import argparse
+import concurrent.futures
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_utils import latency_summary, write_results  # noqa: E402
+
+DEFAULT_MAPS = "Austria.geojson,Canada.geojson,Russia.geojson,Antarctica.geojson"
+
+
+class Client:
+    """One keep-alive HTTP connection; reconnects after errors."""
+
+    def __init__(self, base_url):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        """Returns (status, parsed JSON or None, seconds)."""
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        start = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            raw = response.read()
+            elapsed = time.perf_counter() - start
+            if response.will_close:
+                self.conn.close()
+                self.conn = None
+        except (OSError, http.client.HTTPException):
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+            return 0, None, time.perf_counter() - start
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = None
+        return response.status, data, elapsed
+
+
+def run_phase(base_url, jobs, concurrency):
+    """
+    Runs (method, path, body) jobs on 'concurrency' client threads.
+    Returns (summary, [(status, data)] in job order).
+    """
+    local = threading.local()
+
+    def _one(job):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = Client(base_url)
+        return client.request(*job)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(_one, jobs))
+    seconds = time.perf_counter() - start
+
+    latencies = [elapsed for status, _data, elapsed in results if 200 <= status < 300]
+    errors = len(results) - len(latencies)
+    return latency_summary(latencies, seconds, errors), [(status, data) for status, data, _ in results]
+
+
+def _row(route, summary, **extra):
+    row = {"route": route}
+    row.update(extra)
+    row.update(summary)
+    return row
+
+
+def start_local_server():
+    """Serves app.py on a free port in a daemon thread. Returns (base_url, server)."""
+    from werkzeug.serving import make_server
+    from app import app
+    # The app logs every request at DEBUG; that would be most of what we measure
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    server.socket.listen(512)
+    threading.Thread(target=server.serve_forever, name="bench-api-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def bench_classic(base_url, maps, games, rounds, concurrency, warmup, rng):
+    rows = []
+    game_ids = []
+    for map_name in maps:
+        body = {"mapName": map_name, "timeLimit": 60, "roundCount": rounds}
+        run_phase(base_url, [("POST", "/create_game", body)] * warmup, concurrency)
+        summary, responses = run_phase(base_url, [("POST", "/create_game", body)] * games, concurrency)
+        rows.append(_row("/create_game", summary, map=map_name, name=f"/create_game {map_name}"))
+        game_ids.extend(data["gameId"] for status, data in responses if status == 201 and data)
+
+    guesses = [
+        ("POST", "/submit_guess", {"gameId": game_id, "roundIndex": i,
+                                   "userLat": rng.uniform(-60, 70), "userLng": rng.uniform(-180, 180)})
+        for game_id in game_ids for i in range(rounds)
+    ]
+    rng.shuffle(guesses)
+    summary, _ = run_phase(base_url, guesses, concurrency)
+    rows.append(_row("/submit_guess", summary, name="/submit_guess"))
+
+    summary, _ = run_phase(base_url, [("POST", "/finish_game", {"gameId": g}) for g in game_ids], concurrency)
+    rows.append(_row("/finish_game", summary, name="/finish_game"))
+
+    for query, name in (("", "/download_game_data"), ("&compact=1", "/download_game_data?compact=1")):
+        jobs = [("GET", f"/download_game_data?gameId={g}{query}", None) for g in game_ids]
+        summary, _ = run_phase(base_url, jobs, concurrency)
+        rows.append(_row("/download_game_data", summary, name=name))
+    return rows
+
+
+def bench_sessions(base_url, map_name, games, rounds, concurrency, warmup, rng):
+    rows = []
+    body = {"mapFile": map_name, "timeLimit": 60, "roundCount": rounds, "mode": "Custom"}
+    run_phase(base_url, [("POST", "/start_game", body)] * warmup, concurrency)
+    summary, responses = run_phase(base_url, [("POST", "/start_game", body)] * games, concurrency)
+    rows.append(_row("/start_game", summary, map=map_name, name=f"/start_game {map_name}"))
+    session_ids = [data["sessionId"] for status, data in responses if status == 200 and data]
+
+    jobs = [("GET", f"/join_game/{s}/{rng.randint(1, rounds)}", None) for s in session_ids]
+    summary, _ = run_phase(base_url, jobs, concurrency)
+    rows.append(_row("/join_game", summary, name="/join_game"))
+
+    guesses = [
+        ("POST", "/submit_guess", {"sessionId": s, "roundNumber": n,
+                                   "guessedLat": rng.uniform(-60, 70), "guessedLng": rng.uniform(-180, 180)})
+        for s in session_ids for n in range(1, rounds + 1)
+    ]
+    rng.shuffle(guesses)
+    summary, _ = run_phase(base_url, guesses, concurrency)
+    rows.append(_row("/submit_guess", summary, name="/submit_guess (session)"))
+
+    summary, _ = run_phase(base_url, [("POST", "/end_game", {"sessionId": s}) for s in session_ids], concurrency)
+    rows.append(_row("/end_game", summary, name="/end_game"))
+    return rows
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    server = None
+    base_url = args.url.rstrip("/") if args.url else None
+    if base_url is None:
+        base_url, server = start_local_server()
+    maps = [m.strip() for m in args.maps.split(",") if m.strip()]
+    try:
+        rows = bench_classic(base_url, maps, args.games, args.rounds, args.concurrency, args.warmup, rng)
+        rows += bench_sessions(base_url, maps[0], args.games, args.rounds, args.concurrency, args.warmup, rng)
+    finally:
+        if server is not None:
+            server.shutdown()
+    return {
+        "server": args.url or "in-process werkzeug (threaded)",
+        "gamesPerMap": args.games,
+        "rounds": args.rounds,
+        "concurrency": args.concurrency,
+        "routes": rows
+    }
+
+
+def add_arguments(parser):
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process one")
+    parser.add_argument("--maps", default=DEFAULT_MAPS, help="comma-separated maps for /create_game; the first is used for sessions")
+    parser.add_argument("--games", type=int, default=200, help="games created per map")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests before each create phase")
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game API routes")
+    add_arguments(parser)
+    parser.add_argument("--out", help="write results (with run metadata) to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.out:
+        write_results(args.out, {"api": results})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
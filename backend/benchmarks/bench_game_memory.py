@@ -0,0 +1,96 @@
+"""
+bench_game_memory.py
+
+Bytes per live game: the old nested-dict layout vs game_models (slots + typed arrays).
+
+Usage (from backend/):
+  python benchmarks/bench_game_memory.py --games 20000 --rounds 5
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from game_models import ClassicGame, SessionGame  # noqa: E402
+
+
+def _legacy_classic(rounds):
+    """The pre-game_models /create_game layout, fully guessed."""
+    return {
+        "settings": {"geojsonPath": "/srv/assets/maps/Austria.geojson", "timeLimit": 60, "roundCount": len(rounds)},
+        "rounds": [
+            {"roundIndex": i, "correctLat": lat, "correctLng": lng, "panoId": "mockpanoid-12345"}
+            for i, (lat, lng) in enumerate(rounds)
+        ],
+        "guesses": [
+            {"roundIndex": i, "userLat": lat + 0.5, "userLng": lng + 0.5, "distanceKm": 60.0 + i, "score": 4700 - i}
+            for i, (lat, lng) in enumerate(rounds)
+        ],
+        "finished": False
+    }
+
+
+def _compact_classic(rounds):
+    game = ClassicGame("/srv/assets/maps/Austria.geojson", 60,
+                       ((lat, lng, "mockpanoid-12345") for lat, lng in rounds))
+    for i, (lat, lng) in enumerate(rounds):
+        game.set_guess(i, lat + 0.5, lng + 0.5, 60.0 + i, 4700 - i)
+    return game
+
+
+def _legacy_session(rounds):
+    """The pre-game_models /start_game layout, fully guessed."""
+    return {
+        "mode": "Classic", "mapFile": "Austria.geojson", "timeLimit": 60, "roundCount": len(rounds),
+        "rounds": [
+            {"lat": lat, "lng": lng, "streetLat": lat, "streetLng": lng, "guessedLat": lat + 0.5,
+             "guessedLng": lng + 0.5, "distanceKm": 60.0 + i, "points": 250 - i}
+            for i, (lat, lng) in enumerate(rounds)
+        ],
+        "totalPoints": 1240
+    }
+
+
+def _compact_session(rounds):
+    game = SessionGame("Classic", "Austria.geojson", 60, ((lat, lng, lat, lng) for lat, lng in rounds))
+    for i, (lat, lng) in enumerate(rounds):
+        game.set_guess(i, lat + 0.5, lng + 0.5, 60.0 + i, 250 - i)
+    return game
+
+
+def bytes_per_game(factory, games, rounds):
+    """Traced allocation of 'games' games divided by their count."""
+    rng = random.Random(42)
+    coords = [[(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(rounds)] for _ in range(games)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = {f"game-{i}": factory(coords[i]) for i in range(games)}
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return (after - before) / games
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--games", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {"games": args.games, "rounds": args.rounds}
+    for label, legacy, compact in (("classic", _legacy_classic, _compact_classic),
+                                   ("session", _legacy_session, _compact_session)):
+        old = bytes_per_game(legacy, args.games, args.rounds)
+        new = bytes_per_game(compact, args.games, args.rounds)
+        results[label] = {"dictBytesPerGame": round(old), "compactBytesPerGame": round(new),
+                          "ratio": round(old / new, 2)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
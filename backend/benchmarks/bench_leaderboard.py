@@ -0,0 +1,95 @@
+"""
+bench_leaderboard.py
+
+challenges.Leaderboard under a stream of results, interleaved with the reads a challenge
+page makes: score submissions per second, top-10 and "my rank" reads per second (cached
+and after every write), compared with re-sorting a dict of best scores on every read.
+
+Usage (from backend/):
+  python benchmarks/bench_leaderboard.py --players 50000 --reads 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from challenges import Leaderboard  # noqa: E402
+
+
+def _rate(n, seconds):
+    return round(n / seconds) if seconds else None
+
+
+def _naive_rank(best, player):
+    ordered = sorted(best.items(), key=lambda item: -item[1])
+    return next(i for i, (name, _score) in enumerate(ordered, 1) if name == player)
+
+
+def bench_leaderboard(players, reads, seed):
+    rng = random.Random(seed)
+    # A fifth of the results are replays of players already on the board
+    names = [f"player{i}" for i in range(players)]
+    results = [(name, rng.randint(0, 25000)) for name in names]
+    results += [(rng.choice(names), rng.randint(0, 25000)) for _ in range(players // 5)]
+
+    board = Leaderboard()
+    start = time.perf_counter()
+    for name, score in results:
+        board.submit(name, score)
+    submit_s = time.perf_counter() - start
+
+    probes = [rng.choice(names) for _ in range(reads)]
+    start = time.perf_counter()
+    for _ in range(reads):
+        board.top(10)
+    top_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name in probes:
+        board.rank(name)
+    rank_s = time.perf_counter() - start
+
+    # Every read right after a write: the caches are of no use here
+    writes = [(rng.choice(names), rng.randint(0, 25000)) for _ in range(reads)]
+    start = time.perf_counter()
+    for (name, score), probe in zip(writes, probes):
+        board.submit(name, score)
+        board.rank(probe)
+        board.top(10)
+    mixed_s = time.perf_counter() - start
+
+    best = {}
+    for name, score in results:
+        best[name] = max(score, best.get(name, 0))
+    naive_reads = min(reads, 50)
+    start = time.perf_counter()
+    for name in probes[:naive_reads]:
+        _naive_rank(best, name)
+    naive_s = time.perf_counter() - start
+
+    return {
+        "players": len(board),
+        "submitsPerSec": _rate(len(results), submit_s),
+        "top10PerSec": _rate(reads, top_s),
+        "rankPerSec": _rate(reads, rank_s),
+        "mixedWriteReadPerSec": _rate(reads, mixed_s),
+        "naiveRankPerSec": _rate(naive_reads, naive_s)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark challenge leaderboard writes and reads")
+    parser.add_argument("--players", type=int, default=50000)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(bench_leaderboard(args.players, args.reads, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+bench_micro.py
+
+Micro-benchmarks of the hot functions behind the API, per map:
+ - load_geojson_polygons -> cold parse + union (cache invalidated each time) and cached lookup
+ - get_random_point_in_shape -> points per second (triangulation sampler, see point_sampler)
+ - rejection sampling -> bounding-box acceptance rate (measured and area/bbox) and points
+   per second of the old sampler, i.e. what OTTERGUESSR_SAMPLER=rejection would cost
+ - precision tiers -> vertices per tier, point-in-map checks per second through the tiers vs
+   the full geometry alone, and the share of points each tier decided
+ - scoring -> scalar and batch guesses per second (see bench_scoring.py)
+ - world_index -> World build time and reverse country lookups per second, STRtree index
+   vs testing every map in turn
+
+Usage (from backend/):
+  python benchmarks/bench_micro.py [--maps Austria.geojson,Canada.geojson] [--out results/micro.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import game_logic  # noqa: E402
+import geometry_registry  # noqa: E402
+import point_sampler  # noqa: E402
+import world_index  # noqa: E402
+from bench_scoring import _guesses, bench_mode  # noqa: E402
+from bench_utils import ms, write_results  # noqa: E402
+
+DEFAULT_MAPS = "Austria.geojson,Canada.geojson,Russia.geojson,Antarctica.geojson"
+
+
+def _timed(fn, repeat):
+    """Seconds per call of fn(), one sample per call."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_map(path, repeat, points, seed):
+    name = os.path.basename(path)
+    row = {"map": name}
+
+    def _cold():
+        geometry_registry.invalidate(path)
+        game_logic.load_geojson_polygons(path)
+
+    try:
+        cold = _timed(_cold, repeat)
+    except Exception as e:
+        row["error"] = str(e)
+        return row
+    warm = _timed(lambda: game_logic.load_geojson_polygons(path), repeat * 100)
+    row["loadColdMs"] = ms(statistics.median(cold))
+    row["loadCachedMs"] = ms(statistics.median(warm))
+    row["fileKb"] = round(os.path.getsize(path) / 1024, 1)
+
+    map_geom = geometry_registry.get_map_geometry(path)
+    row["samplerBuildMs"] = ms(statistics.median(_timed(lambda: point_sampler.TriangleSampler(map_geom.geometry), repeat)))
+    row["triangles"] = len(point_sampler.get_sampler(map_geom))
+
+    random.seed(seed)
+    start = time.perf_counter()
+    for _ in range(points):
+        game_logic.get_random_point_in_shape(map_geom)
+    row["pointsPerSec"] = round(points / (time.perf_counter() - start))
+
+    # Acceptance of the old bounding-box sampler, measured with one vectorized test
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = map_geom.bounds
+    candidates = 100000
+    inside = shapely.contains_xy(map_geom.geometry, rng.uniform(minx, maxx, candidates), rng.uniform(miny, maxy, candidates))
+    bbox_area = (maxx - minx) * (maxy - miny)
+    row["rejectionAcceptance"] = round(float(inside.mean()), 4)
+    row["areaOverBbox"] = round(map_geom.area / bbox_area, 4) if bbox_area else None
+    row.update(bench_tiers(map_geom, rng, candidates))
+
+    tries = max(100, points // 10)
+    start = time.perf_counter()
+    for _ in range(tries):
+        point_sampler._rejection_sample(map_geom, random)
+    row["rejectionPointsPerSec"] = round(tries / (time.perf_counter() - start))
+    return row
+
+
+def bench_tiers(map_geom, rng, candidates):
+    """Point-in-map checks on bbox candidates: tiered contains_xy vs the full geometry."""
+    minx, miny, maxx, maxy = map_geom.bounds
+    xs = rng.uniform(minx, maxx, candidates)
+    ys = rng.uniform(miny, maxy, candidates)
+    tiers = ("bounds", "outer", "core", "full")
+    checks = geometry_registry.CONTAINMENT_CHECKS
+    before = {tier: checks.value(tier) for tier in tiers}
+    start = time.perf_counter()
+    tiered = map_geom.contains_xy(xs, ys)
+    tiered_s = time.perf_counter() - start
+    decided = {tier: round((checks.value(tier) - before[tier]) / candidates, 4) for tier in tiers}
+
+    start = time.perf_counter()
+    full = shapely.contains_xy(map_geom.geometry, xs, ys)
+    full_s = time.perf_counter() - start
+
+    def vertices(geometry):
+        return int(shapely.get_num_coordinates(geometry)) if geometry is not None else None
+
+    return {
+        "tierVertices": {"outer": vertices(map_geom.outer), "core": vertices(map_geom.core),
+                         "full": vertices(map_geom.geometry)},
+        "tieredContainsPerSec": round(candidates / tiered_s),
+        "fullContainsPerSec": round(candidates / full_s),
+        "tierAgreement": round(float((tiered == full).mean()), 4),
+        "decidedByTier": decided
+    }
+
+
+def run(args):
+    maps_dir = geometry_registry.MAPS_DIR
+    maps = [m.strip() for m in args.maps.split(",") if m.strip()]
+    if maps == ["all"]:
+        maps = sorted(f for f in os.listdir(maps_dir) if f.lower().endswith(".geojson"))
+    rows = [bench_map(os.path.join(maps_dir, m), args.repeat, args.points, args.seed) for m in maps]
+
+    lats, lngs, ulats, ulngs = _guesses(args.guesses, args.seed)
+    scoring_rows = [bench_mode(mode, lats, lngs, ulats, ulngs) for mode in ("classic", "custom")]
+    return {"maps": rows, "scoring": scoring_rows, "world": bench_world(args.lookups, args.seed)}
+
+
+def bench_world(lookups, seed):
+    """Reverse country lookup over all maps: indexed (batch and one by one) vs a linear scan."""
+    start = time.perf_counter()
+    world = world_index.get_world()
+    build_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(-60.0, 75.0, lookups)
+    lngs = rng.uniform(-180.0, 180.0, lookups)
+
+    start = time.perf_counter()
+    indexed = world.countries_at(lats, lngs)
+    batch_s = time.perf_counter() - start
+
+    # Before the linear scan below, which loads every full geometry
+    stats = world.stats()
+
+    single = min(lookups, 2000)
+    start = time.perf_counter()
+    for lat, lng in zip(lats[:single].tolist(), lngs[:single].tolist()):
+        world.country_at(lat, lng)
+    single_s = time.perf_counter() - start
+
+    # What a lookup costs without the index: contains_xy against every map until one hits
+    geometries = [(m.name, m.geometry) for m in geometry_registry.cached_maps()]
+    for _name, geometry in geometries:
+        shapely.prepare(geometry)
+    start = time.perf_counter()
+    linear = []
+    for lat, lng in zip(lats[:single].tolist(), lngs[:single].tolist()):
+        linear.append(next((name for name, geometry in geometries if shapely.contains_xy(geometry, lng, lat)), None))
+    linear_s = time.perf_counter() - start
+
+    return {
+        **stats,
+        "buildMs": ms(build_s),
+        "lookupsPerSec": round(lookups / batch_s),
+        "singleLookupsPerSec": round(single / single_s),
+        "linearLookupsPerSec": round(single / linear_s),
+        "linearAgreement": round(sum(a == b for a, b in zip(indexed, linear)) / single, 4)
+    }
+
+
+def add_arguments(parser):
+    parser.add_argument("--maps", default=DEFAULT_MAPS, help="comma-separated maps, or 'all'")
+    parser.add_argument("--repeat", type=int, default=5, help="cold loads / sampler builds per map")
+    parser.add_argument("--points", type=int, default=20000, help="random points per map")
+    parser.add_argument("--guesses", type=int, default=100000, help="guesses for the scoring benchmark")
+    parser.add_argument("--lookups", type=int, default=100000, help="points for the country lookup benchmark")
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks: map loading, point sampling, scoring, country lookup")
+    add_arguments(parser)
+    parser.add_argument("--out", help="write results (with run metadata) to this JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args)
+    if args.out:
+        write_results(args.out, {"micro": results})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+bench_rooms.py
+
+How many concurrent multiplayer rooms one process can hold.
+
+In-process (default): real multiplayer.Room objects on one event loop with fake connections,
+so only the room machinery is measured (timers, scoring, serialize-once fan-out, per-player
+queues). Every player guesses at a random moment in each round; a fraction of players are
+stalled readers (one frame per 10 time limits, never guessing) that overflow their queue
+and get resynced or dropped. Runs on uvloop if installed, as uvicorn would. For each room count the run reports
+event-loop lag (a 10ms ticker's overshoot), how late rounds ended against their time limit,
+messages fanned out per second and resyncs/drops. A room count is held if loop lag p99 stays
+under --max-lag-ms.
+
+Over the network (--url): the same game played by real WebSocket clients (needs the
+'websockets' package) against a running server, e.g. uvicorn asgi:app. Reports the time from
+sending a guess to receiving its scoreboard delta, and the round_start fan-out skew inside a room.
+
+Usage (from backend/):
+  python benchmarks/bench_rooms.py --rooms 100,500,1000,2000 --players 8
+  python benchmarks/bench_rooms.py --url http://127.0.0.1:8000 --rooms 50 --players 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+import urllib.request
+
+os.environ.setdefault("OTTERGUESSR_ROOM_INTERMISSION_S", "0.5")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import multiplayer  # noqa: E402
+from bench_utils import ms, percentile  # noqa: E402
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+class FakeConnection:
+    """Stands in for a WebSocket: counts frames, optionally reads slowly, flags round starts."""
+
+    def __init__(self, delay_s=0.0):
+        self.delay_s = delay_s
+        self.frames = 0
+        self.round_started = asyncio.Event()
+
+    async def send_text(self, message):
+        if self.delay_s:
+            await asyncio.sleep(self.delay_s)
+        self.frames += 1
+        if '"round_start"' in message or '"game_over"' in message:
+            self.round_started.set()
+
+    async def close(self, code=1000):
+        pass
+
+
+async def _fake_player(room, player, conn, time_limit, rng):
+    """Guesses once per round at a random moment within the time limit."""
+    while True:
+        await conn.round_started.wait()
+        conn.round_started.clear()
+        if room.state == "finished":
+            break
+        await asyncio.sleep(rng.uniform(0.05, 0.9) * time_limit)
+        if room.state != "round" or not player.connected:
+            continue
+        lat, lng, _pano_id = room.correct[room.round_index]
+        multiplayer.parse_client_message(room, player, {
+            "type": "guess", "lat": lat + rng.gauss(0, 1), "lng": lng + rng.gauss(0, 1)
+        })
+
+
+async def _lag_monitor(stop, lags, interval_s=0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval_s)
+        lags.append(time.perf_counter() - start - interval_s)
+
+
+async def run_in_process(room_count, players, rounds, time_limit, slow_fraction, seed):
+    rng = random.Random(seed)
+    manager = multiplayer.RoomManager(max_rooms=room_count)
+    fake_rounds = [(0, 0, rng.uniform(-60, 70), rng.uniform(-180, 180), None) for _ in range(rounds)]
+
+    stop = asyncio.Event()
+    lags = []
+    monitor = asyncio.ensure_future(_lag_monitor(stop, lags))
+
+    tasks = []
+    conns = []
+    for _ in range(room_count):
+        room = manager.create("bench", time_limit, fake_rounds)
+        for i in range(players):
+            stalled = i > 0 and rng.random() < slow_fraction
+            conn = FakeConnection(delay_s=10 * time_limit if stalled else 0.0)
+            player = room.join(conn, f"p{i}")
+            conns.append(conn)
+            if not stalled:
+                tasks.append(_fake_player(room, player, conn, time_limit, rng))
+
+    start = time.perf_counter()
+    # Rooms start spread over one time limit, as they would in production
+    stagger_s = time_limit / room_count
+    for room in list(manager.rooms.values()):
+        room.start(room.players[room.host_id])
+        await asyncio.sleep(stagger_s)
+    round_lateness = []
+
+    async def _watch(room):
+        # How late each round ends compared to its deadline
+        while room.state != "finished":
+            deadline = room.deadline
+            await asyncio.sleep(0.005)
+            if deadline is not None and room.deadline is None:
+                round_lateness.append(max(0.0, time.monotonic() - deadline))
+
+    await asyncio.gather(*tasks, *(_watch(room) for room in list(manager.rooms.values())[:50]))
+    while any(room.state != "finished" for room in manager.rooms.values()):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+
+    stats = manager.stats()
+    for room in list(manager.rooms.values()):
+        room.close()
+    return {
+        "rooms": room_count,
+        "players": room_count * players,
+        "seconds": round(elapsed, 2),
+        "loopLagP50Ms": ms(percentile(lags, 50)),
+        "loopLagP99Ms": ms(percentile(lags, 99)),
+        "loopLagMaxMs": ms(max(lags) if lags else None),
+        "roundEndLateP99Ms": ms(percentile(round_lateness, 99)),
+        "messagesPerSec": round(stats["messagesSent"] / elapsed),
+        "framesDelivered": sum(c.frames for c in conns),
+        "resyncs": stats["resyncs"],
+        "dropped": stats["dropped"],
+        "maxRssMb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def _create_room(base_url, map_name, time_limit, rounds):
+    body = json.dumps({"mapName": map_name, "timeLimit": time_limit, "roundCount": rounds}).encode("utf-8")
+    request = urllib.request.Request(f"{base_url}/rooms", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())["roomId"]
+
+
+async def _ws_player(ws_url, is_host, ready, go, rounds, time_limit, rng, guess_latency, round_starts):
+    import websockets
+    async with websockets.connect(ws_url, max_queue=None) as ws:
+        welcome = json.loads(await ws.recv())
+        me = welcome["playerId"]
+        ready.set()
+        await go.wait()
+        if is_host:
+            await ws.send(json.dumps({"type": "start"}))
+        played = 0
+        sent_at = None
+        async for raw in ws:
+            message = json.loads(raw)
+            kind = message["type"]
+            if kind == "round_start":
+                round_starts.setdefault(message["roundIndex"], []).append(time.perf_counter())
+                await asyncio.sleep(rng.uniform(0.05, 0.9) * time_limit)
+                sent_at = time.perf_counter()
+                await ws.send(json.dumps({"type": "guess", "lat": 47.5 + rng.gauss(0, 1), "lng": 14.0 + rng.gauss(0, 1)}))
+            elif kind == "guess" and message["playerId"] == me and sent_at is not None:
+                guess_latency.append(time.perf_counter() - sent_at)
+                sent_at = None
+            elif kind == "round_end":
+                played += 1
+            elif kind == "game_over" or played >= rounds:
+                break
+
+
+async def run_network(base_url, map_name, room_count, players, rounds, time_limit, seed):
+    rng = random.Random(seed)
+    ws_base = base_url.replace("http", "ws", 1)
+    loop = asyncio.get_running_loop()
+    room_ids = await asyncio.gather(*(
+        loop.run_in_executor(None, _create_room, base_url, map_name, time_limit, rounds) for _ in range(room_count)
+    ))
+    go = asyncio.Event()
+    guess_latency = []
+    skews = []
+    coros, readies = [], []
+    per_room_starts = []
+    for room_id in room_ids:
+        round_starts = {}
+        per_room_starts.append(round_starts)
+        for i in range(players):
+            ready = asyncio.Event()
+            readies.append(ready)
+            coros.append(_ws_player(f"{ws_base}/rooms/{room_id}/ws?name=p{i}", i == 0, ready, go,
+                                    rounds, time_limit, rng, guess_latency, round_starts))
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    await asyncio.gather(*(r.wait() for r in readies))
+    start = time.perf_counter()
+    go.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    for round_starts in per_room_starts:
+        skews.extend(max(times) - min(times) for times in round_starts.values() if times)
+    return {
+        "rooms": room_count,
+        "players": room_count * players,
+        "seconds": round(elapsed, 2),
+        "guessToDeltaP50Ms": ms(percentile(guess_latency, 50)),
+        "guessToDeltaP99Ms": ms(percentile(guess_latency, 99)),
+        "roundStartSkewP99Ms": ms(percentile(skews, 99))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test multiplayer rooms")
+    parser.add_argument("--rooms", default="100,500,1000", help="comma-separated room counts")
+    parser.add_argument("--players", type=int, default=8, help="players per room")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--time-limit", type=float, default=2.0, help="seconds per round")
+    parser.add_argument("--slow", type=float, default=0.05, help="fraction of slow readers (in-process)")
+    parser.add_argument("--queue", type=int, default=16, help="per-player queue size (in-process)")
+    parser.add_argument("--max-lag-ms", type=float, default=50.0, help="loop lag p99 a held room count must stay under")
+    parser.add_argument("--url", help="base URL of a running server; plays over real WebSockets")
+    parser.add_argument("--map", default="Austria.geojson", help="map for --url rooms")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    multiplayer.ROOM_QUEUE = args.queue
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    results = []
+    for room_count in (int(n) for n in args.rooms.split(",")):
+        if args.url:
+            result = asyncio.run(run_network(args.url.rstrip("/"), args.map, room_count, args.players,
+                                             args.rounds, int(args.time_limit), args.seed))
+        else:
+            result = asyncio.run(run_in_process(room_count, args.players, args.rounds, args.time_limit,
+                                                args.slow, args.seed))
+            result["held"] = result["loopLagP99Ms"] <= args.max_lag_ms
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+bench_scoring.py
+
+Guesses scored per second: the old per-mode scalar functions vs scoring.py
+(scalar entry points and the NumPy batch path). Also checks that all three agree.
+
+Usage (from backend/):
+  python benchmarks/bench_scoring.py --guesses 100000
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import scoring  # noqa: E402
+
+
+def _legacy_haversine_distance_km(lat1, lng1, lat2, lng2):
+    """game_logic.haversine_distance_km before scoring.py"""
+    R = 6371.0
+    dLat = math.radians(lat2 - lat1)
+    dLng = math.radians(lng2 - lng1)
+    a = math.sin(dLat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLng/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def _legacy_classic_score(distance_km):
+    """game_logic.compute_score before scoring.py"""
+    if distance_km < 0.05:
+        return 5000
+    raw = 5000 - (distance_km * 5)
+    return max(0, int(round(raw)))
+
+
+def _legacy_compute_distance_km(lat1, lng1, lat2, lng2):
+    """custom_mode_logic.compute_distance_km before scoring.py (incl. its debug log call)"""
+    logging.debug("[compute_distance_km] Calculating haversine distance.")
+    rlat1 = math.radians(lat1)
+    rlng1 = math.radians(lng1)
+    rlat2 = math.radians(lat2)
+    rlng2 = math.radians(lng2)
+    dlon = rlng2 - rlng1
+    dlat = rlat2 - rlat1
+    a = (math.sin(dlat/2)**2) + math.cos(rlat1)*math.cos(rlat2)*(math.sin(dlon/2)**2)
+    c = 2*math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return 6371 * c
+
+
+def _legacy_custom_score(distance_km):
+    """custom_mode_logic.compute_score before scoring.py (incl. its debug log call)"""
+    logging.debug(f"[compute_score] distance_km={distance_km}")
+    if distance_km < 0.01:
+        return 5000
+    elif distance_km <= 10:
+        return max(300, int(5000 - distance_km*470))
+    elif distance_km <= 500:
+        frac = (distance_km - 10) / 490
+        return max(0, 300 - int(frac * 300))
+    else:
+        return 0
+
+
+LEGACY = {
+    "classic": (_legacy_haversine_distance_km, _legacy_classic_score),
+    "custom": (_legacy_compute_distance_km, _legacy_custom_score)
+}
+
+
+def _guesses(n, seed):
+    """Correct locations anywhere, guesses from a few meters to a few thousand km away."""
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(-60, 70, n)
+    lngs = rng.uniform(-180, 180, n)
+    spread = 10 ** rng.uniform(-5, 1.5, n)
+    return lats, lngs, np.clip(lats + rng.normal(0, spread), -90, 90), lngs + rng.normal(0, spread)
+
+
+def _rate(n, seconds):
+    return round(n / seconds) if seconds else None
+
+
+def bench_mode(mode, lats, lngs, ulats, ulngs):
+    n = len(lats)
+    legacy_dist, legacy_score = LEGACY[mode]
+    rows = list(zip(lats.tolist(), lngs.tolist(), ulats.tolist(), ulngs.tolist()))
+
+    start = time.perf_counter()
+    legacy = [legacy_score(legacy_dist(a, b, c, d)) for a, b, c, d in rows]
+    legacy_s = time.perf_counter() - start
+
+    curve = scoring.get_curve(mode)
+    start = time.perf_counter()
+    scalar = [curve.score(scoring.distance_km(a, b, c, d)) for a, b, c, d in rows]
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, batch = scoring.score_guesses(lats, lngs, ulats, ulngs, mode)
+    batch_s = time.perf_counter() - start
+
+    mismatches = int(np.count_nonzero(np.asarray(legacy) != batch)) + sum(x != y for x, y in zip(legacy, scalar))
+    return {
+        "mode": mode,
+        "guesses": n,
+        "legacyPerSec": _rate(n, legacy_s),
+        "scalarPerSec": _rate(n, scalar_s),
+        "batchPerSec": _rate(n, batch_s),
+        "batchSpeedup": round(legacy_s / batch_s, 1) if batch_s else None,
+        "mismatches": mismatches
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scoring.py against the old scoring functions")
+    parser.add_argument("--guesses", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    lats, lngs, ulats, ulngs = _guesses(args.guesses, args.seed)
+    results = [bench_mode(mode, lats, lngs, ulats, ulngs) for mode in ("classic", "custom")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
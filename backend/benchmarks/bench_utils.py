@@ -0,0 +1,132 @@
+"""
+bench_utils.py
+
+Helpers shared by the benchmark scripts:
+ - percentile(values, pct), latency_summary(latencies_s, seconds, errors) -> p50/p95/p99 + throughput
+ - run_metadata() -> commit, python, platform, cpu count, OTTERGUESSR_* env of this run
+ - write_results(path, results) -> {"meta": run_metadata(), "results": results} as JSON
+ - compare(base, head, threshold_pct) -> metrics that moved by more than threshold_pct
+
+Metric names decide the direction in compare(): "...Ms"/"...Seconds"/errors are better lower,
+"...PerSec"/"rps" better higher, anything else is reported but never a regression.
+"""
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list, None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def latency_summary(latencies_s, seconds, errors=0):
+    """Latency percentiles (ms) and throughput of one measured phase."""
+    count = len(latencies_s)
+    return {
+        "requests": count + errors,
+        "errors": errors,
+        "rps": round(count / seconds, 1) if seconds else None,
+        "meanMs": ms(sum(latencies_s) / count) if count else None,
+        "p50Ms": ms(percentile(latencies_s, 50)),
+        "p95Ms": ms(percentile(latencies_s, 95)),
+        "p99Ms": ms(percentile(latencies_s, 99)),
+        "maxMs": ms(max(latencies_s)) if count else None
+    }
+
+
+def _git(*args):
+    try:
+        out = subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() if out.returncode == 0 else None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_metadata():
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--", ".")),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "argv": sys.argv[1:],
+        "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith("OTTERGUESSR_")}
+    }
+
+
+def write_results(path, results):
+    """Writes results plus run metadata; returns the written document."""
+    document = {"meta": run_metadata(), "results": results}
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return document
+
+
+def _flatten(obj, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1}; list items are keyed by their 'name'/'map'/'route' if any."""
+    flat = {}
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(obj, list):
+        for i, item in enumerate(obj):
+            label = i
+            if isinstance(item, dict):
+                label = item.get("name") or item.get("route") or item.get("map") or item.get("mode") or i
+            flat.update(_flatten(item, f"{prefix}[{label}]"))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        flat[prefix] = obj
+    return flat
+
+
+def _direction(metric):
+    name = metric.rsplit(".", 1)[-1]
+    if name.endswith("Ms") or name.endswith("Seconds") or name.endswith("Mb") or name in ("errors", "mismatches"):
+        return -1
+    if name.endswith("PerSec") or name == "rps" or name.endswith("Speedup"):
+        return 1
+    return 0
+
+
+def compare(base, head, threshold_pct=10.0):
+    """
+    Metrics present in both result documents that changed by more than threshold_pct.
+    Returns a list of {"metric", "base", "head", "changePct", "regression"}.
+    """
+    base_flat = _flatten(base.get("results", base))
+    head_flat = _flatten(head.get("results", head))
+    rows = []
+    for metric in sorted(base_flat.keys() & head_flat.keys()):
+        old, new = base_flat[metric], head_flat[metric]
+        if old == new:
+            continue
+        change = (new - old) / abs(old) * 100 if old else float("inf")
+        if abs(change) < threshold_pct:
+            continue
+        direction = _direction(metric)
+        rows.append({
+            "metric": metric,
+            "base": old,
+            "head": new,
+            "changePct": round(change, 1) if change != float("inf") else None,
+            "regression": direction != 0 and change * direction < 0
+        })
+    return rows
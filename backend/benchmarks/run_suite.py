@@ -0,0 +1,88 @@
+"""
+run_suite.py
+
+Runs the benchmark suite (bench_micro.py, then bench_api.py) and stores one JSON document
+per run, so two commits can be diffed:
+ - results go to benchmarks/results/<commit>[-dirty].json unless --out is given
+ - --compare BASE HEAD prints every metric that moved by more than --threshold percent
+   and exits with 1 if any of them got worse (slower, fewer per second, more errors)
+
+Options of the two benchmarks (--maps, --games, --concurrency, --url, --points, ...) are
+passed through; see their --help.
+
+Usage (from backend/):
+  python benchmarks/run_suite.py                      # on the base commit
+  python benchmarks/run_suite.py                      # again on the new commit
+  python benchmarks/run_suite.py --compare results/abc1234.json results/def5678.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bench_api  # noqa: E402
+import bench_micro  # noqa: E402
+from bench_utils import compare, run_metadata, write_results  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _print_comparison(base_path, head_path, threshold):
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(head_path, encoding="utf-8") as f:
+        head = json.load(f)
+    rows = compare(base, head, threshold)
+    print(f"{base.get('meta', {}).get('commit')} -> {head.get('meta', {}).get('commit')} "
+          f"(changes over {threshold}%)")
+    for row in rows:
+        change = f"{row['changePct']:+.1f}%" if row["changePct"] is not None else "new"
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"  {row['metric']:<70} {row['base']:>12} -> {row['head']:>12} {change:>9} {flag}")
+    regressions = sum(row["regression"] for row in rows)
+    print(f"{len(rows)} changed, {regressions} regressions")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and store the results as JSON")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--only", choices=("micro", "api"), help="run just one of the benchmarks")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="diff two result files")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change worth reporting")
+    args, rest = parser.parse_known_args()
+
+    if args.compare:
+        sys.exit(1 if _print_comparison(*args.compare, args.threshold) else 0)
+
+    micro_parser = argparse.ArgumentParser(add_help=False)
+    bench_micro.add_arguments(micro_parser)
+    api_parser = argparse.ArgumentParser(add_help=False)
+    bench_api.add_arguments(api_parser)
+    micro_args, micro_rest = micro_parser.parse_known_args(rest)
+    api_args, api_rest = api_parser.parse_known_args(rest)
+    unknown = set(micro_rest) & set(api_rest)
+    if unknown:
+        parser.error(f"unrecognized arguments: {' '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {}
+    if args.only in (None, "micro"):
+        results["micro"] = bench_micro.run(micro_args)
+    if args.only in (None, "api"):
+        results["api"] = bench_api.run(api_args)
+
+    out = args.out
+    if out is None:
+        meta = run_metadata()
+        out = os.path.join(RESULTS_DIR, f"{meta['commit'] or 'unknown'}{'-dirty' if meta['dirty'] else ''}.json")
+    write_results(out, results)
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
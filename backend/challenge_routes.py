@@ -0,0 +1,181 @@
+"""
+challenge_routes.py
+
+Flask Blueprint for shared and daily challenges (see challenges.py):
+ - /challenges (POST) => a new challenge {challengeId, ...}
+ - /challenges/daily (GET) => today's challenge (UTC), optionally ?mapName= (default World)
+ - /challenges/<challengeId> (GET) => settings + player count
+ - /challenges/<challengeId>/play (POST) => a gameId with the challenge's rounds (once per
+   player name); then /submit_guess and /finish_game as for any /create_game game
+ - /challenges/<challengeId>/results (POST) => posts a finished play to the leaderboard
+ - /challenges/<challengeId>/leaderboard (GET) => top ?limit= entries (cached)
+ - /challenges/<challengeId>/rank (GET) => ?player='s best score and rank (cached)
+
+Each route is a thin wrapper over a framework-neutral function returning (payload, status),
+like custom_game_routes.
+"""
+
+import logging
+
+from flask import Blueprint, request, jsonify
+
+from challenges import CHALLENGES, RebuildLimitError, today, validate_player
+from game_logic import GAMES, store_new_game
+from seeded_rounds import parse_round_count
+from world_index import WORLD_MAP_NAME
+
+challenge_bp = Blueprint("challenge_bp", __name__)
+
+MAX_LEADERBOARD_LIMIT = 1000
+
+
+def _challenge(challenge_id):
+    """(challenge, None) or (None, (error payload, status))."""
+    try:
+        return CHALLENGES.get(challenge_id), None
+    except FileNotFoundError as e:
+        return None, ({"error": str(e)}, 404)
+    except ValueError as e:
+        return None, ({"error": str(e)}, 400)
+    except RebuildLimitError as e:
+        return None, ({"error": str(e)}, 429)
+
+
+@challenge_bp.route('/challenges', methods=['POST'])
+def create_challenge():
+    """
+    POST JSON: { "mapName": "Austria.geojson", "roundCount": 5, "timeLimit": 60, "seed": 123 (optional) }
+    Returns the challenge settings incl. "challengeId" (share it; it encodes the rounds).
+    "seed" only picks the challenge key (see challenges.round_seed), not a /create_game seed.
+    """
+    payload, status = create_challenge_payload(request.get_json(force=True))
+    return jsonify(payload), status
+
+
+def create_challenge_payload(data):
+    try:
+        map_name = str(data.get("mapName", "")).strip()
+        round_count = parse_round_count(data.get("roundCount", 5))
+        time_limit = int(data.get("timeLimit", 60))
+        seed = data.get("seed")
+        seed = int(seed) if seed is not None else None
+        challenge = CHALLENGES.create(map_name, round_count, time_limit, seed)
+    except (FileNotFoundError, TypeError, ValueError) as e:
+        return {"error": str(e)}, 400
+    logging.debug("[create_challenge] %s on %s", challenge.id, map_name)
+    return challenge.info(), 201
+
+
+@challenge_bp.route('/challenges/daily', methods=['GET'])
+def daily_challenge():
+    """Today's (UTC) challenge for ?mapName= (default World); the same for every player and worker."""
+    map_name = request.args.get("mapName", WORLD_MAP_NAME)
+    day = today()
+    try:
+        challenge = CHALLENGES.daily(day, map_name)
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    info = challenge.info()
+    info["date"] = day.isoformat()
+    return jsonify(info), 200
+
+
+@challenge_bp.route('/challenges/<challenge_id>', methods=['GET'])
+def get_challenge(challenge_id):
+    challenge, error = _challenge(challenge_id)
+    if error:
+        return jsonify(error[0]), error[1]
+    return jsonify(challenge.info()), 200
+
+
+@challenge_bp.route('/challenges/<challenge_id>/play', methods=['POST'])
+def play_challenge(challenge_id):
+    """
+    POST JSON: { "playerName": "otter" }
+    Returns { "gameId", "challengeId", "roundCount", "timeLimit" }. Play it like any
+    /create_game game (except that each round takes one guess), then POST its gameId to
+    /challenges/<challengeId>/results. 409 if the player name already started a play.
+    """
+    payload, status = start_challenge_play(challenge_id, request.get_json(force=True))
+    return jsonify(payload), status
+
+
+def start_challenge_play(challenge_id, data):
+    challenge, error = _challenge(challenge_id)
+    if error:
+        return error
+    try:
+        player = validate_player(data.get("playerName"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    # The challenge's rounds were generated once; every play just copies them, without a seed
+    # (see challenges.round_seed). Ranked: a round's guess response reveals its answer, so only
+    # the first guess per round counts.
+    game_id = store_new_game(challenge.geojson_path, challenge.time_limit, challenge.rounds, ranked=True)
+    try:
+        challenge.start_play(game_id, player)
+    except ValueError as e:
+        GAMES.pop(game_id)
+        return {"error": str(e)}, 409
+    logging.debug("[play_challenge] %s plays %s as gameId=%s", player, challenge.id, game_id)
+    return {
+        "gameId": game_id,
+        "challengeId": challenge.id,
+        "roundCount": challenge.round_count,
+        "timeLimit": challenge.time_limit
+    }, 201
+
+
+@challenge_bp.route('/challenges/<challenge_id>/results', methods=['POST'])
+def post_challenge_result(challenge_id):
+    """
+    POST JSON: { "gameId": "<uuid>" } for a play started via /play and ended with /finish_game.
+    Returns the player's { "player", "score", "rank", "players" } (best score counts).
+    """
+    payload, status = submit_challenge_result(challenge_id, request.get_json(force=True).get("gameId"))
+    return jsonify(payload), status
+
+
+def submit_challenge_result(challenge_id, game_id):
+    challenge, error = _challenge(challenge_id)
+    if error:
+        return error
+    game = GAMES.get(game_id)
+    if game is None or not game.finished:
+        return {"error": "Finish the game with /finish_game first."}, 400
+    player = challenge.take_play(game_id)
+    if player is None:
+        return {"error": "Not a play of this challenge, or its result was already posted."}, 400
+    return challenge.leaderboard.submit(player, game.total_score), 200
+
+
+@challenge_bp.route('/challenges/<challenge_id>/leaderboard', methods=['GET'])
+def challenge_leaderboard(challenge_id):
+    """GET ?limit=10 -> { "challengeId", "players", "entries": [{rank, player, score}, ...] }"""
+    challenge, error = _challenge(challenge_id)
+    if error:
+        return jsonify(error[0]), error[1]
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), MAX_LEADERBOARD_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer."}), 400
+    return jsonify({
+        "challengeId": challenge.id,
+        "players": len(challenge.leaderboard),
+        "entries": challenge.leaderboard.top(limit)
+    }), 200
+
+
+@challenge_bp.route('/challenges/<challenge_id>/rank', methods=['GET'])
+def challenge_rank(challenge_id):
+    """GET ?player=otter -> { "player", "score", "rank", "players" }, 404 without a score."""
+    challenge, error = _challenge(challenge_id)
+    if error:
+        return jsonify(error[0]), error[1]
+    rank = challenge.leaderboard.rank(request.args.get("player", "").strip())
+    if rank is None:
+        return jsonify({"error": "No score for this player."}), 404
+    return jsonify(rank), 200
@@ -0,0 +1,343 @@
+"""
+challenges.py
+
+Shared challenges: one precomputed set of rounds played by any number of players, ranked
+on a leaderboard (served by challenge_routes.py):
+ - Challenge -> map, key, round count and time limit, its rounds (generated once, see
+   seeded_rounds) and its Leaderboard
+ - Leaderboard -> best score per player in a bisect-maintained sorted array: O(log n) search
+   for inserts and rank lookups, cached top-K and "my rank" responses
+ - ChallengeRegistry -> challenges by id; CHALLENGES is the process-wide one. create() and
+   daily() build freely; get() rebuilds an id it hasn't seen (a shared link on another worker,
+   or after a restart) under a per-minute budget, so made-up ids can't flood the registry
+ - challenge_id(...) / parse_challenge_id(id) -> the id encodes the challenge's settings, so
+   any worker can rebuild the same rounds from a shared link
+ - round_seed(key) -> the seed a challenge's rounds are generated from: its key keyed with
+   OTTERGUESSR_CHALLENGE_SECRET, so neither ids nor responses reveal it (with the seed,
+   /replay would hand out every answer)
+ - daily_challenge_id(day, map_file) -> the challenge of a UTC day, keyed from the date
+
+Plays are ordinary /create_game games (scored by game_logic.compute_score); a finished play
+is posted to its challenge's leaderboard. A player name gets one play per challenge: a guess
+reveals the round's answer, so a second play could only replay the first one's answers. Leaderboards live in the memory of one process,
+like multiplayer rooms: run one worker, or route a challenge's players to the same one.
+
+Config (env):
+  OTTERGUESSR_MAX_CHALLENGES  -> challenges kept per process (default 1000); the least recently
+                                 used one without players is dropped first
+  OTTERGUESSR_CHALLENGE_REBUILDS_PER_MINUTE -> get() builds of unseen ids per minute (default 30)
+  OTTERGUESSR_CHALLENGE_SECRET -> secret for round_seed (default: random per process). Set the
+                                  same value on every worker so they build the same rounds
+"""
+
+import base64
+import bisect
+import collections
+import datetime
+import hashlib
+import hmac
+import itertools
+import logging
+import os
+import secrets
+import threading
+import time
+
+from geometry_registry import MAPS_DIR
+from metrics import CallbackMetric
+from seeded_rounds import ALGO_VERSION, MAX_SEED, generate_rounds, new_seed, parse_round_count
+from world_index import is_world, load_map
+
+MAX_CHALLENGES = int(os.environ.get("OTTERGUESSR_MAX_CHALLENGES", 1000))
+REBUILDS_PER_MINUTE = int(os.environ.get("OTTERGUESSR_CHALLENGE_REBUILDS_PER_MINUTE", 30))
+CHALLENGE_SECRET = (os.environ.get("OTTERGUESSR_CHALLENGE_SECRET") or secrets.token_hex(32)).encode("utf-8")
+# Top-K responses are served from one cached list of this many entries
+TOP_CACHE_K = 100
+# Started-but-unreported plays remembered per challenge
+MAX_PENDING_PLAYS = 100000
+MAX_PLAYER_NAME = 32
+DAILY_ROUND_COUNT = 5
+DAILY_TIME_LIMIT = 60
+
+
+class Leaderboard:
+    """
+    Best score per player, best first; ties go to whoever reached the score first.
+    '_keys' stays sorted as (-score, seq, player), so bisect finds a player's rank directly.
+    'version' changes with every accepted score, '_top_version' only when the top
+    TOP_CACHE_K changed, so the cached top list survives inserts further down.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._best = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.version = 0
+        self._top_version = 0
+        # (top_version, [entry dicts of the top TOP_CACHE_K])
+        self._top_cache = (-1, [])
+        # player -> rank payload, valid while _rank_cache_version == version
+        self._rank_cache = {}
+        self._rank_cache_version = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def submit(self, player, score):
+        """Records a score; keeps the player's best. Returns the player's rank payload."""
+        with self._lock:
+            old = self._best.get(player)
+            if old is None or -score < old[0]:
+                key = (-score, next(self._seq), player)
+                changed_top = False
+                if old is not None:
+                    index = bisect.bisect_left(self._keys, old)
+                    del self._keys[index]
+                    changed_top = index < TOP_CACHE_K
+                index = bisect.bisect_left(self._keys, key)
+                self._keys.insert(index, key)
+                self._best[player] = key
+                self.version += 1
+                if changed_top or index < TOP_CACHE_K:
+                    self._top_version += 1
+            return self._rank_locked(player)
+
+    def top(self, k=10):
+        """The k best entries as [{"rank", "player", "score"}]; k <= TOP_CACHE_K is served from cache."""
+        with self._lock:
+            if k > TOP_CACHE_K:
+                return self._entries(0, k)
+            version, cached = self._top_cache
+            if version != self._top_version:
+                cached = self._entries(0, TOP_CACHE_K)
+                self._top_cache = (self._top_version, cached)
+            return cached[:k]
+
+    def rank(self, player):
+        """{"player", "score", "rank", "players"} for a player, or None if they have no score."""
+        with self._lock:
+            return self._rank_locked(player)
+
+    def _rank_locked(self, player):
+        if self._rank_cache_version != self.version:
+            self._rank_cache = {}
+            self._rank_cache_version = self.version
+        cached = self._rank_cache.get(player)
+        if cached is not None:
+            return cached
+        key = self._best.get(player)
+        if key is None:
+            return None
+        payload = {
+            "player": player,
+            "score": -key[0],
+            "rank": bisect.bisect_left(self._keys, key) + 1,
+            "players": len(self._keys)
+        }
+        self._rank_cache[player] = payload
+        return payload
+
+    def _entries(self, start, stop):
+        return [
+            {"rank": start + i + 1, "player": player, "score": -neg_score}
+            for i, (neg_score, _seq, player) in enumerate(self._keys[start:stop])
+        ]
+
+
+def challenge_id(map_file, key, round_count, time_limit, algo_version=ALGO_VERSION):
+    """URL-safe id that encodes the settings (see parse_challenge_id)."""
+    raw = f"{map_file}|{key}|{round_count}|{time_limit}|{algo_version}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def parse_challenge_id(cid):
+    """(map_file, key, round_count, time_limit, algo_version) of an id. Raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cid + "=" * (-len(cid) % 4)).decode("utf-8")
+        map_file, key, round_count, time_limit, algo_version = raw.split("|")
+        return map_file, int(key), int(round_count), int(time_limit), int(algo_version)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid challenge id: {cid}")
+
+
+def daily_challenge_id(day, map_file):
+    """The challenge of a UTC date: same map, rounds and leaderboard for everyone that day."""
+    digest = hashlib.sha256(f"daily|{day.isoformat()}|{map_file}".encode("utf-8")).hexdigest()
+    key = int(digest[:16], 16) & MAX_SEED
+    return challenge_id(map_file, key, DAILY_ROUND_COUNT, DAILY_TIME_LIMIT)
+
+
+def round_seed(key):
+    """The seed of a challenge key's rounds; unknown without CHALLENGE_SECRET."""
+    digest = hmac.new(CHALLENGE_SECRET, f"challenge|{key}".encode("utf-8"), hashlib.sha256).hexdigest()
+    return int(digest[:16], 16) & MAX_SEED
+
+
+def today():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def validate_player(name):
+    name = str(name or "").strip()
+    if not 1 <= len(name) <= MAX_PLAYER_NAME:
+        raise ValueError(f"playerName must be 1 to {MAX_PLAYER_NAME} characters.")
+    return name
+
+
+class RebuildLimitError(RuntimeError):
+    """get() was asked for more unseen challenge ids than the per-minute budget allows."""
+
+
+class Challenge:
+    """One challenge: settings, its rounds (lat, lng, panoLat, panoLng, panoId) and leaderboard."""
+
+    def __init__(self, cid, map_file, geojson_path, key, round_count, time_limit, algo_version, rounds):
+        self.id = cid
+        self.map_file = map_file
+        self.geojson_path = geojson_path
+        self.key = key
+        self.round_count = round_count
+        self.time_limit = time_limit
+        self.algo_version = algo_version
+        self.rounds = rounds
+        self.leaderboard = Leaderboard()
+        self.created = time.time()
+        # gameId -> player, until the play's result is posted
+        self._plays = collections.OrderedDict()
+        # Every player with a play in progress or a posted result
+        self._players = set()
+        self._plays_lock = threading.Lock()
+
+    def start_play(self, game_id, player):
+        """Registers a play. Raises ValueError if the player already started one."""
+        with self._plays_lock:
+            if player in self._players:
+                raise ValueError(f"{player} already played this challenge.")
+            self._players.add(player)
+            self._plays[game_id] = player
+            while len(self._plays) > MAX_PENDING_PLAYS:
+                # An abandoned play: its player may start over
+                _old_game, old_player = self._plays.popitem(last=False)
+                self._players.discard(old_player)
+
+    def take_play(self, game_id):
+        """The player of a started play (once; None if unknown or already reported)."""
+        with self._plays_lock:
+            return self._plays.pop(game_id, None)
+
+    def is_empty(self):
+        """No scores and no plays in progress: nothing is lost if it's dropped."""
+        with self._plays_lock:
+            return not self._players
+
+    def info(self):
+        return {
+            "challengeId": self.id,
+            "mapName": self.map_file,
+            "roundCount": self.round_count,
+            "timeLimit": self.time_limit,
+            "algoVersion": self.algo_version,
+            "players": len(self.leaderboard)
+        }
+
+
+class ChallengeRegistry:
+    """
+    Challenges by id. create() and daily() register a challenge; get() also rebuilds one from
+    its id on first use in this process, at most rebuilds_per_minute times a minute.
+    """
+
+    def __init__(self, max_challenges=MAX_CHALLENGES, rebuilds_per_minute=REBUILDS_PER_MINUTE):
+        self.max_challenges = max_challenges
+        self.rebuilds_per_minute = rebuilds_per_minute
+        self._challenges = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # (start of the current minute, rebuilds in it)
+        self._rebuild_window = (0.0, 0)
+
+    def create(self, map_file, round_count, time_limit, key=None, algo_version=ALGO_VERSION):
+        """Registers a challenge (a fresh key unless one is given) and returns it."""
+        key = new_seed() if key is None else key
+        return self._get(challenge_id(map_file, key, round_count, time_limit, algo_version), limited=False)
+
+    def daily(self, day, map_file):
+        """The daily challenge of a map (see daily_challenge_id)."""
+        return self._get(daily_challenge_id(day, map_file), limited=False)
+
+    def get(self, cid):
+        """
+        The challenge for an id, generating its rounds if this process hasn't seen it yet.
+        Raises ValueError for a malformed id, FileNotFoundError for an unknown map,
+        RebuildLimitError if this minute's rebuilds are used up.
+        """
+        return self._get(cid, limited=True)
+
+    def _get(self, cid, limited):
+        with self._lock:
+            challenge = self._challenges.get(cid)
+            if challenge is not None:
+                self._challenges.move_to_end(cid)
+                return challenge
+        if limited:
+            self._take_rebuild(cid)
+        challenge = self._build(cid)
+        with self._lock:
+            # Another request may have built it meanwhile; keep the first one (and its scores)
+            existing = self._challenges.get(cid)
+            if existing is not None:
+                return existing
+            self._challenges[cid] = challenge
+            while len(self._challenges) > self.max_challenges:
+                self._evict_locked()
+        return challenge
+
+    def _take_rebuild(self, cid):
+        now = time.monotonic()
+        with self._lock:
+            start, count = self._rebuild_window
+            if now - start >= 60:
+                start, count = now, 0
+            if count >= self.rebuilds_per_minute:
+                logging.warning("[challenges] Rebuild budget used up, refusing %s", cid)
+                raise RebuildLimitError("Too many unknown challenges requested, try again in a minute.")
+            self._rebuild_window = (start, count + 1)
+
+    def _evict_locked(self):
+        """Drops the least recently used challenge without players, else the least recently used one."""
+        for cid, challenge in self._challenges.items():
+            if challenge.is_empty():
+                del self._challenges[cid]
+                return
+        _old_id, old = self._challenges.popitem(last=False)
+        logging.warning("[challenges] Dropping challenge %s with %s players", old.id, len(old.leaderboard))
+
+    @staticmethod
+    def _build(cid):
+        map_file, key, round_count, time_limit, algo_version = parse_challenge_id(cid)
+        parse_round_count(round_count)
+        if time_limit <= 0:
+            raise ValueError("timeLimit must be positive.")
+        geojson_path = os.path.join(MAPS_DIR, map_file)
+        if os.path.basename(map_file) != map_file or not (os.path.isfile(geojson_path) or is_world(map_file)):
+            raise FileNotFoundError(f"Map file not found: {map_file}")
+        rounds = list(generate_rounds(load_map(geojson_path), round_seed(key), round_count, algo_version))
+        logging.info("[challenges] Built challenge %s (%s, %s rounds)", cid, map_file, round_count)
+        return Challenge(cid, map_file, geojson_path, key, round_count, time_limit, algo_version, rounds)
+
+    def __len__(self):
+        return len(self._challenges)
+
+    def stats(self):
+        with self._lock:
+            challenges = list(self._challenges.values())
+        return {
+            "challenges": len(challenges),
+            "players": sum(len(c.leaderboard) for c in challenges)
+        }
+
+
+CHALLENGES = ChallengeRegistry()
+
+CallbackMetric("otterguessr_challenges", "Challenges held by this process.", "gauge", (),
+               lambda: [((), len(CHALLENGES))])
@@ -7,9 +7,13 @@ Flask Blueprint for singleplayer sessions with unique session URLs:
  - /submit_guess (POST)
  - /end_game (POST)
 
-We store data in 'active_games' dict, keyed by sessionId.
+We store data in the 'active_games' GameStore, keyed by sessionId (idle sessions expire,
+optionally persisted to SQLite via OTTERGUESSR_DB_PATH).
 Session-based route: otterguessr.at/<sessionId>/<roundNumber> (for client side).
 
+Each route is a thin wrapper over a framework-neutral function returning (payload, status)
+(start_session, join_session, submit_session_guess, end_session), shared with asgi.py.
+
 Debug statements included.
 """
 
@@ -20,39 +24,23 @@ import json
 import random
 from flask import Blueprint, request, jsonify
 from custom_mode_logic import (
-    parse_geojson_and_get_polygon,
-    get_random_location_in_polygon,
-    get_nearest_streetview,
     compute_distance_km,
     compute_score
 )
+from game_models import SessionGame, to_none
+from game_persistence import get_backend
+from game_store import GameStore
+from seeded_rounds import parse_round_count, parse_seed, take_rounds
+from world_index import country_result, is_world, load_map
 
 custom_mode_bp = Blueprint("custom_mode_bp", __name__)
 
 # Adjust to your 'assets/maps' location
 MAPS_DIR = os.path.join(os.path.dirname(__file__), 'assets', 'maps')
 
-# In-memory store: sessionId -> gameData
-# gameData = {
-#   "mode": str,
-#   "mapFile": str,
-#   "timeLimit": int,
-#   "roundCount": int,
-#   "rounds": [
-#       {
-#         "lat": float,
-#         "lng": float,
-#         "streetLat": float,
-#         "streetLng": float,
-#         "guessedLat": float or None,
-#         "guessedLng": float or None,
-#         "distanceKm": float or None,
-#         "points": int or None
-#       }, ...
-#   ],
-#   "totalPoints": int
-# }
-active_games = {}
+# In-memory store: sessionId -> game_models.SessionGame
+# (mode, mapFile, timeLimit, per-round lat/lng/streetLat/streetLng/guess/distance/points arrays, totalPoints)
+active_games = GameStore("sessions", model=SessionGame, backend=get_backend())
 
 @custom_mode_bp.route('/start_game', methods=['POST'])
 def start_game():
@@ -72,63 +60,71 @@ def start_game():
       "timeLimit": 60,
       "mode": "Classic"
     }
+    (+ "seed" and "algoVersion" for a seeded session: send "seed" to replay a shared one,
+     or "seeded": true for a new seed)
 
     We build session data, store in active_games[sessionId].
     """
-    data = request.get_json(force=True)
+    payload, status = start_session(request.get_json(force=True))
+    return jsonify(payload), status
+
+def start_session(data):
+    """
+    /start_game body, framework-neutral (also served by asgi.py). Returns (payload, status).
+    """
     map_file = data.get('mapFile', '')
     time_limit = data.get('timeLimit', 60)
-    round_count = data.get('roundCount', 5)
     mode = data.get('mode', 'Custom')
+    try:
+        round_count = parse_round_count(data.get('roundCount', 5))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    logging.debug("[start_game] Received: mapFile=%s, timeLimit=%s, roundCount=%s, mode=%s", map_file, time_limit, round_count, mode)
 
-    logging.debug(f"[start_game] Received: mapFile={map_file}, timeLimit={time_limit}, roundCount={round_count}, mode={mode}")
+    try:
+        seed, algo_version = parse_seed(data)
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
     # Build absolute path
     abs_path = os.path.join(MAPS_DIR, map_file)
     try:
-        polygon = parse_geojson_and_get_polygon(abs_path)
+        map_geom = load_map(abs_path)
     except Exception as e:
-        logging.error(f"[start_game] parse error: {str(e)}")
-        return jsonify({"error": f"Could not parse .geojson: {str(e)}"}), 400
-
-    # Generate random rounds
-    rounds_data = []
-    for i in range(round_count):
-        lat, lng = get_random_location_in_polygon(polygon)
-        if lat is None or lng is None:
-            logging.error("[start_game] Could not generate random location.")
-            return jsonify({"error": "Failed to generate random location."}), 500
-
-        sLat, sLng = get_nearest_streetview(lat, lng)
-        rounds_data.append({
-            "lat": lat,
-            "lng": lng,
-            "streetLat": sLat,
-            "streetLng": sLng,
-            "guessedLat": None,
-            "guessedLng": None,
-            "distanceKm": None,
-            "points": None
-        })
-
-    # Generate unique sessionId, store in dictionary
-    session_id = _generate_session_id()
-    active_games[session_id] = {
-        "mode": mode,
-        "mapFile": map_file,
-        "timeLimit": time_limit,
-        "roundCount": round_count,
-        "rounds": rounds_data,
-        "totalPoints": 0
-    }
+        logging.error("[start_game] parse error: %s", e)
+        return {"error": f"Could not parse .geojson: {str(e)}"}, 400
 
-    logging.debug(f"[start_game] Created sessionId={session_id}")
-    return jsonify({
+    # Pop pre-resolved random rounds from the map's pool (see round_pool), or the seed's rounds
+    pooled = take_rounds(map_geom, round_count, seed, algo_version)
+    return store_new_session(mode, map_file, time_limit, pooled, seed, algo_version), 200
+
+def store_new_session(mode, map_file, time_limit, pooled, seed=None, algo_version=None):
+    """
+    Stores a session for pooled rounds (lat, lng, sLat, sLng, panoId) under a new sessionId.
+    Returns the /start_game response payload.
+    """
+    session_id = _generate_session_id()
+    active_games.put(session_id, SessionGame(
+        mode,
+        map_file,
+        time_limit,
+        ((lat, lng, sLat, sLng) for lat, lng, sLat, sLng, _pano_id in pooled),
+        seed,
+        algo_version
+    ))
+
+    logging.debug("[start_game] Created sessionId=%s", session_id)
+    payload = {
         "sessionId": session_id,
         "timeLimit": time_limit,
-        "roundCount": round_count,
+        "roundCount": len(pooled),
         "mode": mode
-    }), 200
+    }
+    if seed is not None:
+        payload["seed"] = seed
+        payload["algoVersion"] = algo_version
+    return payload
 
 @custom_mode_bp.route('/join_game/<sessionId>/<int:roundNumber>', methods=['GET'])
 def join_game(sessionId, roundNumber):
@@ -138,33 +134,37 @@ def join_game(sessionId, roundNumber):
     
     Returns data about that round if it exists, or an error if not found.
     """
-    logging.debug(f"[join_game] sessionId={sessionId}, roundNumber={roundNumber}")
+    payload, status = join_session(sessionId, roundNumber)
+    return jsonify(payload), status
+
+def join_session(session_id, round_number):
+    """/join_game body, framework-neutral. Returns (payload, status)."""
+    logging.debug("[join_game] sessionId=%s, roundNumber=%s", session_id, round_number)
 
-    game_data = active_games.get(sessionId)
+    game_data = active_games.get(session_id)
     if not game_data:
-        return jsonify({"error": "Session not found."}), 404
+        return {"error": "Session not found."}, 404
 
-    if roundNumber < 1 or roundNumber > len(game_data['rounds']):
-        return jsonify({"error": "Round out of range."}), 400
+    if round_number < 1 or round_number > game_data.round_count:
+        return {"error": "Round out of range."}, 400
 
     # Return info about the round
-    round_index = roundNumber - 1
-    r = game_data['rounds'][round_index]
-
-    return jsonify({
-        "mode": game_data['mode'],
-        "mapFile": game_data['mapFile'],
-        "timeLimit": game_data['timeLimit'],
-        "roundCount": game_data['roundCount'],
-        "roundNumber": roundNumber,
+    round_index = round_number - 1
+
+    return {
+        "mode": game_data.mode,
+        "mapFile": game_data.map_file,
+        "timeLimit": game_data.time_limit,
+        "roundCount": game_data.round_count,
+        "roundNumber": round_number,
         "roundInfo": {
-            "streetLat": r['streetLat'],
-            "streetLng": r['streetLng'],
-            "distanceKm": r['distanceKm'],
-            "points": r['points']
+            "streetLat": game_data.street_lats[round_index],
+            "streetLng": game_data.street_lngs[round_index],
+            "distanceKm": to_none(game_data.distances[round_index]),
+            "points": to_none(game_data.points[round_index])
         },
-        "totalPoints": game_data['totalPoints']
-    }), 200
+        "totalPoints": game_data.total_points
+    }, 200
 
 @custom_mode_bp.route('/submit_guess', methods=['POST'])
 def submit_guess():
@@ -179,51 +179,54 @@ def submit_guess():
 
     We'll update that round's distanceKm & points, totalPoints, and return result.
     """
-    data = request.get_json(force=True)
+    payload, status = submit_session_guess(request.get_json(force=True))
+    return jsonify(payload), status
+
+def submit_session_guess(data):
+    """/submit_guess body for sessions, framework-neutral. Returns (payload, status)."""
     session_id = data.get('sessionId')
     round_number = data.get('roundNumber')
     guessed_lat = data.get('guessedLat')
     guessed_lng = data.get('guessedLng')
 
-    logging.debug(f"[submit_guess] sessionId={session_id}, roundNumber={round_number}, guessedLat={guessed_lat}, guessedLng={guessed_lng}")
-
-    game_data = active_games.get(session_id)
-    if not game_data:
-        return jsonify({"error": "Session not found."}), 404
+    logging.debug("[submit_guess] sessionId=%s, roundNumber=%s, guessedLat=%s, guessedLng=%s", session_id, round_number, guessed_lat, guessed_lng)
 
-    if round_number < 1 or round_number > len(game_data['rounds']):
-        return jsonify({"error": "Round out of range."}), 400
+    # Hold the session's shard lock so a double submit can't score a round twice
+    with active_games.locked(session_id) as game_data:
+        if not game_data:
+            return {"error": "Session not found."}, 404
 
-    r_index = round_number - 1
-    round_data = game_data['rounds'][r_index]
+        if round_number < 1 or round_number > game_data.round_count:
+            return {"error": "Round out of range."}, 400
 
-    if round_data['points'] is not None:
-        logging.debug("[submit_guess] This round was already guessed.")
-        return jsonify({"error": "Already guessed this round."}), 400
+        r_index = round_number - 1
 
-    actual_lat = round_data['streetLat']
-    actual_lng = round_data['streetLng']
+        if game_data.is_guessed(r_index):
+            logging.debug("[submit_guess] This round was already guessed.")
+            return {"error": "Already guessed this round."}, 400
 
-    distance_km = compute_distance_km(guessed_lat, guessed_lng, actual_lat, actual_lng)
-    points = compute_score(distance_km)
+        actual_lat = game_data.street_lats[r_index]
+        actual_lng = game_data.street_lngs[r_index]
 
-    round_data['guessedLat'] = guessed_lat
-    round_data['guessedLng'] = guessed_lng
-    round_data['distanceKm'] = distance_km
-    round_data['points'] = points
+        distance_km = compute_distance_km(guessed_lat, guessed_lng, actual_lat, actual_lng)
+        points = compute_score(distance_km)
 
-    game_data['totalPoints'] += points
-    logging.debug(f"[submit_guess] distance={distance_km:.2f}, points={points}, totalPoints={game_data['totalPoints']}")
+        game_data.set_guess(r_index, guessed_lat, guessed_lng, distance_km, points)
+        logging.debug("[submit_guess] distance=%.2f, points=%s, totalPoints=%s", distance_km, points, game_data.total_points)
 
-    return jsonify({
-        "actualLat": actual_lat,
-        "actualLng": actual_lng,
-        "guessedLat": guessed_lat,
-        "guessedLng": guessed_lng,
-        "distanceKm": distance_km,
-        "points": points,
-        "totalPointsSoFar": game_data['totalPoints']
-    }), 200
+        result = {
+            "actualLat": actual_lat,
+            "actualLng": actual_lng,
+            "guessedLat": guessed_lat,
+            "guessedLng": guessed_lng,
+            "distanceKm": distance_km,
+            "points": points,
+            "totalPointsSoFar": game_data.total_points
+        }
+        if is_world(game_data.map_file):
+            result["guessCountry"] = country_result(guessed_lat, guessed_lng)
+            result["correctCountry"] = country_result(actual_lat, actual_lng)
+        return result, 200
 
 @custom_mode_bp.route('/end_game', methods=['POST'])
 def end_game():
@@ -235,50 +238,22 @@ def end_game():
 
     We'll remove the session from active_games, compile final scoreboard, return JSON.
     """
-    data = request.get_json(force=True)
-    session_id = data.get('sessionId')
-    logging.debug(f"[end_game] sessionId={session_id}")
+    payload, status = end_session(request.get_json(force=True).get('sessionId'))
+    return jsonify(payload), status
+
+def end_session(session_id):
+    """/end_game body, framework-neutral. Returns (payload, status)."""
+    logging.debug("[end_game] sessionId=%s", session_id)
 
     game_data = active_games.pop(session_id, None)
     if not game_data:
-        return jsonify({"error": "Session not found or already ended."}), 404
-
-    # Build scoreboard
-    scoreboard = []
-    for r in game_data['rounds']:
-        scoreboard.append({
-            "actualLat": r['streetLat'],
-            "actualLng": r['streetLng'],
-            "guessedLat": r['guessedLat'],
-            "guessedLng": r['guessedLng'],
-            "distanceKm": r['distanceKm'],
-            "points": r['points']
-        })
-
-    total_points = game_data['totalPoints']
-
-    # matchJson for replay
-    match_json = {
-        "mode": game_data['mode'],
-        "mapFile": game_data['mapFile'],
-        "timeLimit": game_data['timeLimit'],
-        "roundCount": game_data['roundCount'],
-        "rounds": [
-            {
-                "lat": rd['lat'],
-                "lng": rd['lng'],
-                "streetLat": rd['streetLat'],
-                "streetLng": rd['streetLng']
-            } for rd in game_data['rounds']
-        ]
-    }
+        return {"error": "Session not found or already ended."}, 404
+
+    # Scoreboard + matchJson for replay
+    results = game_data.end_results()
 
     logging.debug("[end_game] Completed scoreboard return.")
-    return jsonify({
-        "rounds": scoreboard,
-        "totalPoints": total_points,
-        "matchJson": match_json
-    }), 200
+    return results, 200
 
 def _generate_session_id():
     """
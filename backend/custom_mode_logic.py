@@ -1,10 +1,11 @@
 """
 custom_mode_logic.py
 
-- parse_geojson_and_get_polygon: Reads a .geojson into a shapely polygon.
-- get_random_location_in_polygon: Chooses random lat/lng inside the polygon.
-- get_nearest_streetview: Mock or partial example of using Google Street View.
-- compute_distance_km, compute_score: Haversine & GeoGuessr-like scoring.
+- parse_geojson_and_get_polygon: Reads a .geojson into a shapely polygon (cached).
+- get_random_location_in_polygon: Chooses a uniform random lat/lng inside a map.
+- get_random_locations_in_polygon: Same, for a whole game at once (NumPy arrays).
+- get_nearest_streetview: Single Street View lookup through streetview_resolver.
+- compute_distance_km, compute_score: Haversine & GeoGuessr-like scoring (thin wrappers over scoring.py).
 
 Dependencies:
   pip install shapely
@@ -12,97 +13,65 @@ Dependencies:
 Debug statements with logging are included.
 """
 
-import json
-import math
-import random
 import logging
-import os
-from shapely.geometry import shape, Point
+
+from geometry_registry import get_map_geometry
+from point_sampler import random_point, random_points
+from streetview_resolver import get_resolver
+import scoring
 
 def parse_geojson_and_get_polygon(geojson_path):
     """
-    Reads a .geojson file from an absolute path, returns shapely polygon.
+    Returns the shapely polygon for a .geojson file (all features merged).
+    Parsed once per process and shared with game_logic via geometry_registry.
     
     - geojson_path: absolute path to the .geojson file
     """
-    logging.debug(f"[parse_geojson_and_get_polygon] Reading file: {geojson_path}")
-    with open(geojson_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    if data.get('type') == 'FeatureCollection':
-        polygon_geom = shape(data['features'][0]['geometry'])
-    elif data.get('type') == 'Feature':
-        polygon_geom = shape(data['geometry'])
-    else:
-        polygon_geom = shape(data)
-
+    logging.debug("[parse_geojson_and_get_polygon] Reading file: %s", geojson_path)
+    polygon_geom = get_map_geometry(geojson_path).geometry
     logging.debug("[parse_geojson_and_get_polygon] Polygon parsed successfully.")
     return polygon_geom
 
-def get_random_location_in_polygon(polygon):
+def get_random_location_in_polygon(map_geom):
     """
-    Returns (lat, lng) inside 'polygon' or (None, None) if not found.
-    Rejection sampling up to 10k tries.
+    Returns a uniformly random (lat, lng) inside a geometry_registry.MapGeometry.
+    Uses the precomputed triangulation from point_sampler, so it always succeeds.
     """
-    minx, miny, maxx, maxy = polygon.bounds
-    logging.debug(f"[get_random_location_in_polygon] polygon.bounds = {polygon.bounds}")
-
-    for _ in range(10000):
-        randx = random.uniform(minx, maxx)
-        randy = random.uniform(miny, maxy)
-        candidate = Point(randx, randy)
-        if polygon.contains(candidate):
-            # shapely uses x=lng, y=lat
-            lat = randy
-            lng = randx
-            logging.debug(f"[get_random_location_in_polygon] Found lat={lat}, lng={lng}")
-            return (lat, lng)
+    lat, lng = random_point(map_geom)
+    logging.debug("[get_random_location_in_polygon] Found lat=%s, lng=%s", lat, lng)
+    return (lat, lng)
 
-    logging.warning("[get_random_location_in_polygon] Could not find valid point after many attempts.")
-    return (None, None)
+def get_random_locations_in_polygon(map_geom, count):
+    """
+    Returns 'count' uniform random locations inside a MapGeometry as (lats, lngs) NumPy arrays,
+    generated in one vectorized call.
+    """
+    lats, lngs = random_points(map_geom, count)
+    logging.debug("[get_random_locations_in_polygon] Generated %s locations in %s", count, map_geom.name)
+    return lats, lngs
 
 def get_nearest_streetview(lat, lng):
     """
-    Mock function. For real usage, you'd call Google Street View / Street View Publish APIs.
-    Here, we simply return the same lat/lng.
+    Nearest panorama location via the shared streetview_resolver (mock backend by default).
+    Returns the same lat/lng if there is no coverage nearby.
     """
-    logging.debug(f"[get_nearest_streetview] Called with lat={lat}, lng={lng}")
-    return (lat, lng)
+    logging.debug("[get_nearest_streetview] Called with lat=%s, lng=%s", lat, lng)
+    found = get_resolver().lookup(lat, lng)
+    if found is None:
+        return (lat, lng)
+    return (found[0], found[1])
 
 def compute_distance_km(lat1, lng1, lat2, lng2):
     """
-    Haversine distance between two lat/lng in kilometers.
+    Haversine distance between two lat/lng in kilometers (see scoring).
     """
-    logging.debug("[compute_distance_km] Calculating haversine distance.")
-    rlat1 = math.radians(lat1)
-    rlng1 = math.radians(lng1)
-    rlat2 = math.radians(lat2)
-    rlng2 = math.radians(lng2)
-
-    dlon = rlng2 - rlng1
-    dlat = rlat2 - rlat1
-    a = (math.sin(dlat/2)**2) + math.cos(rlat1)*math.cos(rlat2)*(math.sin(dlon/2)**2)
-    c = 2*math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    radius_earth_km = 6371
-    dist = radius_earth_km * c
-    return dist
+    return scoring.distance_km(lat1, lng1, lat2, lng2)
 
 def compute_score(distance_km):
     """
-    Converts distance to a GeoGuessr-like score.
+    Converts distance to a GeoGuessr-like score ("custom" curve in scoring).
     - ~0 km => 5000
     - 10 km => ~300
     - 500 km => 0
     """
-    logging.debug(f"[compute_score] distance_km={distance_km}")
-    if distance_km < 0.01:
-        return 5000
-    elif distance_km <= 10:
-        return max(300, int(5000 - distance_km*470))
-    elif distance_km <= 500:
-        diff = distance_km - 10
-        frac = diff / 490
-        raw_pts = 300 - int(frac * 300)
-        return max(0, raw_pts)
-    else:
-        return 0
+    return scoring.score(distance_km, "custom")
@@ -0,0 +1,115 @@
+"""
+game_export.py
+
+Game exports for replays and analytics:
+ - dumps(obj, pretty=False) -> JSON bytes; orjson if installed, else the json module
+ - export_line(store, game_id, game) -> one export object: the /download_game_data scoreboard
+   (classic games) or the /end_game payload incl. matchJson (sessions)
+ - iter_ndjson(store, finished_only=False) -> one JSON line (bytes) per game, streamed
+ - gzip_chunks(lines) -> the same stream gzip-compressed, chunk by chunk
+
+Streaming goes through GameStore.iter_games(), so memory use does not grow with the
+number of games exported. The output is what rescore.py reads with --ndjson.
+
+Usage (from backend/, reads the SQLite store of OTTERGUESSR_DB_PATH or --db):
+  python game_export.py --db games.sqlite3 [--store games|sessions] [--finished] --out games.ndjson.gz
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STORES = ("games", "sessions")
+# Flush the gzip stream about every this many input bytes
+GZIP_FLUSH_BYTES = 64 * 1024
+
+
+def dumps(obj, pretty=False):
+    """JSON bytes; compact unless pretty (2-space indent, as /download_game_data always was)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(obj, indent=2).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def export_line(store, game_id, game):
+    """The export object for one game of 'store'."""
+    if store == "games":
+        from game_logic import final_results_for
+        return final_results_for(game_id, game, memoize=False)
+    results = game.end_results()
+    results["sessionId"] = game_id
+    return results
+
+
+def _store(store):
+    if store == "games":
+        from game_logic import GAMES
+        return GAMES
+    if store == "sessions":
+        from custom_game_routes import active_games
+        return active_games
+    raise ValueError(f"Unknown store '{store}', expected one of {list(STORES)}")
+
+
+def iter_ndjson(store, finished_only=False, game_store=None):
+    """Yields one JSON line (bytes, newline-terminated) per game in the store."""
+    game_store = game_store if game_store is not None else _store(store)
+    for game_id, game in game_store.iter_games():
+        if finished_only and not getattr(game, "finished", True):
+            continue
+        yield dumps(export_line(store, game_id, game)) + b"\n"
+
+
+def gzip_chunks(lines):
+    """gzip-compresses a stream of byte chunks, yielding compressed output as it fills."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = 0
+    for line in lines:
+        out = compressor.compress(line)
+        pending += len(line)
+        if pending >= GZIP_FLUSH_BYTES:
+            out += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream stored games as (gzip) NDJSON")
+    parser.add_argument("--db", default=os.environ.get("OTTERGUESSR_DB_PATH"), help="SQLite store")
+    parser.add_argument("--store", choices=STORES, default="games")
+    parser.add_argument("--finished", action="store_true", help="only finished classic games")
+    parser.add_argument("--out", help="output file; .gz compresses (default: stdout)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not args.db:
+        parser.error("no store to read: pass --db or set OTTERGUESSR_DB_PATH")
+    # The stores pick their backend up from the environment on import
+    os.environ["OTTERGUESSR_DB_PATH"] = args.db
+
+    lines = iter_ndjson(args.store, finished_only=args.finished)
+    if args.out and args.out.endswith(".gz"):
+        lines = gzip_chunks(lines)
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for chunk in lines:
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+    logging.info("[game_export] Wrote %s to %s", args.store, args.out or 'stdout')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,243 +1,210 @@
 """
 game_logic.py
 
-Manages in-memory GAMES dict, random coords from .geojson, scoring, scoreboard.
+Manages the in-memory GAMES store, random coords from .geojson, scoring (see scoring.py), scoreboard.
 """
 
 import uuid
-import random
-import math
 import logging
-import json
 
-from shapely.geometry import shape, Point
-from shapely.ops import unary_union
+from shapely.geometry import Point
 
-# In-memory store: gameId -> { settings:..., rounds:[], guesses:[], finished:bool }
-GAMES = {}
+from game_export import dumps
+from game_models import ClassicGame, to_none
+from game_persistence import get_backend
+from game_store import GameStore
+from geometry_registry import get_map_geometry
+from metrics import span, trace
+from point_sampler import random_point
+import scoring
+from seeded_rounds import take_rounds
+from streetview_resolver import get_resolver
+from world_index import country_result, is_world, load_map
+
+# In-memory store: gameId -> game_models.ClassicGame
+# Sharded + locked, idle games expire; persisted if OTTERGUESSR_DB_PATH is set (see game_store)
+GAMES = GameStore("games", model=ClassicGame, backend=get_backend())
 
 def load_geojson_polygons(geojson_path):
     """
-    Loads a .geojson, merges polygons, returns a shapely geometry.
+    Returns the merged shapely geometry of a .geojson (cached per process, see geometry_registry).
     Raises ValueError if empty or invalid.
     """
-    logging.debug(f"[load_geojson_polygons] Loading from {geojson_path}")
-    with open(geojson_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    polygons = []
-    if data.get('type') == 'FeatureCollection':
-        for feat in data['features']:
-            polygons.append(shape(feat['geometry']))
-    else:
-        # single geometry or 'Feature'
-        if data.get('type') == 'Feature':
-            polygons.append(shape(data['geometry']))
-        else:
-            polygons.append(shape(data))
-
-    unified = unary_union(polygons)
-    if not unified or unified.is_empty:
-        raise ValueError("No Shapely geometry can be created from the .geojson")
-    return unified
-
-def get_random_point_in_shape(shp):
-    """
-    Rejection sample up to 10k tries to find a point inside shape.
-    """
-    minx, miny, maxx, maxy = shp.bounds
-    for _ in range(10000):
-        x = random.uniform(minx, maxx)
-        y = random.uniform(miny, maxy)
-        p = Point(x, y)
-        if shp.contains(p):
-            return p
-    logging.warning("[get_random_point_in_shape] Could not find point within shape after 10k tries.")
-    return None
+    logging.debug("[load_geojson_polygons] Loading from %s", geojson_path)
+    return get_map_geometry(geojson_path).geometry
+
+def get_random_point_in_shape(map_geom):
+    """
+    Uniform random Point inside a MapGeometry (see point_sampler), never None.
+    """
+    lat, lng = random_point(map_geom)
+    return Point(lng, lat)
 
 def get_nearest_street_view(lat, lng):
     """
-    Mock function, returns the same lat/lng + a fake pano ID.
-    In production, you'd call the actual Google Street View API.
+    Nearest panorama via the shared streetview_resolver (mock backend by default).
+    Returns (lat, lng, panoId); panoId is None if there is no coverage nearby.
     """
-    logging.debug(f"[get_nearest_street_view] lat={lat}, lng={lng}")
-    return (lat, lng, "mockpanoid-12345")
+    logging.debug("[get_nearest_street_view] lat=%s, lng=%s", lat, lng)
+    found = get_resolver().lookup(lat, lng)
+    return found if found is not None else (lat, lng, None)
 
 def haversine_distance_km(lat1, lng1, lat2, lng2):
     """
-    Haversine formula => kilometers
+    Haversine formula => kilometers (see scoring)
     """
-    R = 6371.0
-    dLat = math.radians(lat2 - lat1)
-    dLng = math.radians(lng2 - lng1)
-    a = math.sin(dLat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLng/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    dist = R * c
-    return dist
+    return scoring.distance_km(lat1, lng1, lat2, lng2)
 
 def compute_score(distance_km):
     """
     If distance < 50m => 5000 points; else linear decay: max(0, 5000 - distance_km*5)
+    (the "classic" curve in scoring)
     """
-    if distance_km < 0.05:
-        return 5000
-    raw = 5000 - (distance_km * 5)
-    return max(0, int(round(raw)))
+    return scoring.score(distance_km, "classic")
 
-def create_custom_game(geojson_path, time_limit, round_count):
+def create_custom_game(geojson_path, time_limit, round_count, seed=None, algo_version=None):
     """
     1) Load shape
-    2) Generate round_count random coords
-    3) For each coord => nearest StreetView
-    4) Store in GAMES with a unique gameId
-    """
-    logging.debug(f"[create_custom_game] path={geojson_path}, time={time_limit}, rounds={round_count}")
-    shp = load_geojson_polygons(geojson_path)
-
-    rounds_data = []
-    for i in range(round_count):
-        pt = get_random_point_in_shape(shp)
-        if pt is None:
-            raise ValueError("Failed to find random location inside polygon.")
-        lat, lng = pt.y, pt.x
-        sv_lat, sv_lng, pano_id = get_nearest_street_view(lat, lng)
-        round_info = {
-            "roundIndex": i,
-            "correctLat": sv_lat,
-            "correctLng": sv_lng,
-            "panoId": pano_id
-        }
-        rounds_data.append(round_info)
+    2) Take round_count random coords, already resolved to the nearest StreetView, from the map's pool
+       (or, for a seed, generate that seed's rounds, see seeded_rounds)
+    3) Store in GAMES with a unique gameId
+    Each step is a tracing span (OTTERGUESSR_TRACING=1, see metrics).
+    """
+    logging.debug("[create_custom_game] path=%s, time=%s, rounds=%s", geojson_path, time_limit, round_count)
+    with trace("create_custom_game"):
+        with span("load_geometry"):
+            map_geom = load_map(geojson_path)
+
+        # Pre-resolved rounds from the per-map pool (see round_pool)
+        with span("take_rounds"):
+            pooled = take_rounds(map_geom, round_count, seed, algo_version)
+        with span("store_game"):
+            return store_new_game(geojson_path, time_limit, pooled, seed, algo_version)
 
+def store_new_game(geojson_path, time_limit, pooled, seed=None, algo_version=None, ranked=False):
+    """
+    Stores a game for pooled rounds (lat, lng, svLat, svLng, panoId) under a new gameId.
+    Split from create_custom_game so asgi.py can take the rounds asynchronously.
+    ranked: one guess per round, for games whose score goes to a leaderboard.
+    """
     game_id = str(uuid.uuid4())
-    GAMES[game_id] = {
-        "settings": {
-            "geojsonPath": geojson_path,
-            "timeLimit": time_limit,
-            "roundCount": round_count
-        },
-        "rounds": rounds_data,
-        "guesses": [],
-        "finished": False
-    }
-    logging.debug(f"[create_custom_game] Created gameId={game_id}")
+    GAMES.put(game_id, ClassicGame(
+        geojson_path,
+        time_limit,
+        ((sv_lat, sv_lng, pano_id) for _lat, _lng, sv_lat, sv_lng, pano_id in pooled),
+        seed,
+        algo_version,
+        ranked
+    ))
+    logging.debug("[create_custom_game] Created gameId=%s", game_id)
     return game_id
 
 def record_guess(game_id, round_index, user_lat, user_lng):
     """
-    Adds guess => distance => score. Round result returned as partial.
-    Also includes correctLat/correctLng in the response for immediate feedback.
-    """
-    if game_id not in GAMES:
-        raise ValueError("Game ID not found.")
-
-    game_data = GAMES[game_id]
-    if game_data["finished"]:
+    Stores the round's guess => distance => score. Round result returned as partial.
+    A second guess for the same round replaces the first (one slot per round), except in a
+    ranked game: the response reveals the correct location, so there it is rejected.
+    Also includes correctLat/correctLng in the response for immediate feedback,
+    and for World games the country of the guess and of the correct location.
+    """
+    # Hold the game's shard lock so concurrent guesses can't interleave
+    with GAMES.locked(game_id) as game:
+        if game is None:
+            raise ValueError("Game ID not found.")
+        return _record_guess_locked(game, game_id, round_index, user_lat, user_lng)
+
+def _record_guess_locked(game, game_id, round_index, user_lat, user_lng):
+    """record_guess body; caller holds the game's lock."""
+    if game.finished:
         raise ValueError("Game is already finished.")
 
-    if round_index < 0 or round_index >= len(game_data["rounds"]):
+    if round_index < 0 or round_index >= game.round_count:
         raise ValueError("Invalid round index.")
+    if game.ranked and game.is_guessed(round_index):
+        raise ValueError("This round was already guessed.")
 
-    correct = game_data["rounds"][round_index]
-    dist_km = haversine_distance_km(
-        correct["correctLat"], correct["correctLng"],
-        user_lat, user_lng
-    )
+    correct_lat = game.correct_lats[round_index]
+    correct_lng = game.correct_lngs[round_index]
+    dist_km = haversine_distance_km(correct_lat, correct_lng, user_lat, user_lng)
     points = compute_score(dist_km)
 
-    guess_record = {
-        "roundIndex": round_index,
-        "userLat": user_lat,
-        "userLng": user_lng,
-        "distanceKm": dist_km,
-        "score": points
-    }
-    game_data.setdefault("guesses", []).append(guess_record)
-    logging.debug(f"[record_guess] game={game_id}, round={round_index}, dist={dist_km:.2f}km, pts={points}")
+    game.set_guess(round_index, user_lat, user_lng, dist_km, points)
+    logging.debug("[record_guess] game=%s, round=%s, dist=%.2fkm, pts=%s", game_id, round_index, dist_km, points)
 
     # Return partial
-    res = {
+    partial = {
         "distanceKm": dist_km,
         "score": points,
         "roundIndex": round_index,
-        "correctLat": correct["correctLat"],
-        "correctLng": correct["correctLng"]
+        "correctLat": correct_lat,
+        "correctLng": correct_lng,
+        # running total, maintained by set_guess
+        "totalPointsSoFar": game.total_score
     }
-
-    # keep track of totalPointsSoFar
-    total_so_far = sum(g["score"] for g in game_data["guesses"])
-    res["totalPointsSoFar"] = total_so_far
-    return res
+    if is_world(game.geojson_path):
+        partial["guessCountry"] = country_result(user_lat, user_lng)
+        partial["correctCountry"] = country_result(correct_lat, correct_lng)
+    return partial
 
 def finish_game(game_id):
     """
     Merge guesses with rounds => final scoreboard.
     Return scoreboard JSON: { gameId, settings, roundResults, totalScore }
     """
-    if game_id not in GAMES:
-        raise ValueError("Game ID not found.")
-    game_data = GAMES[game_id]
-    if game_data["finished"]:
-        logging.debug(f"[finish_game] game={game_id} is already finished.")
-        return build_final_results(game_id)
+    with GAMES.locked(game_id) as game:
+        if game is None:
+            raise ValueError("Game ID not found.")
+        if game.finished:
+            logging.debug("[finish_game] game=%s is already finished.", game_id)
+            return build_final_results(game_id)
 
-    game_data["finished"] = True
-    logging.debug(f"[finish_game] game={game_id} finishing.")
-    return build_final_results(game_id)
+        game.finished = True
+        logging.debug("[finish_game] game=%s finishing.", game_id)
+        return build_final_results(game_id)
 
 def build_final_results(game_id):
     """
     Build final scoreboard from GAMES data: each round's correct location + user guess + distance + score.
+    Memoized on the game until its next guess.
     """
-    game_data = GAMES[game_id]
-    rounds_data = game_data["rounds"]
-    guesses_data = game_data.get("guesses", [])
+    game = GAMES.get(game_id)
+    if game is None:
+        raise ValueError("Game not found.")
+    return final_results_for(game_id, game)
 
-    guesses_by_round = {g["roundIndex"]: g for g in guesses_data}
-    total_score = 0
-    final_info = []
+def final_results_for(game_id, game, memoize=True):
+    """
+    build_final_results for a game object already at hand. Bulk export (game_export) passes
+    memoize=False, since it reads games without their lock and must not cache a torn read.
+    """
+    if game.final_results is not None:
+        return game.final_results
 
-    for rd in rounds_data:
-        idx = rd["roundIndex"]
-        guess = guesses_by_round.get(idx)
-        if guess:
-            distance_km = guess["distanceKm"]
-            sc = guess["score"]
-            total_score += sc
-            round_res = {
-                "roundIndex": idx,
-                "correctLat": rd["correctLat"],
-                "correctLng": rd["correctLng"],
-                "panoId": rd["panoId"],
-                "userLat": guess["userLat"],
-                "userLng": guess["userLng"],
-                "distanceKm": distance_km,
-                "score": sc
-            }
-        else:
-            # Round was never guessed => 0 score
-            round_res = {
-                "roundIndex": idx,
-                "correctLat": rd["correctLat"],
-                "correctLng": rd["correctLng"],
-                "panoId": rd["panoId"],
-                "userLat": None,
-                "userLng": None,
-                "distanceKm": None,
-                "score": 0
-            }
-        final_info.append(round_res)
-
-    return {
+    final_info = []
+    for idx in range(game.round_count):
+        # Round never guessed => None fields, 0 score
+        final_info.append({
+            "roundIndex": idx,
+            "correctLat": game.correct_lats[idx],
+            "correctLng": game.correct_lngs[idx],
+            "panoId": game.pano_ids[idx],
+            "userLat": to_none(game.user_lats[idx]),
+            "userLng": to_none(game.user_lngs[idx]),
+            "distanceKm": to_none(game.distances[idx]),
+            "score": to_none(game.scores[idx]) or 0
+        })
+
+    final_results = {
         "gameId": game_id,
-        "settings": game_data["settings"],
+        "settings": game.settings(),
         "roundResults": final_info,
-        "totalScore": total_score
+        "totalScore": game.total_score
     }
+    if memoize:
+        game.final_results = final_results
+    return final_results
 
-def export_game_data(game_id):
-    """Return entire final scoreboard JSON as a string."""
-    if game_id not in GAMES:
-        raise ValueError("Game not found.")
+def export_game_data(game_id, compact=False):
+    """Return entire final scoreboard JSON as bytes (indented, or compact via game_export.dumps)."""
     final = build_final_results(game_id)
-    return json.dumps(final, indent=2)
+    return dumps(final, pretty=not compact)
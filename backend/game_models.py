@@ -0,0 +1,253 @@
+"""
+game_models.py
+
+Compact in-memory game state. Every per-round value lives in a parallel typed array
+(array('d') / array('i')) instead of one dict per round, and the objects use __slots__,
+so a live game costs a few hundred bytes instead of a few KB of repeated string keys.
+Dicts are only built at the response boundary (app.py, custom_game_routes.py).
+
+ - ClassicGame -> /create_game games (game_logic.GAMES)
+ - SessionGame -> /start_game sessions (custom_game_routes.active_games)
+
+Missing values: NaN in float arrays, -1 in int arrays; to_none() maps them back to None.
+to_record() / from_record() give a plain-dict form for persistence (see game_persistence).
+
+Seeded games (see seeded_rounds) also keep their seed and algoVersion. Their replay payloads
+carry those instead of the round coordinates; their records carry both, so loading a game never
+depends on regenerating it (coverage, the resolver cache or the map file may have changed since).
+"""
+
+import math
+from array import array
+
+NO_POINTS = -1
+
+
+def to_none(value):
+    """NaN / NO_POINTS -> None, anything else unchanged (for JSON responses)."""
+    if isinstance(value, float):
+        return None if math.isnan(value) else value
+    return None if value == NO_POINTS else value
+
+
+class ClassicGame:
+    """
+    A /create_game game: correct location and one guess slot per round.
+    The running total and the final scoreboard are kept up to date incrementally,
+    so a guess and a scoreboard read cost the same however often a client resubmits.
+    A 'ranked' game (a challenge play, see challenge_routes) takes only one guess per round.
+    """
+    __slots__ = (
+        "geojson_path", "time_limit", "finished", "seed", "algo_version", "ranked",
+        "correct_lats", "correct_lngs", "pano_ids",
+        "user_lats", "user_lngs", "distances", "scores", "total_score",
+        "final_results"
+    )
+
+    def __init__(self, geojson_path, time_limit, rounds, seed=None, algo_version=None, ranked=False):
+        """rounds: iterable of (correctLat, correctLng, panoId); seed: if they came from seeded_rounds"""
+        self.geojson_path = geojson_path
+        self.time_limit = time_limit
+        self.finished = False
+        self.seed = seed
+        self.algo_version = algo_version
+        self.ranked = ranked
+        self.correct_lats = array('d')
+        self.correct_lngs = array('d')
+        self.pano_ids = []
+        for lat, lng, pano_id in rounds:
+            self.correct_lats.append(lat)
+            self.correct_lngs.append(lng)
+            self.pano_ids.append(pano_id)
+        n = len(self.correct_lats)
+        self.user_lats = array('d', [math.nan]) * n
+        self.user_lngs = array('d', [math.nan]) * n
+        self.distances = array('d', [math.nan]) * n
+        self.scores = array('i', [NO_POINTS]) * n
+        self.total_score = 0
+        # Memoized build_final_results() output, dropped whenever a guess changes
+        self.final_results = None
+
+    @property
+    def round_count(self):
+        return len(self.correct_lats)
+
+    def settings(self):
+        settings = {
+            "geojsonPath": self.geojson_path,
+            "timeLimit": self.time_limit,
+            "roundCount": self.round_count
+        }
+        if self.seed is not None:
+            settings["seed"] = self.seed
+            settings["algoVersion"] = self.algo_version
+        return settings
+
+    def is_guessed(self, round_index):
+        return self.scores[round_index] != NO_POINTS
+
+    def set_guess(self, round_index, user_lat, user_lng, distance_km, score):
+        """Stores the guess for a round; a resubmission replaces the earlier guess."""
+        previous = self.scores[round_index]
+        if previous != NO_POINTS:
+            self.total_score -= previous
+        self.user_lats[round_index] = user_lat
+        self.user_lngs[round_index] = user_lng
+        self.distances[round_index] = distance_km
+        self.scores[round_index] = score
+        self.total_score += score
+        self.final_results = None
+
+    def to_record(self):
+        rec = {
+            "geojsonPath": self.geojson_path,
+            "timeLimit": self.time_limit,
+            "finished": self.finished,
+            "userLats": self.user_lats.tolist(),
+            "userLngs": self.user_lngs.tolist(),
+            "distances": self.distances.tolist(),
+            "scores": self.scores.tolist(),
+            "correctLats": self.correct_lats.tolist(),
+            "correctLngs": self.correct_lngs.tolist(),
+            "panoIds": self.pano_ids
+        }
+        if self.seed is not None:
+            rec.update(seed=self.seed, algoVersion=self.algo_version)
+        if self.ranked:
+            rec["ranked"] = True
+        return rec
+
+    @classmethod
+    def from_record(cls, rec):
+        game = cls(rec["geojsonPath"], rec["timeLimit"],
+                   zip(rec["correctLats"], rec["correctLngs"], rec["panoIds"]),
+                   rec.get("seed"), rec.get("algoVersion"), rec.get("ranked", False))
+        game.finished = rec["finished"]
+        game.user_lats = array('d', rec["userLats"])
+        game.user_lngs = array('d', rec["userLngs"])
+        game.distances = array('d', rec["distances"])
+        game.scores = array('i', rec["scores"])
+        game.total_score = sum(sc for sc in game.scores if sc != NO_POINTS)
+        return game
+
+
+class SessionGame:
+    """
+    A /start_game session: sampled + street view location per round, and at most one guess per round.
+    """
+    __slots__ = (
+        "mode", "map_file", "time_limit", "total_points", "seed", "algo_version",
+        "lats", "lngs", "street_lats", "street_lngs",
+        "guessed_lats", "guessed_lngs", "distances", "points"
+    )
+
+    def __init__(self, mode, map_file, time_limit, rounds, seed=None, algo_version=None):
+        """rounds: iterable of (lat, lng, streetLat, streetLng); seed: if they came from seeded_rounds"""
+        self.mode = mode
+        self.map_file = map_file
+        self.time_limit = time_limit
+        self.total_points = 0
+        self.seed = seed
+        self.algo_version = algo_version
+        self.lats = array('d')
+        self.lngs = array('d')
+        self.street_lats = array('d')
+        self.street_lngs = array('d')
+        for lat, lng, s_lat, s_lng in rounds:
+            self.lats.append(lat)
+            self.lngs.append(lng)
+            self.street_lats.append(s_lat)
+            self.street_lngs.append(s_lng)
+        n = len(self.lats)
+        self.guessed_lats = array('d', [math.nan]) * n
+        self.guessed_lngs = array('d', [math.nan]) * n
+        self.distances = array('d', [math.nan]) * n
+        self.points = array('i', [NO_POINTS]) * n
+
+    @property
+    def round_count(self):
+        return len(self.lats)
+
+    def is_guessed(self, r_index):
+        return self.points[r_index] != NO_POINTS
+
+    def set_guess(self, r_index, guessed_lat, guessed_lng, distance_km, points):
+        self.guessed_lats[r_index] = guessed_lat
+        self.guessed_lngs[r_index] = guessed_lng
+        self.distances[r_index] = distance_km
+        self.points[r_index] = points
+        self.total_points += points
+
+    def round_result(self, r_index):
+        """One scoreboard row, as returned by /end_game."""
+        return {
+            "actualLat": self.street_lats[r_index],
+            "actualLng": self.street_lngs[r_index],
+            "guessedLat": to_none(self.guessed_lats[r_index]),
+            "guessedLng": to_none(self.guessed_lngs[r_index]),
+            "distanceKm": to_none(self.distances[r_index]),
+            "points": to_none(self.points[r_index])
+        }
+
+    def match_json(self):
+        """
+        Replay payload: settings + every round's location. A seeded session sends its seed
+        instead of the locations (GET /replay regenerates them).
+        """
+        match = {
+            "mode": self.mode,
+            "mapFile": self.map_file,
+            "timeLimit": self.time_limit,
+            "roundCount": self.round_count
+        }
+        if self.seed is not None:
+            match["seed"] = self.seed
+            match["algoVersion"] = self.algo_version
+            return match
+        match["rounds"] = [
+            {
+                "lat": self.lats[i],
+                "lng": self.lngs[i],
+                "streetLat": self.street_lats[i],
+                "streetLng": self.street_lngs[i]
+            } for i in range(self.round_count)
+        ]
+        return match
+
+    def end_results(self):
+        """The /end_game payload: scoreboard, total and matchJson."""
+        return {
+            "rounds": [self.round_result(i) for i in range(self.round_count)],
+            "totalPoints": self.total_points,
+            "matchJson": self.match_json()
+        }
+
+    def to_record(self):
+        rec = {
+            "mode": self.mode,
+            "mapFile": self.map_file,
+            "timeLimit": self.time_limit,
+            "guessedLats": self.guessed_lats.tolist(),
+            "guessedLngs": self.guessed_lngs.tolist(),
+            "distances": self.distances.tolist(),
+            "points": self.points.tolist(),
+            "lats": self.lats.tolist(),
+            "lngs": self.lngs.tolist(),
+            "streetLats": self.street_lats.tolist(),
+            "streetLngs": self.street_lngs.tolist()
+        }
+        if self.seed is not None:
+            rec.update(seed=self.seed, algoVersion=self.algo_version)
+        return rec
+
+    @classmethod
+    def from_record(cls, rec):
+        game = cls(rec["mode"], rec["mapFile"], rec["timeLimit"],
+                   zip(rec["lats"], rec["lngs"], rec["streetLats"], rec["streetLngs"]),
+                   rec.get("seed"), rec.get("algoVersion"))
+        game.guessed_lats = array('d', rec["guessedLats"])
+        game.guessed_lngs = array('d', rec["guessedLngs"])
+        game.distances = array('d', rec["distances"])
+        game.points = array('i', rec["points"])
+        game.total_points = sum(p for p in game.points if p != NO_POINTS)
+        return game
@@ -0,0 +1,289 @@
+"""
+game_persistence.py
+
+Durable storage under GameStore, so games survive restarts and can be shared by several workers:
+ - PersistenceBackend -> interface: load / version / save / delete / purge / iter_records
+ - SQLiteBackend -> one SQLite file in WAL mode; writes are group-committed by a flusher thread;
+   iter_records(store) streams every stored game (offline jobs, see rescore.py)
+ - get_backend() -> the process-wide backend from OTTERGUESSR_DB_PATH, or None (memory only)
+
+Group commit: save() queues the write and returns a ticket; wait(ticket) blocks (by default)
+until the flusher has committed it. The flusher commits everything queued within one flush
+interval in a single transaction, so concurrent /submit_guess calls share one fsync instead
+of paying one each. GameStore queues under its shard lock but waits outside of it.
+
+Each row carries a random version token. GameStore keeps games in memory (read-through) and
+compares the token on access, so a game updated by another worker is reloaded.
+
+Config (env):
+  OTTERGUESSR_DB_PATH      -> SQLite file; unset = no persistence
+  OTTERGUESSR_DB_FLUSH_MS  -> group-commit window (default 5)
+  OTTERGUESSR_DB_WAIT_COMMIT -> "0" returns before the commit (faster, may lose the last window on a crash)
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+DB_FLUSH_MS = float(os.environ.get("OTTERGUESSR_DB_FLUSH_MS", 5))
+DB_WAIT_COMMIT = os.environ.get("OTTERGUESSR_DB_WAIT_COMMIT", "1").lower() not in ("0", "false", "no")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    store TEXT NOT NULL,
+    id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (store, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS games_updated ON games (store, updated_at);
+"""
+
+# Fixed SQL strings, so sqlite3's per-connection statement cache keeps them prepared
+_SQL_LOAD = "SELECT payload, version FROM games WHERE store = ? AND id = ?"
+_SQL_VERSION = "SELECT version FROM games WHERE store = ? AND id = ?"
+_SQL_UPSERT = (
+    "INSERT INTO games (store, id, version, updated_at, payload) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (store, id) DO UPDATE SET version = excluded.version, "
+    "updated_at = excluded.updated_at, payload = excluded.payload"
+)
+_SQL_DELETE = "DELETE FROM games WHERE store = ? AND id = ?"
+_SQL_PURGE = "DELETE FROM games WHERE store = ? AND updated_at < ?"
+_SQL_SCAN = "SELECT id, payload FROM games WHERE store = ?"
+
+_DELETED = object()
+
+
+class PersistenceBackend:
+    """Interface used by GameStore. Records are plain dicts (game_models to_record())."""
+
+    def load(self, store, game_id):
+        """Returns (record, version) or None."""
+        raise NotImplementedError
+
+    def version(self, store, game_id):
+        """Returns the stored version token, or None if the game is not stored."""
+        raise NotImplementedError
+
+    def save(self, store, game_id, record, version):
+        """Queues a write. Returns a ticket for wait()."""
+        raise NotImplementedError
+
+    def delete(self, store, game_id):
+        """Queues a delete. Returns a ticket for wait()."""
+        raise NotImplementedError
+
+    def wait(self, ticket):
+        """Blocks until the write behind 'ticket' is durable."""
+        raise NotImplementedError
+
+    def purge(self, store, older_than):
+        """Deletes games last written before 'older_than' (epoch seconds). Returns the count."""
+        raise NotImplementedError
+
+    def iter_records(self, store):
+        """Yields (id, record) for every stored game of a store."""
+        raise NotImplementedError
+
+
+class SQLiteBackend(PersistenceBackend):
+    """
+    SQLite (WAL) backend. Reads use one connection per thread; all writes go through
+    a single flusher thread. Fork-safe: connections and the flusher are per process.
+    """
+
+    def __init__(self, path, flush_interval_s=DB_FLUSH_MS / 1000.0, wait_commit=DB_WAIT_COMMIT):
+        self.path = path
+        self.flush_interval_s = flush_interval_s
+        self.wait_commit = wait_commit
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        # (store, id) -> (payload, version, updated_at) or _DELETED
+        self._pending = {}
+        # The batch the flusher is committing; still served to readers until its COMMIT is done
+        self._inflight = {}
+        self._seq = 0            # batch currently collecting writes
+        self._committed_seq = -1
+        self._failed = {}        # seq -> exception
+        self._flusher_pid = None
+        self.commits = 0
+        self.rows_written = 0
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _queued(self, key):
+        """A write not yet committed for key (newest first), or None."""
+        with self._cond:
+            pending = self._pending.get(key)
+            return pending if pending is not None else self._inflight.get(key)
+
+    def load(self, store, game_id):
+        pending = self._queued((store, game_id))
+        if pending is _DELETED:
+            return None
+        if pending is not None:
+            return json.loads(pending[0]), pending[1]
+        row = self._connect().execute(_SQL_LOAD, (store, game_id)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def version(self, store, game_id):
+        pending = self._queued((store, game_id))
+        if pending is _DELETED:
+            return None
+        if pending is not None:
+            return pending[1]
+        row = self._connect().execute(_SQL_VERSION, (store, game_id)).fetchone()
+        return row[0] if row else None
+
+    def save(self, store, game_id, record, version):
+        payload = json.dumps(record, separators=(",", ":"))
+        return self._enqueue((store, game_id), (payload, version, time.time()))
+
+    def delete(self, store, game_id):
+        return self._enqueue((store, game_id), _DELETED)
+
+    def wait(self, ticket):
+        if self.wait_commit:
+            self._wait_for(ticket)
+
+    def purge(self, store, older_than):
+        self.flush()
+        cur = self._connect().execute(_SQL_PURGE, (store, older_than))
+        return cur.rowcount
+
+    def flush(self):
+        """Blocks until everything queued so far is committed."""
+        with self._cond:
+            if self._pending:
+                seq = self._seq
+            elif self._inflight:
+                seq = self._seq - 1
+            else:
+                return
+        self._ensure_flusher()
+        self._wait_for(seq)
+
+    def _enqueue(self, key, value):
+        self._ensure_flusher()
+        with self._cond:
+            self._pending[key] = value
+            seq = self._seq
+            self._cond.notify_all()
+        return seq
+
+    def _wait_for(self, seq):
+        with self._cond:
+            while self._committed_seq < seq:
+                self._cond.wait()
+            err = self._failed.get(seq)
+        if err is not None:
+            raise err
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        with self._cond:
+            if self._flusher_pid != os.getpid():
+                # After a fork the parent's queue and flusher are not ours
+                self._pending = {}
+                self._inflight = {}
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self._flush_loop, name="sqlite-flusher", daemon=True).start()
+
+    def _flush_loop(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Let concurrent writers join this batch
+            time.sleep(self.flush_interval_s)
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+                seq = self._seq
+                self._seq += 1
+
+            upserts = [(store, gid, v[1], v[2], v[0]) for (store, gid), v in batch.items() if v is not _DELETED]
+            deletes = [key for key, v in batch.items() if v is _DELETED]
+            err = None
+            try:
+                conn.execute("BEGIN")
+                if upserts:
+                    conn.executemany(_SQL_UPSERT, upserts)
+                if deletes:
+                    conn.executemany(_SQL_DELETE, deletes)
+                conn.execute("COMMIT")
+                self.commits += 1
+                self.rows_written += len(batch)
+            except sqlite3.Error as e:
+                logging.exception("[SQLiteBackend] Group commit failed")
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                err = e
+
+            with self._cond:
+                if err is not None and self.wait_commit:
+                    self._failed[seq] = err
+                # Every waiter of an old batch has been woken long ago
+                self._failed.pop(seq - 1000, None)
+                self._committed_seq = seq
+                self._inflight = {}
+                self._cond.notify_all()
+
+    def iter_records(self, store, batch_size=1000):
+        """
+        Yields (id, record) for every committed game of a store, fetching batch_size rows
+        at a time on a private connection, so a full scan stays in bounded memory.
+        """
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=5.0)
+        try:
+            cur = conn.execute(_SQL_SCAN, (store,))
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for game_id, payload in rows:
+                    yield game_id, json.loads(payload)
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {"path": self.path, "commits": self.commits, "rowsWritten": self.rows_written, "pending": pending}
+
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_backend():
+    """Returns the process-wide backend configured by OTTERGUESSR_DB_PATH, or None."""
+    global _BACKEND
+    path = os.environ.get("OTTERGUESSR_DB_PATH")
+    if not path:
+        return None
+    if _BACKEND is None:
+        with _BACKEND_LOCK:
+            if _BACKEND is None:
+                _BACKEND = SQLiteBackend(path)
+                logging.info("[game_persistence] Persisting games to %s", path)
+    return _BACKEND
@@ -0,0 +1,280 @@
+"""
+game_store.py
+
+Thread-safe in-memory store for live games / sessions, with bounded memory:
+ - GameStore(name) -> lock-striped shards of id -> game, each an LRU ordered by last access
+ - get / put / pop / locked(id) -> locked(id) holds the shard lock while a game is mutated
+ - iter_games() -> streams every game (bulk export)
+ - a daemon reaper thread drops games idle for longer than the TTL
+ - capacity: least recently used games are evicted past max_games or max_bytes
+ - stats() -> live games, evictions, estimated bytes
+ - optional persistence backend (game_persistence): read-through on a memory miss,
+   write on put/locked, version check on access so other workers' writes are picked up
+
+Config (env): OTTERGUESSR_GAME_TTL_S (default 6h), OTTERGUESSR_MAX_GAMES (default 100000),
+OTTERGUESSR_MAX_GAME_BYTES (default 512 MB), OTTERGUESSR_STORE_SHARDS (default 16).
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+
+from metrics import CallbackMetric
+
+GAME_TTL_S = float(os.environ.get("OTTERGUESSR_GAME_TTL_S", 6 * 3600))
+MAX_GAMES = int(os.environ.get("OTTERGUESSR_MAX_GAMES", 100000))
+MAX_GAME_BYTES = int(os.environ.get("OTTERGUESSR_MAX_GAME_BYTES", 512 * 1024 * 1024))
+STORE_SHARDS = int(os.environ.get("OTTERGUESSR_STORE_SHARDS", 16))
+REAP_INTERVAL_S = 60.0
+
+# Every GameStore of the process, for the store metrics
+_STORES = weakref.WeakSet()
+
+
+def estimate_size(obj, _seen=None):
+    """Rough deep sys.getsizeof of dicts/lists/tuples/slotted objects and their contents."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(estimate_size(v, _seen) for v in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(estimate_size(getattr(obj, s), _seen) for s in obj.__slots__ if hasattr(obj, s))
+    return size
+
+
+def _new_version():
+    """Random version token for a persisted write."""
+    return random.getrandbits(62)
+
+
+class _Shard:
+    """One stripe: id -> [game, last_access, size_bytes, version], oldest access first."""
+    __slots__ = ("lock", "entries", "bytes")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+
+
+class GameStore:
+    """
+    Sharded id -> game mapping with LRU/TTL eviction. Safe to use from many threads.
+    With a backend, memory is a cache: evicted games are reloaded from it on the next access.
+    'model' is the game class (to_record / from_record), needed only with a backend.
+    """
+
+    def __init__(self, name, shards=STORE_SHARDS, ttl_s=GAME_TTL_S, max_games=MAX_GAMES,
+                 max_bytes=MAX_GAME_BYTES, reap_interval_s=REAP_INTERVAL_S, model=None, backend=None):
+        self.name = name
+        self.model = model
+        self.backend = backend
+        self.ttl_s = ttl_s
+        self.max_games_per_shard = max(1, max_games // shards)
+        self.max_bytes_per_shard = max(1, max_bytes // shards)
+        self.reap_interval_s = reap_interval_s
+        self._shards = [_Shard() for _ in range(shards)]
+        self._reaper = None
+        self._reaper_lock = threading.Lock()
+        self.ttl_evictions = 0
+        self.capacity_evictions = 0
+        _STORES.add(self)
+
+    def _shard(self, game_id):
+        return self._shards[hash(game_id) % len(self._shards)]
+
+    def __contains__(self, game_id):
+        return self.get(game_id) is not None
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def get(self, game_id, default=None):
+        """Returns the game and marks it as recently used, or default."""
+        shard = self._shard(game_id)
+        with shard.lock:
+            entry = shard.entries.get(game_id)
+            if self.backend is not None:
+                entry = self._sync_with_backend(shard, game_id, entry)
+            if entry is None:
+                return default
+            entry[1] = time.monotonic()
+            shard.entries.move_to_end(game_id)
+            return entry[0]
+
+    def _sync_with_backend(self, shard, game_id, entry):
+        """Read-through + staleness check against the backend. Caller holds the shard lock."""
+        if entry is not None:
+            version = self.backend.version(self.name, game_id)
+            if version == entry[3]:
+                return entry
+            if version is None:
+                # Ended / deleted by another worker
+                self._drop(shard, game_id)
+                return None
+        loaded = self.backend.load(self.name, game_id)
+        if loaded is None:
+            return None
+        record, version = loaded
+        self._insert(shard, game_id, self.model.from_record(record), version)
+        return shard.entries[game_id]
+
+    def _insert(self, shard, game_id, game, version):
+        """Adds/replaces an entry and enforces capacity. Caller holds the shard lock."""
+        size = estimate_size(game)
+        self._drop(shard, game_id)
+        shard.entries[game_id] = [game, time.monotonic(), size, version]
+        shard.bytes += size
+        while len(shard.entries) > 1 and (len(shard.entries) > self.max_games_per_shard
+                                          or shard.bytes > self.max_bytes_per_shard):
+            _, evicted = shard.entries.popitem(last=False)
+            shard.bytes -= evicted[2]
+            self.capacity_evictions += 1
+
+    def _drop(self, shard, game_id):
+        entry = shard.entries.pop(game_id, None)
+        if entry is not None:
+            shard.bytes -= entry[2]
+        return entry
+
+    def put(self, game_id, game):
+        """Stores (or replaces) a game, evicting least recently used ones past capacity."""
+        shard = self._shard(game_id)
+        version = _new_version()
+        ticket = None
+        with shard.lock:
+            self._insert(shard, game_id, game, version)
+            if self.backend is not None:
+                ticket = self.backend.save(self.name, game_id, game.to_record(), version)
+        # Wait for the group commit without blocking the rest of the shard
+        if ticket is not None:
+            self.backend.wait(ticket)
+        self._ensure_reaper()
+
+    def pop(self, game_id, default=None):
+        """Removes and returns a game, or default."""
+        shard = self._shard(game_id)
+        ticket = None
+        with shard.lock:
+            game = self.get(game_id)
+            if game is None:
+                return default
+            self._drop(shard, game_id)
+            if self.backend is not None:
+                ticket = self.backend.delete(self.name, game_id)
+        if ticket is not None:
+            self.backend.wait(ticket)
+        return game
+
+    @contextlib.contextmanager
+    def locked(self, game_id):
+        """
+        with store.locked(game_id) as game: ...
+        Yields the game (or None) while holding its shard lock, so read-modify-write is atomic.
+        Afterwards the size estimate is refreshed and, with a backend, the game is written back
+        (skipped if the block raised).
+        """
+        shard = self._shard(game_id)
+        ticket = None
+        with shard.lock:
+            game = self.get(game_id)
+            yield game
+            entry = shard.entries.get(game_id)
+            if entry is not None:
+                size = estimate_size(entry[0])
+                shard.bytes += size - entry[2]
+                entry[2] = size
+                if self.backend is not None:
+                    entry[3] = _new_version()
+                    ticket = self.backend.save(self.name, game_id, entry[0].to_record(), entry[3])
+        if ticket is not None:
+            self.backend.wait(ticket)
+
+    def iter_games(self):
+        """
+        Yields (id, game) for every game, without holding locks between items.
+        With a backend it streams the backend (all persisted games, also evicted ones);
+        otherwise it walks the shards, snapshotting one shard's ids at a time.
+        """
+        if self.backend is not None:
+            for game_id, record in self.backend.iter_records(self.name):
+                yield game_id, self.model.from_record(record)
+            return
+        for shard in self._shards:
+            with shard.lock:
+                snapshot = [(game_id, entry[0]) for game_id, entry in shard.entries.items()]
+            yield from snapshot
+
+    def reap(self, now=None):
+        """Drops every game idle for longer than the TTL. Returns how many were dropped."""
+        cutoff = (now if now is not None else time.monotonic()) - self.ttl_s
+        dropped = 0
+        for shard in self._shards:
+            with shard.lock:
+                # Entries are in access order, so stop at the first fresh one
+                while shard.entries:
+                    game_id, entry = next(iter(shard.entries.items()))
+                    if entry[1] >= cutoff:
+                        break
+                    del shard.entries[game_id]
+                    shard.bytes -= entry[2]
+                    dropped += 1
+        if self.backend is not None:
+            # Memory is only a cache here; idle games expire from the backend too
+            self.backend.purge(self.name, time.time() - self.ttl_s)
+        self.ttl_evictions += dropped
+        if dropped:
+            logging.info("[GameStore:%s] Reaped %s idle games", self.name, dropped)
+        return dropped
+
+    def _ensure_reaper(self):
+        # is_alive() is False in a forked child, so each worker starts its own reaper
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        with self._reaper_lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=self._reap_loop, name=f"{self.name}-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reap_interval_s)
+            try:
+                self.reap()
+            except Exception:
+                logging.exception("[GameStore:%s] Reaper error", self.name)
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "liveGames": len(self),
+            "ttlEvictions": self.ttl_evictions,
+            "capacityEvictions": self.capacity_evictions,
+            "bytesEstimate": sum(shard.bytes for shard in self._shards)
+        }
+
+
+def _eviction_samples():
+    for store in list(_STORES):
+        yield (store.name, "ttl"), store.ttl_evictions
+        yield (store.name, "capacity"), store.capacity_evictions
+
+
+CallbackMetric("otterguessr_store_games", "Live games in memory per store.", "gauge", ("store",),
+               lambda: [((store.name,), len(store)) for store in list(_STORES)])
+CallbackMetric("otterguessr_store_bytes", "Estimated bytes of the games in memory per store.", "gauge", ("store",),
+               lambda: [((store.name,), sum(shard.bytes for shard in store._shards)) for store in list(_STORES)])
+CallbackMetric("otterguessr_store_evictions", "Games dropped from memory per store, by reason.", "counter",
+               ("store", "reason"), _eviction_samples)
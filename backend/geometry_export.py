@@ -0,0 +1,214 @@
+"""
+geometry_export.py
+
+Client-ready map outlines for /maps/<name>/geometry, precomputed and cached as bytes:
+ - LEVELS -> simplification tolerances (degrees); level_for_zoom(z) picks one for a map zoom
+ - encodings: "geojson" (minified, 6 decimals), "polyline" (Google encoded polylines, 5 decimals),
+   "binary" (see encode_binary)
+ - get_variant(map_geom, level, encoding) -> GeometryVariant with identity / gzip / brotli bodies
+
+All levels x encodings of a map are built together on its first request and kept until the
+map file changes, so serving one is a dict lookup. Brotli is used if the 'brotli' package is
+installed, gzip always.
+
+Binary layout (little endian): b"OTGB", uint8 version, uint8 decimals, uint16 reserved,
+uint32 polygon count, then per polygon a uint32 ring count and per ring a uint32 point count,
+then every ring's points as int32 (lng, lat) pairs, quantized to 'decimals' and delta-encoded
+per ring (the first point of a ring is absolute).
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import math
+import struct
+import threading
+
+import numpy as np
+import shapely
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# name -> Douglas-Peucker tolerance in degrees (0 = unsimplified)
+LEVELS = {
+    "full": 0.0,
+    "high": 0.001,
+    "medium": 0.01,
+    "low": 0.05
+}
+ENCODINGS = ("geojson", "polyline", "binary")
+CONTENT_TYPES = {
+    "geojson": "application/geo+json",
+    "polyline": "application/json",
+    "binary": "application/octet-stream"
+}
+GEOJSON_DECIMALS = 6
+POLYLINE_DECIMALS = 5
+BINARY_DECIMALS = 5
+BINARY_MAGIC = b"OTGB"
+BINARY_VERSION = 1
+# Zooms beyond this all mean "full"; clamping keeps 2 ** zoom finite
+MAX_ZOOM = 30
+
+
+def level_for_zoom(zoom):
+    """
+    Coarsest level whose tolerance stays below one 256px tile pixel at this zoom (clamped to
+    0..MAX_ZOOM). Raises ValueError if zoom is not a number.
+    """
+    zoom = float(zoom)
+    if math.isnan(zoom):
+        raise ValueError("zoom must be a number.")
+    pixel_deg = 360.0 / (256 * 2 ** min(max(zoom, 0.0), MAX_ZOOM))
+    best = "full"
+    for name, tolerance in LEVELS.items():
+        if tolerance <= pixel_deg and tolerance >= LEVELS[best]:
+            best = name
+    return best
+
+
+def _polygons(geom):
+    """Polygon parts of a (Multi)Polygon / GeometryCollection, empty ones dropped."""
+    return [p for p in shapely.get_parts(geom) if isinstance(p, shapely.Polygon) and not p.is_empty]
+
+
+def _rings(polygon):
+    """Exterior first, then holes, each as an (n, 2) lng/lat array."""
+    rings = [polygon.exterior] + list(polygon.interiors)
+    return [shapely.get_coordinates(r) for r in rings]
+
+
+def simplify(geom, tolerance):
+    if tolerance <= 0:
+        return geom
+    return shapely.simplify(geom, tolerance, preserve_topology=True)
+
+
+def encode_geojson(geom):
+    rounded = shapely.transform(geom, lambda c: np.round(c, GEOJSON_DECIMALS))
+    return shapely.to_geojson(rounded).encode("utf-8")
+
+
+def _polyline(coords):
+    """Google's encoded polyline algorithm for an (n, 2) lng/lat array."""
+    ints = np.round(coords[:, ::-1] * 10 ** POLYLINE_DECIMALS).astype(np.int64)
+    deltas = np.diff(ints, axis=0, prepend=[[0, 0]]).ravel()
+    out = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            out.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        out.append(chr(value + 63))
+    return "".join(out)
+
+
+def encode_polyline(geom):
+    payload = {
+        "type": "polyline",
+        "precision": POLYLINE_DECIMALS,
+        "polygons": [[_polyline(ring) for ring in _rings(p)] for p in _polygons(geom)]
+    }
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def encode_binary(geom):
+    polygons = [_rings(p) for p in _polygons(geom)]
+    counts = [len(polygons)]
+    chunks = []
+    for rings in polygons:
+        counts.append(len(rings))
+        for ring in rings:
+            counts.append(len(ring))
+            ints = np.round(ring * 10 ** BINARY_DECIMALS).astype(np.int64)
+            chunks.append(np.diff(ints, axis=0, prepend=[[0, 0]]).astype("<i4"))
+    header = BINARY_MAGIC + struct.pack("<BBH", BINARY_VERSION, BINARY_DECIMALS, 0)
+    body = np.asarray(counts, dtype="<u4").tobytes()
+    return header + body + b"".join(c.tobytes() for c in chunks)
+
+
+def decode_binary(data):
+    """Inverse of encode_binary -> list of polygons, each a list of (n, 2) lng/lat arrays."""
+    if data[:4] != BINARY_MAGIC:
+        raise ValueError("Not an OTGB geometry")
+    _, decimals, _ = struct.unpack_from("<BBH", data, 4)
+    pos = 8
+    (n_polys,) = struct.unpack_from("<I", data, pos)
+    pos += 4
+    layout = []
+    for _ in range(n_polys):
+        (n_rings,) = struct.unpack_from("<I", data, pos)
+        pos += 4
+        layout.append(struct.unpack_from(f"<{n_rings}I", data, pos))
+        pos += 4 * n_rings
+    polygons = []
+    for ring_sizes in layout:
+        rings = []
+        for size in ring_sizes:
+            deltas = np.frombuffer(data, dtype="<i4", count=size * 2, offset=pos).reshape(size, 2)
+            pos += size * 8
+            rings.append(np.cumsum(deltas, axis=0) / 10 ** decimals)
+        polygons.append(rings)
+    return polygons
+
+
+_ENCODERS = {
+    "geojson": encode_geojson,
+    "polyline": encode_polyline,
+    "binary": encode_binary
+}
+
+
+class GeometryVariant:
+    """One level + encoding of a map: the body in every content encoding, plus its ETag."""
+    __slots__ = ("content_type", "etag", "bodies")
+
+    def __init__(self, content_type, raw):
+        self.content_type = content_type
+        self.etag = hashlib.sha1(raw).hexdigest()
+        self.bodies = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(raw, quality=11)
+
+    def pick(self, accept_encoding):
+        """(content_encoding, body) for an Accept-Encoding header (werkzeug MIMEAccept-like)."""
+        for coding in ("br", "gzip"):
+            if coding in self.bodies and accept_encoding[coding]:
+                return coding, self.bodies[coding]
+        return "identity", self.bodies["identity"]
+
+
+# abs path -> (mtime, {(level, encoding): GeometryVariant})
+_VARIANTS = {}
+_VARIANTS_LOCK = threading.Lock()
+
+
+def build_variants(map_geom):
+    """Every level x encoding for one map."""
+    variants = {}
+    for level, tolerance in LEVELS.items():
+        simplified = simplify(map_geom.geometry, tolerance)
+        for encoding, encode in _ENCODERS.items():
+            variants[(level, encoding)] = GeometryVariant(CONTENT_TYPES[encoding], encode(simplified))
+    logging.debug("[geometry_export] Built %s variants for %s", len(variants), map_geom.name)
+    return variants
+
+
+def get_variant(map_geom, level="full", encoding="geojson"):
+    """Cached variant for a map. Raises ValueError for an unknown level or encoding."""
+    if level not in LEVELS:
+        raise ValueError(f"Unknown level '{level}', expected one of {list(LEVELS)}")
+    if encoding not in _ENCODERS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of {list(ENCODINGS)}")
+    cached = _VARIANTS.get(map_geom.path)
+    if cached is None or cached[0] != map_geom.mtime:
+        with _VARIANTS_LOCK:
+            cached = _VARIANTS.get(map_geom.path)
+            if cached is None or cached[0] != map_geom.mtime:
+                cached = (map_geom.mtime, build_variants(map_geom))
+                _VARIANTS[map_geom.path] = cached
+    return cached[1][(level, encoding)]
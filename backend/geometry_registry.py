@@ -0,0 +1,279 @@
+"""
+geometry_registry.py
+
+Process-wide cache of parsed map geometry, shared by game_logic and custom_mode_logic:
+ - get_map_geometry(path) -> MapGeometry (precision tiers, unioned + prepared geometry, bounds, area)
+ - build_tiers(geometry) -> the coarse (outer, core) tiers of a map
+ - warm_up(maps_dir) -> parse every .geojson once, e.g. at app startup
+ - cached_maps() -> every MapGeometry loaded so far
+ - invalidate(path=None) -> drop one cached entry, or all of them
+
+Each .geojson is parsed, repaired and unioned (geometry_validation) once per process, or read
+from the compiled map bundle if it is up to date for that file (see map_bundle). Entries are
+keyed by absolute path and rebuilt when the file's mtime changes, so editing a map needs no restart.
+
+Precision tiers: point-in-map checks (MapGeometry.contains_xy) go bounding box -> outer ->
+core -> full geometry and stop at the first tier that decides. Only points in the border band
+between outer and core need the full geometry, which maps loaded from the bundle only decode
+on first use, so memory grows with the maps actually played.
+
+Config (env):
+  OTTERGUESSR_TIER_BAND         -> width of the border band as a fraction of a map's larger
+                                   bounding-box side (default 0.02; wider bands give coarser tiers)
+  OTTERGUESSR_TIER_BAND_MAX_DEG -> upper bound on that width in degrees (default 0.5), so big
+                                   maps don't send everything within hundreds of km of their coast
+                                   to the full geometry
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+import map_bundle
+from geometry_validation import normalize_geometries
+from metrics import Counter, Histogram
+
+# Default location of the bundled maps
+MAPS_DIR = os.path.join(os.path.dirname(__file__), "assets", "maps")
+
+# abs path -> MapGeometry
+_CACHE = {}
+# abs path -> Lock, so two requests for the same cold map only parse it once
+_BUILD_LOCKS = {}
+_BUILD_LOCKS_GUARD = threading.Lock()
+
+TIER_BAND = float(os.environ.get("OTTERGUESSR_TIER_BAND", 0.02))
+TIER_BAND_MAX_DEG = float(os.environ.get("OTTERGUESSR_TIER_BAND_MAX_DEG", 0.5))
+
+GEOMETRY_LOAD_SECONDS = Histogram(
+    "otterguessr_geometry_load_seconds", "Load (bundle or parse + union) + prepare time of a map.", ())
+CONTAINMENT_CHECKS = Counter(
+    "otterguessr_containment_checks", "Point-in-map checks by the precision tier that decided them.", ("tier",))
+
+
+class MapGeometry:
+    """
+    One map in precision tiers, coarse to fine: 'bounds', 'outer' and 'core' (simplified
+    shapes around and inside the map, see build_tiers; None if a map has none) and the full
+    unioned 'geometry'. Every tier is prepared in place, so contains/intersects checks are fast.
+    'geometry' may be given as a function that loads it (then bounds, area and the summary,
+    see geometry_summary, are required); it is called on first access.
+    'sampler' is filled in lazily by point_sampler.get_sampler.
+    """
+    __slots__ = ("name", "path", "mtime", "bounds", "area", "centroid", "vertex_count",
+                 "outer", "core", "sampler", "_geometry", "_load")
+
+    def __init__(self, name, path, mtime, geometry, tiers=None, bounds=None, area=None, summary=None):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        if callable(geometry):
+            self._geometry = None
+            self._load = geometry
+            self.bounds = tuple(bounds)
+            self.area = area
+            self.centroid, self.vertex_count = summary
+        else:
+            shapely.prepare(geometry)
+            self._geometry = geometry
+            self._load = None
+            self.bounds = geometry.bounds
+            self.area = geometry.area
+            self.centroid, self.vertex_count = geometry_summary(geometry)
+            if tiers is None:
+                tiers = build_tiers(geometry)
+        self.outer, self.core = tiers or (None, None)
+        for tier in (self.outer, self.core):
+            if tier is not None:
+                shapely.prepare(tier)
+        self.sampler = None
+
+    def __repr__(self):
+        return f"MapGeometry({self.name!r}, area={self.area:.3f})"
+
+    @property
+    def geometry(self):
+        """The full-resolution geometry, loaded on first access."""
+        geometry = self._geometry
+        if geometry is None:
+            geometry = self._load()
+            shapely.prepare(geometry)
+            # Two threads may both load it; either copy is fine
+            self._geometry = geometry
+            logging.debug("[geometry_registry] Loaded full geometry of %s", self.name)
+        return geometry
+
+    @property
+    def geometry_loaded(self):
+        return self._geometry is not None
+
+    def contains_xy(self, xs, ys):
+        """
+        Vectorized point-in-map test (x=lng, y=lat arrays) with the same answers as
+        shapely.contains_xy(self.geometry, xs, ys), deciding each point at the coarsest tier
+        that can: outside the bounds or outer -> False, inside core -> True, else full geometry.
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        minx, miny, maxx, maxy = self.bounds
+        inside = np.zeros(len(xs), dtype=bool)
+        todo = np.flatnonzero((xs >= minx) & (xs <= maxx) & (ys >= miny) & (ys <= maxy))
+        CONTAINMENT_CHECKS.inc("bounds", amount=len(xs) - len(todo))
+        if len(todo) and self.outer is not None:
+            in_outer = shapely.contains_xy(self.outer, xs[todo], ys[todo])
+            CONTAINMENT_CHECKS.inc("outer", amount=len(todo) - int(in_outer.sum()))
+            todo = todo[in_outer]
+        if len(todo) and self.core is not None:
+            in_core = shapely.contains_xy(self.core, xs[todo], ys[todo])
+            inside[todo[in_core]] = True
+            CONTAINMENT_CHECKS.inc("core", amount=int(in_core.sum()))
+            todo = todo[~in_core]
+        if len(todo):
+            inside[todo] = shapely.contains_xy(self.geometry, xs[todo], ys[todo])
+            CONTAINMENT_CHECKS.inc("full", amount=len(todo))
+        return inside
+
+
+def geometry_summary(geometry):
+    """((lat, lng) of the centroid, vertex count) of a map geometry."""
+    centroid = geometry.centroid
+    return (centroid.y, centroid.x), int(shapely.get_num_coordinates(geometry))
+
+
+def _tier(buffered, distance, holds):
+    """The buffered geometry simplified as far as it still holds; None if it never does."""
+    for tolerance in (distance / 2, distance / 8):
+        tier = shapely.simplify(buffered, tolerance)
+        if not tier.is_empty and holds(tier):
+            return tier
+    return None
+
+
+def build_tiers(geometry, band=TIER_BAND, max_band=TIER_BAND_MAX_DEG):
+    """
+    The coarse tiers of a map as (outer, core): simplified shapes with outer covering the
+    geometry and the geometry covering core, about band * the map's size (at most max_band
+    degrees) apart. Either is None if it can't be built (core for maps thinner than the band),
+    and lookups then skip it.
+    """
+    minx, miny, maxx, maxy = geometry.bounds
+    distance = min(band * max(maxx - minx, maxy - miny), max_band)
+    if distance <= 0:
+        return None, None
+    buffer_args = {"quad_segs": 1, "join_style": "mitre", "mitre_limit": 1.5}
+    outer = _tier(shapely.buffer(geometry, distance, **buffer_args), distance,
+                  lambda tier: shapely.covers(tier, geometry))
+    core = _tier(shapely.buffer(geometry, -distance, **buffer_args), distance,
+                 lambda tier: shapely.covers(geometry, tier))
+    return outer, core
+
+
+def read_geojson_geometries(geojson_path):
+    """
+    Reads a .geojson and returns a list of shapely geometries, one per feature.
+    Accepts a FeatureCollection, a single Feature or a bare geometry.
+    """
+    with open(geojson_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if data.get('type') == 'FeatureCollection':
+        return [shape(feat['geometry']) for feat in data['features']]
+    if data.get('type') == 'Feature':
+        return [shape(data['geometry'])]
+    return [shape(data)]
+
+
+def union_geojson(geojson_path):
+    """
+    Parses a .geojson and unions all of its features into one repaired, oriented geometry
+    (not prepared; see geometry_validation). Raises ValueError if there is nothing to union.
+    """
+    unified, report = normalize_geometries(read_geojson_geometries(geojson_path))
+    if report["invalidFeatures"] or report["droppedParts"] or report["droppedHoles"]:
+        logging.warning("[union_geojson] %s: repaired %s invalid features, dropped %s slivers and %s holes",
+                        os.path.basename(geojson_path), len(report["invalidFeatures"]),
+                        report["droppedParts"], report["droppedHoles"])
+    return unified
+
+
+def _build_entry(path, mtime):
+    """Load (from the map bundle if fresh, else parse + union) and prepare one map file."""
+    start = time.perf_counter()
+    compiled = map_bundle.load_tiers(path, mtime)
+    if compiled is not None:
+        # Full geometry stays in the bundle until a lookup needs it
+        entry = MapGeometry(os.path.basename(path), path, mtime, compiled["geometry"],
+                            compiled["tiers"], compiled["bounds"], compiled["area"],
+                            (compiled["centroid"], compiled["vertices"]))
+        source = "bundle"
+    else:
+        entry = MapGeometry(os.path.basename(path), path, mtime, union_geojson(path))
+        source = "geojson"
+
+    elapsed = time.perf_counter() - start
+    GEOMETRY_LOAD_SECONDS.observe(elapsed)
+    logging.debug("[geometry_registry] Loaded %s from %s in %.1fms", entry.name, source, elapsed * 1000)
+    return entry
+
+
+def get_map_geometry(geojson_path):
+    """
+    Returns the cached MapGeometry for a .geojson path, parsing it on first use
+    or when the file changed on disk since it was cached.
+    Raises FileNotFoundError if the file is missing, ValueError if it is empty.
+    """
+    path = os.path.abspath(geojson_path)
+    mtime = os.stat(path).st_mtime_ns
+
+    entry = _CACHE.get(path)
+    if entry is not None and entry.mtime == mtime:
+        return entry
+
+    with _BUILD_LOCKS_GUARD:
+        lock = _BUILD_LOCKS.setdefault(path, threading.Lock())
+    with lock:
+        # Another thread may have built it while we waited
+        entry = _CACHE.get(path)
+        if entry is not None and entry.mtime == mtime:
+            return entry
+        entry = _build_entry(path, mtime)
+        _CACHE[path] = entry
+        return entry
+
+
+def cached_maps():
+    """Every MapGeometry currently in the cache."""
+    return list(_CACHE.values())
+
+
+def invalidate(geojson_path=None):
+    """Drops one cached map (by path), or every cached map if no path is given."""
+    if geojson_path is None:
+        _CACHE.clear()
+    else:
+        _CACHE.pop(os.path.abspath(geojson_path), None)
+
+
+def warm_up(maps_dir=MAPS_DIR):
+    """
+    Parses every .geojson in maps_dir into the cache.
+    Broken files are logged and skipped. Returns the number of maps loaded.
+    """
+    start = time.perf_counter()
+    loaded = 0
+    for fname in sorted(os.listdir(maps_dir)):
+        if not fname.lower().endswith('.geojson'):
+            continue
+        try:
+            get_map_geometry(os.path.join(maps_dir, fname))
+            loaded += 1
+        except Exception:
+            logging.exception("[geometry_registry] Failed to load %s", fname)
+    logging.info("[geometry_registry] Warmed up %s maps in %.2fs", loaded, time.perf_counter() - start)
+    return loaded
@@ -0,0 +1,175 @@
+"""
+geometry_validation.py
+
+Validation and repair of map geometry, the stage every loader goes through
+(geometry_registry.union_geojson, and with it the map bundle and both game modes):
+ - normalize_geometries(geoms) -> (geometry, report): make_valid on invalid features, keep only
+   their polygonal parts, union, drop zero-area / sliver parts and holes, orient rings
+   (exterior counter-clockwise, holes clockwise, as RFC 7946 asks)
+ - map_report(path) -> the report of one .geojson plus sampler figures: triangles,
+   bounding-box acceptance rate (what OTTERGUESSR_SAMPLER=rejection would get)
+ - check_baseline(report) -> (problems, warnings) of a map against the baseline below
+
+Baseline per map: loads and repairs to a non-empty valid polygonal geometry of at most
+MAX_VERTICES vertices. A bounding-box acceptance under MIN_ACCEPTANCE (e.g. a map spanning
+the antimeridian) is only a warning: just the rejection sampler depends on it.
+
+Usage (report for all maps; exits with 1 if any map misses the baseline):
+  python geometry_validation.py [--maps assets/maps] [--out report.json]
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+
+import shapely
+from shapely.geometry import MultiPolygon, Polygon
+
+# Parts and holes smaller than this (in degrees², about 10 m² at the equator) are dropped
+MIN_PART_AREA = 1e-9
+# Parts under SLIVER_MAX_AREA (~1 km²) with an isoperimetric quotient 4*pi*A/P² under
+# SLIVER_COMPACTNESS are slivers (artifacts of repair or of neighbouring borders)
+SLIVER_MAX_AREA = 1e-4
+SLIVER_COMPACTNESS = 1e-3
+MAX_VERTICES = 50000
+MIN_ACCEPTANCE = 0.01
+
+
+def _polygonal(geom):
+    """The Polygon parts of any geometry (make_valid may return lines and points alongside)."""
+    polygons = []
+    for part in shapely.get_parts(geom):
+        if part.geom_type == "Polygon":
+            polygons.append(part)
+        elif part.geom_type in ("MultiPolygon", "GeometryCollection"):
+            polygons.extend(_polygonal(part))
+    return polygons
+
+
+def _is_sliver(area, length):
+    if area < MIN_PART_AREA:
+        return True
+    return area < SLIVER_MAX_AREA and 4 * math.pi * area / (length * length) < SLIVER_COMPACTNESS
+
+
+def _clean_polygon(poly, report):
+    holes = [ring for ring in poly.interiors if Polygon(ring).area >= MIN_PART_AREA]
+    report["droppedHoles"] += len(poly.interiors) - len(holes)
+    return Polygon(poly.exterior, holes) if len(holes) != len(poly.interiors) else poly
+
+
+def normalize_geometries(geometries):
+    """
+    Repairs and unions the features of one map. Returns (geometry, report); the geometry is a
+    valid, oriented Polygon or MultiPolygon. Raises ValueError if nothing polygonal is left.
+    """
+    report = {
+        "features": len(geometries),
+        "inputVertices": 0,
+        "invalidFeatures": [],
+        "droppedParts": 0,
+        "droppedArea": 0.0,
+        "droppedHoles": 0
+    }
+    parts = []
+    for index, geom in enumerate(geometries):
+        if geom is None or geom.is_empty:
+            continue
+        report["inputVertices"] += int(shapely.get_num_coordinates(geom))
+        if not geom.is_valid:
+            report["invalidFeatures"].append({"feature": index, "reason": shapely.is_valid_reason(geom)})
+            geom = shapely.make_valid(geom)
+        parts.extend(_polygonal(geom))
+    if not parts:
+        raise ValueError("No Shapely geometry can be created from the .geojson")
+
+    unified = shapely.union_all(parts)
+    kept = []
+    for poly in _polygonal(unified):
+        if _is_sliver(poly.area, poly.length):
+            report["droppedParts"] += 1
+            report["droppedArea"] += poly.area
+            continue
+        kept.append(_clean_polygon(poly, report))
+    if not kept:
+        raise ValueError("Only zero-area parts in the .geojson")
+
+    geometry = shapely.orient_polygons(kept[0] if len(kept) == 1 else MultiPolygon(kept))
+    report["parts"] = len(kept)
+    report["holes"] = sum(len(poly.interiors) for poly in kept)
+    report["vertices"] = int(shapely.get_num_coordinates(geometry))
+    report["valid"] = bool(geometry.is_valid)
+    report["area"] = geometry.area
+    return geometry, report
+
+
+def map_report(geojson_path):
+    """Validation report of one map file incl. sampler figures; {"error": ...} if it can't be loaded."""
+    from geometry_registry import read_geojson_geometries
+    from point_sampler import TriangleSampler
+
+    name = os.path.basename(geojson_path)
+    try:
+        geometry, report = normalize_geometries(read_geojson_geometries(geojson_path))
+    except Exception as e:
+        return {"map": name, "error": str(e)}
+    minx, miny, maxx, maxy = geometry.bounds
+    bbox_area = (maxx - minx) * (maxy - miny)
+    report["map"] = name
+    report["acceptanceRate"] = round(geometry.area / bbox_area, 4) if bbox_area else None
+    report["triangles"] = len(TriangleSampler(geometry))
+    return report
+
+
+def check_baseline(report):
+    """(problems, warnings) of a map_report(); the map meets the baseline if problems is empty."""
+    if "error" in report:
+        return [report["error"]], []
+    problems = []
+    warnings = []
+    if not report["valid"]:
+        problems.append("still invalid after repair")
+    if report["vertices"] > MAX_VERTICES:
+        problems.append(f"{report['vertices']} vertices (max {MAX_VERTICES})")
+    if report["acceptanceRate"] is not None and report["acceptanceRate"] < MIN_ACCEPTANCE:
+        warnings.append(f"bounding-box acceptance {report['acceptanceRate']} (min {MIN_ACCEPTANCE})")
+    return problems, warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and repair all maps, report per map")
+    parser.add_argument("--maps", default=os.path.join(os.path.dirname(__file__), "assets", "maps"))
+    parser.add_argument("--out", help="write the full report as JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    reports = []
+    failing = 0
+    for fname in sorted(os.listdir(args.maps)):
+        if not fname.lower().endswith(".geojson"):
+            continue
+        report = map_report(os.path.join(args.maps, fname))
+        report["problems"], report["warnings"] = check_baseline(report)
+        reports.append(report)
+        failing += bool(report["problems"])
+        if "error" in report:
+            print(f"{fname:<40} ERROR {report['error']}")
+            continue
+        repaired = f"repaired {len(report['invalidFeatures'])}" if report["invalidFeatures"] else ""
+        dropped = f"dropped {report['droppedParts']} parts/{report['droppedHoles']} holes" \
+            if report["droppedParts"] or report["droppedHoles"] else ""
+        print(f"{fname:<40} {report['vertices']:>7} vertices {report['triangles']:>6} triangles "
+              f"acceptance {report['acceptanceRate']:<6} {repaired} {dropped} {'; '.join(report['problems'] + report['warnings'])}")
+    print(f"{len(reports)} maps, {failing} below the baseline")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+    sys.exit(1 if failing else 0)
+
+
+if __name__ == "__main__":
+    main()
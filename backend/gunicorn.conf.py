@@ -0,0 +1,26 @@
+"""
+gunicorn.conf.py
+
+Multi-worker production config: gunicorn -c gunicorn.conf.py (from backend/)
+
+preload_app makes the master run wsgi.create_app() once before forking, so every worker
+starts with all maps and sampling tables already loaded. Set OTTERGUESSR_DB_PATH so
+workers share games through SQLite (see game_persistence); without it each worker only
+knows the games it created.
+"""
+
+import gc
+import multiprocessing
+import os
+
+wsgi_app = "wsgi:create_app()"
+bind = os.environ.get("OTTERGUESSR_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("OTTERGUESSR_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("OTTERGUESSR_THREADS", 4))
+preload_app = True
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the GC's reach, so collections in the
+    # workers don't touch (and un-share) the preloaded objects' pages
+    gc.freeze()
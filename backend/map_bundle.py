@@ -0,0 +1,256 @@
+"""
+map_bundle.py
+
+Offline map compiler: every .geojson of a maps directory in one versioned, memory-mapped
+bundle, so a process can load all maps without parsing any GeoJSON:
+ - compile_bundle(maps_dir, path) -> per map the WKB of the repaired, unioned geometry
+   (geometry_validation) and of its coarse precision tiers (geometry_registry.build_tiers),
+   its bounds, area, centroid and vertex count, and the triangulation tables point_sampler uses (sampling_tables
+   file format)
+ - attach(path) -> maps a bundle for lookups; bundles of another BUNDLE_VERSION or tier band
+   (OTTERGUESSR_TIER_BAND*) are refused
+ - load_tiers(geojson_path, mtime) / sampling_arrays(...) -> the compiled map, or None
+   if the bundle has no fresh entry for that file. The full geometry is returned as a
+   loader, so its WKB is only decoded if a lookup needs it
+ - stale_maps(maps_dir) -> the maps a recompile would change (new, edited, or removed from
+   the bundle); maps that failed to compile count as stale only once their file changes
+
+geometry_registry and point_sampler load through this module, so load_geojson_polygons and
+parse_geojson_and_get_polygon read the bundle and only parse the raw .geojson of maps that
+are missing from it or changed since it was compiled.
+
+An entry is fresh when the file's mtime and size match the compiled ones or, if only the
+mtime differs (a fresh git checkout, a copied tree), when its SHA-1 does.
+Without an explicit attach(), the bundle at OTTERGUESSR_BUNDLE_PATH (default
+assets/maps.bundle) is attached on first use if it exists.
+
+Usage:
+  python map_bundle.py [--maps assets/maps] [--out assets/maps.bundle]
+"""
+
+import argparse
+import functools
+import hashlib
+import logging
+import os
+import threading
+
+import numpy as np
+import shapely
+
+import sampling_tables
+
+# 2: geometry repaired and oriented by geometry_validation before compiling
+# 3: outer / core precision tiers
+# 4: centroid and vertex count per map
+BUNDLE_VERSION = 4
+DEFAULT_BUNDLE_PATH = os.environ.get(
+    "OTTERGUESSR_BUNDLE_PATH", os.path.join(os.path.dirname(__file__), "assets", "maps.bundle"))
+
+
+def _sha1(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _tier_band():
+    """The tier settings compiled tiers depend on; a bundle built with others is outdated."""
+    from geometry_registry import TIER_BAND, TIER_BAND_MAX_DEG
+    return [TIER_BAND, TIER_BAND_MAX_DEG]
+
+
+def _wkb_array(geometry):
+    """WKB as a uint8 array; empty for a missing tier."""
+    if geometry is None:
+        return np.zeros(0, dtype=np.uint8)
+    return np.frombuffer(shapely.to_wkb(geometry), dtype=np.uint8)
+
+
+def _from_wkb_array(array):
+    return shapely.from_wkb(array.tobytes()) if len(array) else None
+
+
+def compile_bundle(maps_dir, path=DEFAULT_BUNDLE_PATH):
+    """
+    Parses, unions and triangulates every map in maps_dir (always from the .geojson, never
+    from an attached bundle) and writes the bundle. Maps that fail are logged and left out,
+    so they keep loading from their .geojson. Returns the number of maps compiled.
+    """
+    from geometry_registry import build_tiers, geometry_summary, union_geojson
+    from point_sampler import TriangleSampler
+
+    entries = {}
+    skipped = {}
+    for fname in sorted(os.listdir(maps_dir)):
+        if not fname.lower().endswith(".geojson"):
+            continue
+        geo_path = os.path.join(maps_dir, fname)
+        try:
+            stat = os.stat(geo_path)
+            geometry = union_geojson(geo_path)
+            outer, core = build_tiers(geometry)
+            centroid, vertices = geometry_summary(geometry)
+            sampler = TriangleSampler(geometry)
+        except Exception:
+            logging.exception("[map_bundle] Skipping %s", fname)
+            skipped[fname] = _sha1(geo_path)
+            continue
+        entries[fname] = {
+            "meta": {
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha1": _sha1(geo_path),
+                "bounds": list(geometry.bounds),
+                "area": geometry.area,
+                "centroid": list(centroid),
+                "vertices": vertices
+            },
+            "arrays": {
+                "wkb": _wkb_array(geometry),
+                "outer_wkb": _wkb_array(outer),
+                "core_wkb": _wkb_array(core),
+                "triangles": sampler.triangles,
+                "cum_areas": sampler.cum_areas
+            }
+        }
+    meta = {"bundleVersion": BUNDLE_VERSION, "tierBand": _tier_band(), "skipped": skipped}
+    sampling_tables.write_tables(path, entries, meta=meta)
+    logging.info("[map_bundle] Compiled %s maps into %s", len(entries), path)
+    return len(entries)
+
+
+class MapBundle:
+    """An attached bundle; 'is_fresh' answers are remembered per (name, mtime)."""
+
+    def __init__(self, path):
+        self.tables = sampling_tables.MappedTables(path)
+        version = self.tables.file_meta.get("bundleVersion")
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"{path} is bundle version {version}, expected {BUNDLE_VERSION}")
+        band = self.tables.file_meta.get("tierBand")
+        if band != _tier_band():
+            raise ValueError(f"{path} has tiers for band {band}, expected {_tier_band()}")
+        self.path = path
+        self._fresh = {}
+
+    def is_fresh(self, geojson_path, mtime=None):
+        """True if the bundle holds this exact file (see the module docstring)."""
+        name = os.path.basename(geojson_path)
+        meta = self.tables.meta(name)
+        if meta is None:
+            return False
+        stat = os.stat(geojson_path)
+        mtime = stat.st_mtime_ns if mtime is None else mtime
+        key = (name, mtime)
+        fresh = self._fresh.get(key)
+        if fresh is None:
+            if stat.st_size != meta["size"]:
+                fresh = False
+            else:
+                fresh = meta["mtime"] == mtime or _sha1(geojson_path) == meta["sha1"]
+            self._fresh[key] = fresh
+        return fresh
+
+    def is_skipped(self, geojson_path):
+        """True if this exact file failed to compile into the bundle (recompiling won't help)."""
+        sha1 = self.tables.file_meta.get("skipped", {}).get(os.path.basename(geojson_path))
+        return sha1 is not None and _sha1(geojson_path) == sha1
+
+    def geometry(self, name):
+        """Unioned shapely geometry of a compiled map (not prepared)."""
+        return _from_wkb_array(self.tables.get(name)["wkb"])
+
+    def tiers(self, name):
+        """(outer, core) precision tiers of a compiled map (not prepared; either may be None)."""
+        arrays = self.tables.get(name)
+        return _from_wkb_array(arrays["outer_wkb"]), _from_wkb_array(arrays["core_wkb"])
+
+    def sampling_arrays(self, name):
+        """{"triangles", "cum_areas"}: read-only views into the mapping."""
+        arrays = self.tables.get(name)
+        return {"triangles": arrays["triangles"], "cum_areas": arrays["cum_areas"]}
+
+
+_ATTACHED = None
+_AUTO_ATTACH_TRIED = False
+_ATTACH_LOCK = threading.Lock()
+
+
+def attach(path=DEFAULT_BUNDLE_PATH):
+    """Maps a bundle for the lookups below. Returns False if it is missing, unreadable or outdated."""
+    global _ATTACHED, _AUTO_ATTACH_TRIED
+    try:
+        bundle = MapBundle(path)
+    except (OSError, ValueError) as e:
+        logging.warning("[map_bundle] Could not attach %s: %s", path, e)
+        return False
+    with _ATTACH_LOCK:
+        _ATTACHED = bundle
+        _AUTO_ATTACH_TRIED = True
+    logging.info("[map_bundle] Attached %s maps from %s", len(bundle.tables.names()), path)
+    return True
+
+
+def _bundle():
+    global _AUTO_ATTACH_TRIED
+    if _ATTACHED is None and not _AUTO_ATTACH_TRIED:
+        _AUTO_ATTACH_TRIED = True
+        if os.path.isfile(DEFAULT_BUNDLE_PATH):
+            attach(DEFAULT_BUNDLE_PATH)
+    return _ATTACHED
+
+
+def load_tiers(geojson_path, mtime=None):
+    """
+    The compiled map for a .geojson path if the bundle is fresh for it, else None:
+    {"bounds", "area", "centroid": (lat, lng), "vertices", "tiers": (outer, core),
+     "geometry": function loading the full geometry}
+    """
+    bundle = _bundle()
+    if bundle is None or not bundle.is_fresh(geojson_path, mtime):
+        return None
+    name = os.path.basename(geojson_path)
+    meta = bundle.tables.meta(name)
+    return {
+        "bounds": meta["bounds"],
+        "area": meta["area"],
+        "centroid": tuple(meta["centroid"]),
+        "vertices": meta["vertices"],
+        "tiers": bundle.tiers(name),
+        "geometry": functools.partial(bundle.geometry, name)
+    }
+
+
+def sampling_arrays(geojson_path, mtime=None):
+    """The compiled triangulation tables for a .geojson path if fresh, else None."""
+    bundle = _bundle()
+    if bundle is None or not bundle.is_fresh(geojson_path, mtime):
+        return None
+    return bundle.sampling_arrays(os.path.basename(geojson_path))
+
+
+def stale_maps(maps_dir):
+    """Filenames in maps_dir that a recompile would add or update (all of them without a bundle)."""
+    bundle = _bundle()
+    names = sorted(f for f in os.listdir(maps_dir) if f.lower().endswith(".geojson"))
+    if bundle is None:
+        return names
+    stale = []
+    for name in names:
+        path = os.path.join(maps_dir, name)
+        if not bundle.is_fresh(path) and not bundle.is_skipped(path):
+            stale.append(name)
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile all maps into one memory-mappable bundle")
+    parser.add_argument("--maps", default=os.path.join(os.path.dirname(__file__), "assets", "maps"))
+    parser.add_argument("--out", default=DEFAULT_BUNDLE_PATH)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    compile_bundle(args.maps, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+map_catalog.py
+
+The /maps catalogue, built once and served as pre-serialized bytes:
+ - MapCatalog(maps_dir) -> list of .geojson files, rescanned at most every check_interval_s
+   and rebuilt only when a file was added, removed or modified
+ - listing(details=False) -> (body_bytes, etag) for the plain filename list, or with
+   per-map metadata (display name, bounds, area, vertex count, centroid)
+ - MAP_CATALOG -> the process-wide catalogue over assets/maps
+
+ETags are strong (a hash of the exact body), so clients can revalidate with If-None-Match
+and get a 304 instead of the list. Metadata needs every map loaded (from the map bundle
+when fresh, which has it precomputed: no full geometry is decoded), so it is only built on
+the first ?details=1 request and kept per (file, mtime) afterwards.
+
+Config (env): OTTERGUESSR_MAPS_CHECK_S -> rescan interval (default 2)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from geometry_registry import MAPS_DIR, get_map_geometry
+
+MAPS_CHECK_S = float(os.environ.get("OTTERGUESSR_MAPS_CHECK_S", 2.0))
+
+
+def display_name(filename):
+    """'United_States.geojson' -> 'United States'"""
+    return os.path.splitext(filename)[0].replace("_", " ")
+
+
+def map_metadata(filename, map_geom):
+    """Picker metadata for one map; only name + displayName if it could not be loaded."""
+    meta = {"name": filename, "displayName": display_name(filename)}
+    if map_geom is None:
+        return meta
+    meta.update({
+        "bounds": [round(v, 6) for v in map_geom.bounds],
+        "area": round(map_geom.area, 6),
+        "vertexCount": map_geom.vertex_count,
+        "centroid": [round(v, 6) for v in map_geom.centroid]
+    })
+    return meta
+
+
+def _serialize(payload):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return body, hashlib.sha1(body).hexdigest()
+
+
+class MapCatalog:
+    """Cached map listing for one directory. Thread-safe."""
+
+    def __init__(self, maps_dir=MAPS_DIR, check_interval_s=MAPS_CHECK_S):
+        self.maps_dir = maps_dir
+        self.check_interval_s = check_interval_s
+        self._lock = threading.Lock()
+        self._signature = None
+        self._next_check = 0.0
+        self._listing = None
+        self._details = None
+        # filename -> (mtime_ns, metadata dict)
+        self._meta_cache = {}
+
+    def _scan(self):
+        """((filename, mtime_ns), ...) of every .geojson, sorted by name."""
+        with os.scandir(self.maps_dir) as it:
+            return tuple(sorted(
+                (e.name, e.stat().st_mtime_ns) for e in it
+                if e.is_file() and e.name.lower().endswith(".geojson")
+            ))
+
+    def _refresh(self):
+        """Rescans the directory if the check interval passed. Caller holds the lock."""
+        now = time.monotonic()
+        if self._signature is not None and now < self._next_check:
+            return
+        self._next_check = now + self.check_interval_s
+        signature = self._scan()
+        if signature == self._signature:
+            return
+        self._signature = signature
+        self._listing = _serialize([name for name, _ in signature])
+        self._details = None
+        logging.debug("[MapCatalog] Rebuilt listing with %s maps", len(signature))
+
+    def _build_details(self):
+        entries = []
+        for name, mtime in self._signature:
+            cached = self._meta_cache.get(name)
+            if cached is None or cached[0] != mtime:
+                try:
+                    map_geom = get_map_geometry(os.path.join(self.maps_dir, name))
+                except Exception:
+                    logging.exception("[MapCatalog] No metadata for %s", name)
+                    map_geom = None
+                cached = (mtime, map_metadata(name, map_geom))
+                self._meta_cache[name] = cached
+            entries.append(cached[1])
+        return _serialize(entries)
+
+    def listing(self, details=False):
+        """Returns (body_bytes, etag) for the current catalogue."""
+        with self._lock:
+            self._refresh()
+            if not details:
+                return self._listing
+            if self._details is None:
+                self._details = self._build_details()
+            return self._details
+
+    def names(self):
+        with self._lock:
+            self._refresh()
+            return [name for name, _ in self._signature]
+
+    def signature(self):
+        """((filename, mtime_ns), ...) as of the last rescan; changes whenever a map does."""
+        with self._lock:
+            self._refresh()
+            return self._signature
+
+
+MAP_CATALOG = MapCatalog()
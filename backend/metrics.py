@@ -0,0 +1,329 @@
+"""
+metrics.py
+
+In-process metrics in the Prometheus text format (served at /metrics by app.py):
+ - Counter, Gauge, Histogram -> labelled metrics, thread-safe, registered on creation
+ - CallbackMetric -> values read from existing stats() at scrape time (store sizes, evictions, pools)
+ - render() -> every registered metric as Prometheus text exposition (version 0.0.4)
+ - instrument_flask(app) -> per-route request latency for a Flask app
+ - trace(name) / span(stage) -> optional per-stage timing of one operation (e.g. create_custom_game)
+
+Metrics live in the memory of one process: with several gunicorn workers each scrape of
+/metrics sees the worker that answered it.
+
+Tracing is off unless OTTERGUESSR_TRACING=1. Then every span inside a trace() is observed
+in otterguessr_stage_seconds{trace, stage} and the whole trace is logged at DEBUG.
+Without an active trace, span() is a shared no-op context manager.
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+
+TRACING = os.environ.get("OTTERGUESSR_TRACING", "").lower() in ("1", "true", "yes")
+
+# Seconds; from sub-millisecond cache hits to slow cold map loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Candidates drawn per accepted point / round
+ATTEMPT_BUCKETS = (1.0, 1.25, 1.5, 2.0, 3.0, 5.0, 10.0, 25.0, 100.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Every metric of the process, rendered in registration order."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered.")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                logging.exception("[metrics] Could not collect %s", metric.name)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. counter.inc("Austria.geojson")."""
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}_total{_label_text(self.labels, label_values)} {_number(value)}"
+
+
+class Gauge(_Metric):
+    """Value that goes up and down."""
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_label_text(self.labels, label_values)} {_number(value)}"
+
+
+class _HistogramTimer:
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+
+class Histogram(_Metric):
+    """Cumulative buckets + sum + count per label set."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels, registry)
+
+    def observe(self, value, *label_values):
+        self.observe_many(value, 1, *label_values)
+
+    def observe_many(self, value, count, *label_values):
+        """Adds 'count' observations of the same value (e.g. one per point of a batch)."""
+        if count <= 0:
+            return
+        # Index of the first bucket the value fits in; len(buckets) means +Inf only
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += count
+            state[1] += value * count
+            state[2] += count
+
+    def time(self, *label_values):
+        """Context manager observing the seconds spent inside it."""
+        return _HistogramTimer(self, label_values)
+
+    def count(self, *label_values):
+        state = self._values.get(label_values)
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(lv, (list(s[0]), s[1], s[2])) for lv, s in self._values.items()]
+        for label_values, (per_bucket, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), per_bucket):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_label_text(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labels, label_values)} {_number(total)}"
+            yield f"{self.name}_count{_label_text(self.labels, label_values)} {count}"
+
+
+class CallbackMetric(_Metric):
+    """
+    Gauge or counter read at scrape time: fn() returns [(label_values, value), ...].
+    For numbers other modules already keep (store sizes, evictions, pool depth).
+    """
+
+    def __init__(self, name, help, kind, labels, fn, registry=REGISTRY):
+        self.kind = kind
+        self.fn = fn
+        super().__init__(name, help, labels, registry)
+
+    def samples(self):
+        suffix = "_total" if self.kind == "counter" else ""
+        for label_values, value in self.fn():
+            yield f"{self.name}{suffix}{_label_text(self.labels, tuple(label_values))} {_number(value)}"
+
+
+def render():
+    return REGISTRY.render()
+
+
+# --- Request latency ---------------------------------------------------------
+
+REQUEST_SECONDS = Histogram(
+    "otterguessr_request_seconds",
+    "Request latency by route template, method and status.",
+    ("route", "method", "status")
+)
+
+
+def instrument_flask(app):
+    """Times every request of a Flask app into REQUEST_SECONDS (until the response is returned)."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, rule, request.method, str(response.status_code))
+        return response
+
+    return app
+
+
+# --- Tracing -----------------------------------------------------------------
+
+STAGE_SECONDS = Histogram(
+    "otterguessr_stage_seconds",
+    "Time per stage of a traced operation (OTTERGUESSR_TRACING=1).",
+    ("trace", "stage")
+)
+
+_CURRENT_TRACE = contextvars.ContextVar("otterguessr_trace", default=None)
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL = _NullContext()
+
+
+class Trace:
+    """One traced operation: its name and the (stage, seconds) of every span, in order."""
+    __slots__ = ("name", "spans", "start", "_token")
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = _CURRENT_TRACE.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _CURRENT_TRACE.reset(self._token)
+        total = time.perf_counter() - self.start
+        for stage, seconds in self.spans:
+            STAGE_SECONDS.observe(seconds, self.name, stage)
+        STAGE_SECONDS.observe(total, self.name, "total")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            stages = ", ".join(f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in self.spans)
+            logging.debug("[trace] %s %.2fms: %s%s", self.name, total * 1000, stages,
+                          " (failed)" if exc_type is not None else "")
+        return False
+
+
+class _Span:
+    __slots__ = ("trace", "stage", "start")
+
+    def __init__(self, trace, stage):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.spans.append((self.stage, time.perf_counter() - self.start))
+        return False
+
+
+def trace(name):
+    """Starts a trace (if tracing is enabled); spans opened inside it are recorded."""
+    return Trace(name) if TRACING else _NULL
+
+
+def span(stage):
+    """Times one stage of the current trace; a no-op outside of a trace."""
+    current = _CURRENT_TRACE.get()
+    return _Span(current, stage) if current is not None else _NULL
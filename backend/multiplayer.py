@@ -0,0 +1,370 @@
+"""
+multiplayer.py
+
+Real-time multiplayer rooms (served over WebSockets by asgi.py):
+ - Room -> one shared set of rounds, a host, players, a round timer (timeLimit per round)
+ - Player -> one connection with a bounded outgoing queue and its own sender task
+ - RoomManager -> create / get / drop rooms, reaps finished and abandoned ones
+ - ROOMS -> the process-wide manager
+
+Protocol (JSON text frames).
+Client -> server:
+  {"type": "start"}                      host only, starts round 1
+  {"type": "guess", "lat": .., "lng": ..}
+Server -> client:
+  "welcome" (own playerId + snapshot), "player_joined", "player_left", "round_start",
+  "guess" (scoreboard delta: who guessed, points, new total, guessed count),
+  "round_end" (correct location + every result), "game_over" (final scoreboard),
+  "snapshot" (full state, sent instead of a backlog to a client that fell behind)
+
+Fan-out: each event is serialized once and the same string is queued to every player.
+Backpressure: a full queue is never awaited. The player's backlog is replaced by one
+snapshot, so a slow client catches up without stalling the room. After MAX_RESYNCS
+overflows in a row the player is disconnected.
+
+Rooms live in the memory of one process: run a single ASGI worker for rooms, or route
+a room's clients to the same worker.
+
+Config (env):
+  OTTERGUESSR_MAX_ROOMS          -> rooms per process (default 1000)
+  OTTERGUESSR_ROOM_QUEUE         -> outgoing messages buffered per player (default 64)
+  OTTERGUESSR_ROOM_INTERMISSION_S -> pause between rounds (default 5)
+"""
+
+import asyncio
+import logging
+import math
+import os
+import secrets
+import time
+
+import scoring
+from game_export import dumps
+from metrics import CallbackMetric
+
+MAX_ROOMS = int(os.environ.get("OTTERGUESSR_MAX_ROOMS", 1000))
+ROOM_QUEUE = int(os.environ.get("OTTERGUESSR_ROOM_QUEUE", 64))
+INTERMISSION_S = float(os.environ.get("OTTERGUESSR_ROOM_INTERMISSION_S", 5))
+MAX_PLAYERS = 16
+MAX_RESYNCS = 3
+# Finished rooms stay readable (GET /rooms/<id>) this long, empty lobbies survive this long
+ROOM_LINGER_S = 300.0
+
+
+class Player:
+    """
+    One connected player. 'conn' needs async send_text(str) and close(code);
+    a Starlette WebSocket fits.
+    """
+    __slots__ = ("id", "name", "conn", "queue", "sender", "total", "resyncs", "connected")
+
+    def __init__(self, player_id, name, conn, queue_size=None):
+        self.id = player_id
+        self.name = name
+        self.conn = conn
+        self.queue = asyncio.Queue(maxsize=queue_size or ROOM_QUEUE)
+        self.sender = None
+        self.total = 0
+        self.resyncs = 0
+        self.connected = True
+
+    def offer(self, message, room):
+        """Queues a serialized message without ever waiting. Returns False if the player was dropped."""
+        if not self.connected:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            self.resyncs = 0
+            return True
+        except asyncio.QueueFull:
+            pass
+        # Too slow: throw the backlog away and send the current state instead
+        self.resyncs += 1
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        if self.resyncs > MAX_RESYNCS:
+            logging.info("[Room:%s] Dropping slow player %s", room.id, self.id)
+            room.dropped += 1
+            self.connected = False
+            self.queue.put_nowait(None)
+            return False
+        room.resyncs += 1
+        self.queue.put_nowait(dumps(room.snapshot(message_type="snapshot")).decode("utf-8"))
+        return True
+
+    async def send_loop(self):
+        """Drains the queue into the connection. One task per player."""
+        try:
+            while True:
+                message = await self.queue.get()
+                if message is None:
+                    break
+                await self.conn.send_text(message)
+        except Exception:
+            # Connection gone; the receive side notices and removes the player
+            pass
+        finally:
+            self.connected = False
+            try:
+                await self.conn.close(code=1013)
+            except Exception:
+                pass
+
+
+class Room:
+    """One multiplayer game. All methods run on the event loop, so no locks are needed."""
+
+    def __init__(self, room_id, map_file, time_limit, rounds, mode="classic"):
+        """rounds: pooled entries (lat, lng, panoLat, panoLng, panoId), see round_pool"""
+        self.id = room_id
+        self.map_file = map_file
+        self.time_limit = time_limit
+        self.mode = mode
+        self.correct = [(r[2], r[3], r[4]) for r in rounds]
+        self.players = {}
+        self.host_id = None
+        self.state = "lobby"
+        self.round_index = -1
+        self.deadline = None
+        # round index -> {playerId: (lat, lng, distanceKm, points)}
+        self.guesses = [dict() for _ in self.correct]
+        self.created = time.monotonic()
+        self.finished_at = None
+        self.messages_sent = 0
+        self.resyncs = 0
+        self.dropped = 0
+        self._all_guessed = asyncio.Event()
+        self._timer = None
+
+    @property
+    def round_count(self):
+        return len(self.correct)
+
+    def scoreboard(self):
+        return sorted(
+            ({"playerId": p.id, "name": p.name, "total": p.total} for p in self.players.values()),
+            key=lambda row: -row["total"]
+        )
+
+    def snapshot(self, message_type="snapshot"):
+        return {
+            "type": message_type,
+            "roomId": self.id,
+            "mapFile": self.map_file,
+            "timeLimit": self.time_limit,
+            "roundCount": self.round_count,
+            "state": self.state,
+            "roundIndex": self.round_index,
+            "secondsLeft": max(0.0, self.deadline - time.monotonic()) if self.deadline else None,
+            "hostId": self.host_id,
+            "guessed": list(self.guesses[self.round_index]) if 0 <= self.round_index < self.round_count else [],
+            "scoreboard": self.scoreboard()
+        }
+
+    def broadcast(self, payload):
+        """Serializes once, queues the same string to every connected player."""
+        message = dumps(payload).decode("utf-8")
+        for player in list(self.players.values()):
+            if player.offer(message, self):
+                self.messages_sent += 1
+
+    def join(self, conn, name):
+        """Adds a connection as a player and starts its sender. Raises ValueError if the room is closed or full."""
+        if self.state == "finished":
+            raise ValueError("Room is finished.")
+        if len(self.players) >= MAX_PLAYERS:
+            raise ValueError("Room is full.")
+        player = Player(secrets.token_urlsafe(6), (name or "Player")[:32], conn)
+        self.players[player.id] = player
+        if self.host_id is None:
+            self.host_id = player.id
+        player.sender = asyncio.ensure_future(player.send_loop())
+        welcome = self.snapshot(message_type="welcome")
+        welcome["playerId"] = player.id
+        player.offer(dumps(welcome).decode("utf-8"), self)
+        self.broadcast({"type": "player_joined", "playerId": player.id, "name": player.name})
+        return player
+
+    def leave(self, player):
+        if self.players.pop(player.id, None) is None:
+            return
+        player.connected = False
+        if player.queue.full():
+            player.queue.get_nowait()
+        player.queue.put_nowait(None)
+        if self.host_id == player.id:
+            self.host_id = next(iter(self.players), None)
+        self.broadcast({"type": "player_left", "playerId": player.id, "hostId": self.host_id})
+        if self.state == "round":
+            self._check_all_guessed()
+
+    def start(self, player):
+        """Host starts the game. Raises ValueError otherwise."""
+        if player.id != self.host_id:
+            raise ValueError("Only the host can start the game.")
+        # state only leaves "lobby" once _run() runs; _timer is set right away
+        if self.state != "lobby" or self._timer is not None:
+            raise ValueError("Game already started.")
+        self._timer = asyncio.ensure_future(self._run())
+
+    def guess(self, player, lat, lng):
+        """Scores a player's guess for the current round. Raises ValueError if not allowed."""
+        if self.state != "round":
+            raise ValueError("No round in progress.")
+        round_guesses = self.guesses[self.round_index]
+        if player.id in round_guesses:
+            raise ValueError("Already guessed this round.")
+        correct_lat, correct_lng, _pano_id = self.correct[self.round_index]
+        distance_km = scoring.distance_km(correct_lat, correct_lng, lat, lng)
+        points = scoring.score(distance_km, self.mode)
+        round_guesses[player.id] = (lat, lng, distance_km, points)
+        player.total += points
+        self.broadcast({
+            "type": "guess",
+            "roundIndex": self.round_index,
+            "playerId": player.id,
+            "points": points,
+            "total": player.total,
+            "guessedCount": len(round_guesses)
+        })
+        self._check_all_guessed()
+
+    def _check_all_guessed(self):
+        if self.players and all(pid in self.guesses[self.round_index] for pid in self.players):
+            self._all_guessed.set()
+
+    async def _run(self):
+        """Round timer: every round ends at its deadline, or as soon as everyone guessed."""
+        try:
+            for index in range(self.round_count):
+                self.round_index = index
+                self.state = "round"
+                self.deadline = time.monotonic() + self.time_limit
+                self._all_guessed.clear()
+                lat, lng, pano_id = self.correct[index]
+                self.broadcast({
+                    "type": "round_start",
+                    "roundIndex": index,
+                    "timeLimit": self.time_limit,
+                    "streetLat": lat,
+                    "streetLng": lng,
+                    "panoId": pano_id
+                })
+                try:
+                    await asyncio.wait_for(self._all_guessed.wait(), self.time_limit)
+                except asyncio.TimeoutError:
+                    pass
+                self.state = "between"
+                self.deadline = None
+                self.broadcast(self._round_end(index))
+                if index + 1 < self.round_count:
+                    await asyncio.sleep(INTERMISSION_S)
+            self.state = "finished"
+            self.finished_at = time.monotonic()
+            self.broadcast({"type": "game_over", "scoreboard": self.scoreboard()})
+        except asyncio.CancelledError:
+            self.state = "finished"
+            self.finished_at = time.monotonic()
+            raise
+
+    def _round_end(self, index):
+        lat, lng, _pano_id = self.correct[index]
+        results = [
+            {"playerId": pid, "guessedLat": g[0], "guessedLng": g[1], "distanceKm": g[2], "points": g[3]}
+            for pid, g in self.guesses[index].items()
+        ]
+        return {
+            "type": "round_end",
+            "roundIndex": index,
+            "correctLat": lat,
+            "correctLng": lng,
+            "results": results,
+            "scoreboard": self.scoreboard()
+        }
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        for player in list(self.players.values()):
+            self.leave(player)
+
+    def stats(self):
+        return {
+            "roomId": self.id,
+            "state": self.state,
+            "players": len(self.players),
+            "messagesSent": self.messages_sent,
+            "resyncs": self.resyncs,
+            "dropped": self.dropped
+        }
+
+
+def parse_client_message(room, player, data):
+    """
+    Applies one client message to the room. Returns an error payload to send back to
+    this player only, or None.
+    """
+    kind = data.get("type") if isinstance(data, dict) else None
+    try:
+        if kind == "start":
+            room.start(player)
+        elif kind == "guess":
+            lat, lng = float(data["lat"]), float(data["lng"])
+            if not (math.isfinite(lat) and math.isfinite(lng)):
+                raise ValueError("Invalid coordinates.")
+            room.guess(player, lat, lng)
+        else:
+            raise ValueError(f"Unknown message type: {kind}")
+    except (ValueError, KeyError, TypeError) as e:
+        return {"type": "error", "error": str(e)}
+    return None
+
+
+class RoomManager:
+    """Rooms of this process, by id."""
+
+    def __init__(self, max_rooms=MAX_ROOMS):
+        self.max_rooms = max_rooms
+        self.rooms = {}
+        self.created = 0
+
+    def create(self, map_file, time_limit, rounds, mode="classic"):
+        """New room for pooled rounds. Raises ValueError when the process is at capacity."""
+        self.reap()
+        if len(self.rooms) >= self.max_rooms:
+            raise ValueError("Too many rooms, try again later.")
+        room_id = secrets.token_urlsafe(6)
+        room = Room(room_id, map_file, time_limit, rounds, mode)
+        self.rooms[room_id] = room
+        self.created += 1
+        return room
+
+    def get(self, room_id):
+        return self.rooms.get(room_id)
+
+    def reap(self, now=None):
+        """Drops finished rooms after ROOM_LINGER_S, and lobbies nobody joined for as long."""
+        now = now if now is not None else time.monotonic()
+        for room_id, room in list(self.rooms.items()):
+            finished_long_ago = room.finished_at is not None and now - room.finished_at > ROOM_LINGER_S
+            abandoned = room.state == "lobby" and not room.players and now - room.created > ROOM_LINGER_S
+            if finished_long_ago or abandoned:
+                room.close()
+                del self.rooms[room_id]
+
+    def stats(self):
+        rooms = list(self.rooms.values())
+        return {
+            "rooms": len(rooms),
+            "roomsCreated": self.created,
+            "players": sum(len(r.players) for r in rooms),
+            "messagesSent": sum(r.messages_sent for r in rooms),
+            "resyncs": sum(r.resyncs for r in rooms),
+            "dropped": sum(r.dropped for r in rooms)
+        }
+
+
+ROOMS = RoomManager()
+
+CallbackMetric("otterguessr_rooms", "Multiplayer rooms and connected players in this process.", "gauge", ("kind",),
+               lambda: [(("rooms",), len(ROOMS.rooms)), (("players",), sum(len(r.players) for r in list(ROOMS.rooms.values())))])
@@ -0,0 +1,208 @@
+"""
+point_sampler.py
+
+Uniform random points inside a map, without a rejection loop:
+ - TriangleSampler -> area-weighted triangulation of a geometry, built once per map
+ - get_sampler(map_geom) -> the cached TriangleSampler of a MapGeometry
+ - random_point(map_geom) -> (lat, lng), always inside the map
+ - random_points(map_geom, n) -> (lats, lngs) NumPy arrays, a whole game or pool in one call
+
+How it works: the (constrained Delaunay) triangulation covers the geometry exactly.
+A sample picks a triangle with probability proportional to its area (binary search
+over cumulative areas, O(log n)) and then a uniform point inside that triangle (O(1)).
+Like the old sampler, "uniform" means uniform in lng/lat degrees.
+
+Fallback: set OTTERGUESSR_SAMPLER=rejection to get the old behaviour back, i.e.
+uniform points in the bounding box kept only if they fall inside the map (tested coarse to
+fine, see geometry_registry.MapGeometry.contains_xy).
+If that gives up after MAX_REJECTION_TRIES, the triangulation is used instead, so
+callers never get a None back in either mode. Composite maps without a single geometry
+(world_index) always use their triangulation.
+"""
+
+import logging
+import os
+import random
+
+import numpy as np
+import shapely
+
+import map_bundle
+from geometry_registry import MapGeometry
+from metrics import ATTEMPT_BUCKETS, Histogram
+
+SAMPLER_MODE = os.environ.get("OTTERGUESSR_SAMPLER", "triangulation").lower()
+MAX_REJECTION_TRIES = 10000
+
+SAMPLE_ATTEMPTS = Histogram(
+    "otterguessr_sample_attempts",
+    "Candidates drawn per accepted point (always 1 for the triangulation sampler).",
+    ("map", "sampler"),
+    buckets=ATTEMPT_BUCKETS
+)
+
+# Shared NumPy generator for the batch API (bit generators lock internally, so threads can share it)
+_NP_RNG = np.random.default_rng()
+
+
+def _reseed_after_fork():
+    """Forked workers would otherwise all draw the same 'random' points."""
+    global _NP_RNG
+    _NP_RNG = np.random.default_rng()
+
+
+os.register_at_fork(after_in_child=_reseed_after_fork)
+
+
+class TriangleSampler:
+    """
+    Precomputed triangles (n, 3, 2) of a geometry plus their cumulative areas.
+    Coordinates are (x=lng, y=lat), as in shapely.
+    """
+    __slots__ = ("triangles", "cum_areas", "total_area")
+
+    def __init__(self, geometry):
+        tris = shapely.get_parts(shapely.constrained_delaunay_triangles(geometry))
+        if len(tris) == 0:
+            raise ValueError("Geometry has no area to sample from.")
+        # Each triangle is a closed ring of 4 coords, the last repeats the first
+        coords = shapely.get_coordinates(tris).reshape(len(tris), 4, 2)[:, :3, :]
+
+        ab = coords[:, 1] - coords[:, 0]
+        ac = coords[:, 2] - coords[:, 0]
+        areas = np.abs(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]) / 2.0
+
+        self.triangles = np.ascontiguousarray(coords)
+        self.cum_areas = np.cumsum(areas)
+        self.total_area = float(self.cum_areas[-1])
+
+    @classmethod
+    def from_arrays(cls, triangles, cum_areas):
+        """Wraps precomputed tables (e.g. memory-mapped from the map bundle) without copying."""
+        sampler = cls.__new__(cls)
+        sampler.triangles = triangles
+        sampler.cum_areas = cum_areas
+        sampler.total_area = float(cum_areas[-1])
+        return sampler
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def sample(self, rng=random):
+        """Returns one uniform (x, y) inside the geometry. rng only needs .random()."""
+        idx = int(np.searchsorted(self.cum_areas, rng.random() * self.total_area, side='right'))
+        a, b, c = self.triangles[min(idx, len(self.triangles) - 1)]
+
+        r1, r2 = rng.random(), rng.random()
+        if r1 + r2 > 1.0:
+            # Fold the far half of the parallelogram back into the triangle
+            r1, r2 = 1.0 - r1, 1.0 - r2
+        x = a[0] + r1 * (b[0] - a[0]) + r2 * (c[0] - a[0])
+        y = a[1] + r1 * (b[1] - a[1]) + r2 * (c[1] - a[1])
+        return float(x), float(y)
+
+    def sample_many(self, n, rng=None):
+        """Returns n uniform points as two float64 arrays (xs, ys), fully vectorized."""
+        rng = rng or _NP_RNG
+        idx = np.searchsorted(self.cum_areas, rng.random(n) * self.total_area, side='right')
+        np.minimum(idx, len(self.triangles) - 1, out=idx)
+        tri = self.triangles[idx]
+
+        r = rng.random((n, 2))
+        folded = r.sum(axis=1) > 1.0
+        r[folded] = 1.0 - r[folded]
+        a = tri[:, 0]
+        pts = a + r[:, :1] * (tri[:, 1] - a) + r[:, 1:] * (tri[:, 2] - a)
+        return pts[:, 0], pts[:, 1]
+
+
+def get_sampler(map_geom):
+    """
+    Returns the TriangleSampler for a geometry_registry.MapGeometry, building it on first use
+    (or attaching to its memory-mapped tables, if map_bundle has up-to-date ones).
+    It lives on the registry entry, so it is rebuilt whenever the map file changes.
+    """
+    sampler = map_geom.sampler
+    if sampler is None:
+        tables = map_bundle.sampling_arrays(map_geom.path, map_geom.mtime)
+        if tables is not None:
+            sampler = TriangleSampler.from_arrays(tables["triangles"], tables["cum_areas"])
+        else:
+            sampler = TriangleSampler(map_geom.geometry)
+        map_geom.sampler = sampler
+        logging.debug("[get_sampler] %s: %s triangles", map_geom.name, len(sampler))
+    return sampler
+
+
+def _rejection_sample(map_geom, rng):
+    """Old behaviour: bounding-box rejection sampling. Returns (x, y) or None."""
+    minx, miny, maxx, maxy = map_geom.bounds
+    for tries in range(1, MAX_REJECTION_TRIES + 1):
+        x = rng.uniform(minx, maxx)
+        y = rng.uniform(miny, maxy)
+        if map_geom.contains_xy([x], [y])[0]:
+            SAMPLE_ATTEMPTS.observe(tries, map_geom.name, "rejection")
+            return x, y
+    logging.warning("[_rejection_sample] No point in %s after %s tries, using triangulation.", map_geom.name, MAX_REJECTION_TRIES)
+    return None
+
+
+def _rejection_sample_many(map_geom, n, rng):
+    """
+    Old behaviour, batched: bounding-box candidates tested with one vectorized
+    contains_xy call per batch. Returns (xs, ys) with fewer than n points if it gives up.
+    """
+    minx, miny, maxx, maxy = map_geom.bounds
+    bbox_area = (maxx - minx) * (maxy - miny)
+    # Oversample by the expected acceptance rate so one or two batches are usually enough
+    acceptance = map_geom.area / bbox_area if bbox_area > 0 else 1.0
+    xs_found, ys_found = [np.empty(0)], [np.empty(0)]
+    found = tried = 0
+    while found < n and tried < MAX_REJECTION_TRIES * n:
+        batch = min(int((n - found) / max(acceptance, 1e-3) * 1.2) + 16, MAX_REJECTION_TRIES * n - tried)
+        xs = rng.uniform(minx, maxx, batch)
+        ys = rng.uniform(miny, maxy, batch)
+        inside = map_geom.contains_xy(xs, ys)
+        xs_found.append(xs[inside])
+        ys_found.append(ys[inside])
+        found += int(inside.sum())
+        tried += batch
+    if found:
+        # Per-point attempts are not known in a batch; record the batch's average
+        SAMPLE_ATTEMPTS.observe_many(tried / found, min(found, n), map_geom.name, "rejection")
+    return np.concatenate(xs_found)[:n], np.concatenate(ys_found)[:n]
+
+
+def random_points(map_geom, n, rng=None):
+    """
+    Returns n uniformly random points inside a MapGeometry as (lats, lngs) float64 arrays.
+    rng is an optional numpy.random.Generator.
+    """
+    rng = rng or _NP_RNG
+    if SAMPLER_MODE == "rejection" and isinstance(map_geom, MapGeometry):
+        xs, ys = _rejection_sample_many(map_geom, n, rng)
+        if len(xs) < n:
+            logging.warning("[random_points] Rejection sampling short for %s, using triangulation.", map_geom.name)
+            more_xs, more_ys = get_sampler(map_geom).sample_many(n - len(xs), rng)
+            SAMPLE_ATTEMPTS.observe_many(1.0, n - len(xs), map_geom.name, "triangulation")
+            xs, ys = np.concatenate([xs, more_xs]), np.concatenate([ys, more_ys])
+    else:
+        xs, ys = get_sampler(map_geom).sample_many(n, rng)
+        SAMPLE_ATTEMPTS.observe_many(1.0, n, map_geom.name, "triangulation")
+    # shapely uses x=lng, y=lat
+    return ys, xs
+
+
+def random_point(map_geom, rng=random):
+    """
+    Returns a uniformly random (lat, lng) inside a MapGeometry.
+    Never fails for a geometry with non-zero area.
+    """
+    xy = None
+    if SAMPLER_MODE == "rejection" and isinstance(map_geom, MapGeometry):
+        xy = _rejection_sample(map_geom, rng)
+    if xy is None:
+        xy = get_sampler(map_geom).sample(rng)
+        SAMPLE_ATTEMPTS.observe(1.0, map_geom.name, "triangulation")
+    # shapely uses x=lng, y=lat
+    return xy[1], xy[0]
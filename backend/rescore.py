@@ -0,0 +1,316 @@
+"""
+rescore.py
+
+Offline re-scoring + analytics over stored games, e.g. after a score-curve change:
+ - reads games from the SQLite store (--db, the GAMES / sessions backend, see game_persistence)
+   and/or JSON-lines dumps (--ndjson, plain or .gz) of /download_game_data exports
+   ({"settings", "roundResults", ...}) or /end_game results ({"rounds", "matchJson", ...})
+ - batches guesses into fixed-size chunks and re-scores them with scoring.score_guesses
+   across a process pool, with a bounded number of chunks in flight (bounded memory)
+ - aggregates per map: games, guesses, average rounds completed, mean distance/points,
+   distance + score histograms, and how many scores the current curve changes
+
+Every partial aggregate uses fixed histogram bins, so chunk results merge by addition.
+
+Usage (from backend/):
+  python rescore.py --db games.sqlite3 [--ndjson exports.ndjson.gz ...] [--workers 4]
+                    [--classic-curve linear] [--custom-curve tiered] [--out report.json]
+"""
+
+import argparse
+import concurrent.futures
+import gzip
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+import scoring
+from game_models import NO_POINTS
+
+CHUNK_GUESSES = 50000
+# Distances: 0, then log-spaced from 10 m to half the earth's circumference
+DISTANCE_EDGES_KM = np.concatenate(([0.0], np.logspace(-2, np.log10(20040.0), 25)))
+SCORE_EDGES = np.arange(0, 5001, 250)
+
+
+def _round_rows_from_record(store, rec):
+    """(mode, map name, [(correctLat, correctLng, userLat, userLng, oldPoints), ...]) of a stored game."""
+    if store == "games":
+        rows = zip(rec["correctLats"], rec["correctLngs"], rec["userLats"], rec["userLngs"], rec["scores"])
+        return "classic", os.path.basename(rec["geojsonPath"]), list(rows)
+    rows = zip(rec["streetLats"], rec["streetLngs"], rec["guessedLats"], rec["guessedLngs"], rec["points"])
+    return "custom", rec["mapFile"], list(rows)
+
+
+def _none_to_nan(value):
+    return float("nan") if value is None else value
+
+
+def _round_rows_from_export(obj):
+    """Same as _round_rows_from_record, for one export line."""
+    if "roundResults" in obj:
+        rows = [
+            (r["correctLat"], r["correctLng"], _none_to_nan(r["userLat"]), _none_to_nan(r["userLng"]),
+             r["score"] if r["userLat"] is not None else NO_POINTS)
+            for r in obj["roundResults"]
+        ]
+        return "classic", os.path.basename(obj["settings"]["geojsonPath"]), rows
+    if "matchJson" in obj:
+        rows = [
+            (r["actualLat"], r["actualLng"], _none_to_nan(r["guessedLat"]), _none_to_nan(r["guessedLng"]),
+             NO_POINTS if r["points"] is None else r["points"])
+            for r in obj["rounds"]
+        ]
+        return "custom", obj["matchJson"]["mapFile"], rows
+    raise ValueError("Unrecognized export line")
+
+
+def iter_db_games(db_path):
+    from game_persistence import SQLiteBackend
+
+    backend = SQLiteBackend(db_path)
+    for store in ("games", "sessions"):
+        for _game_id, rec in backend.iter_records(store):
+            yield _round_rows_from_record(store, rec)
+
+
+def iter_ndjson_games(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield _round_rows_from_export(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                logging.warning("[rescore] Skipping %s:%s", path, line_no)
+
+
+class _Chunk:
+    """Columns for up to CHUNK_GUESSES guesses of one mode, plus per-map game counts."""
+    __slots__ = ("mode", "maps", "map_index", "cols", "games")
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.maps = {}
+        self.map_index = []
+        self.cols = ([], [], [], [], [])
+        self.games = []
+
+    def add_game(self, map_name, rows):
+        idx = self.maps.setdefault(map_name, len(self.maps))
+        if idx == len(self.games):
+            self.games.append(0)
+        self.games[idx] += 1
+        for row in rows:
+            self.map_index.append(idx)
+            for col, value in zip(self.cols, row):
+                col.append(value)
+
+    def __len__(self):
+        return len(self.map_index)
+
+    def payload(self):
+        """Picklable form sent to a worker."""
+        return self.mode, list(self.maps), self.map_index, self.cols, self.games
+
+
+def iter_chunks(games, chunk_guesses=CHUNK_GUESSES):
+    """Groups (mode, map, rows) games into per-mode chunks of about chunk_guesses guesses."""
+    open_chunks = {}
+    for mode, map_name, rows in games:
+        chunk = open_chunks.get(mode)
+        if chunk is None:
+            chunk = open_chunks[mode] = _Chunk(mode)
+        chunk.add_game(map_name, rows)
+        if len(chunk) >= chunk_guesses:
+            yield chunk.payload()
+            del open_chunks[mode]
+    for chunk in open_chunks.values():
+        yield chunk.payload()
+
+
+def _empty_stats():
+    return {
+        "games": 0,
+        "guesses": 0,
+        "distanceSumKm": 0.0,
+        "pointsSum": 0,
+        "oldPointsSum": 0,
+        "changedScores": 0,
+        "distanceHist": [0] * (len(DISTANCE_EDGES_KM) - 1),
+        "scoreHist": [0] * (len(SCORE_EDGES) - 1)
+    }
+
+
+def _per_map_sums(map_index, n_maps, values):
+    return np.bincount(map_index, weights=values, minlength=n_maps)
+
+
+def _per_map_hist(map_index, n_maps, values, edges):
+    """(n_maps, bins) histogram; values past the last edge land in the last bin."""
+    bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+    counts = np.bincount(map_index * (len(edges) - 1) + bins, minlength=n_maps * (len(edges) - 1))
+    return counts.reshape(n_maps, len(edges) - 1)
+
+
+def score_chunk(payload):
+    """Worker: re-score one chunk -> {(mode, map): partial stats}."""
+    mode, maps, map_index, cols, games = payload
+    map_index = np.asarray(map_index, dtype=np.int64)
+    correct_lats, correct_lngs, user_lats, user_lngs, old_points = (np.asarray(c, dtype=np.float64) for c in cols)
+
+    distances, points = scoring.score_guesses(correct_lats, correct_lngs, user_lats, user_lngs, mode)
+    guessed = ~np.isnan(distances)
+    map_index, distances, points, old_points = map_index[guessed], distances[guessed], points[guessed], old_points[guessed]
+
+    n_maps = len(maps)
+    guesses = np.bincount(map_index, minlength=n_maps)
+    dist_sums = _per_map_sums(map_index, n_maps, distances)
+    point_sums = _per_map_sums(map_index, n_maps, points)
+    old_sums = _per_map_sums(map_index, n_maps, np.where(old_points == NO_POINTS, 0, old_points))
+    changed = np.bincount(map_index, weights=(points != old_points), minlength=n_maps)
+    dist_hist = _per_map_hist(map_index, n_maps, distances, DISTANCE_EDGES_KM)
+    score_hist = _per_map_hist(map_index, n_maps, points, SCORE_EDGES)
+
+    result = {}
+    for i, map_name in enumerate(maps):
+        result[(mode, map_name)] = {
+            "games": games[i],
+            "guesses": int(guesses[i]),
+            "distanceSumKm": float(dist_sums[i]),
+            "pointsSum": int(point_sums[i]),
+            "oldPointsSum": int(old_sums[i]),
+            "changedScores": int(changed[i]),
+            "distanceHist": dist_hist[i].tolist(),
+            "scoreHist": score_hist[i].tolist()
+        }
+    return result
+
+
+def merge_stats(total, partial):
+    """Adds partial stats into total (both {(mode, map): stats}) in place."""
+    for key, stats in partial.items():
+        acc = total.setdefault(key, _empty_stats())
+        for field, value in stats.items():
+            if isinstance(value, list):
+                acc[field] = [a + b for a, b in zip(acc[field], value)]
+            else:
+                acc[field] += value
+    return total
+
+
+def _hist_quantile(hist, edges, q):
+    """Upper edge of the bin holding the q-quantile (approximate, from the histogram)."""
+    total = sum(hist)
+    if not total:
+        return None
+    idx = int(np.searchsorted(np.cumsum(hist), q * total))
+    return float(edges[min(idx + 1, len(edges) - 1)])
+
+
+def summarize(total):
+    """Final report: per mode + map, with means and approximate distance quantiles."""
+    maps = []
+    for (mode, map_name), s in sorted(total.items()):
+        guesses = s["guesses"]
+        maps.append({
+            "mode": mode,
+            "map": map_name,
+            "games": s["games"],
+            "guesses": guesses,
+            "avgRoundsCompleted": round(guesses / s["games"], 3) if s["games"] else 0,
+            "meanDistanceKm": round(s["distanceSumKm"] / guesses, 3) if guesses else None,
+            "medianDistanceKmUpTo": _hist_quantile(s["distanceHist"], DISTANCE_EDGES_KM, 0.5),
+            "p90DistanceKmUpTo": _hist_quantile(s["distanceHist"], DISTANCE_EDGES_KM, 0.9),
+            "meanPoints": round(s["pointsSum"] / guesses, 2) if guesses else None,
+            "oldMeanPoints": round(s["oldPointsSum"] / guesses, 2) if guesses else None,
+            "changedScores": s["changedScores"],
+            "distanceHist": s["distanceHist"],
+            "scoreHist": s["scoreHist"]
+        })
+    return {
+        "distanceEdgesKm": [round(e, 4) for e in DISTANCE_EDGES_KM.tolist()],
+        "scoreEdges": SCORE_EDGES.tolist(),
+        "curves": {mode: type(curve).__name__ for mode, curve in scoring.MODE_CURVES.items()},
+        "maps": maps
+    }
+
+
+def _init_worker(curve_names):
+    for mode, name in curve_names.items():
+        scoring.set_curve(mode, scoring.CURVES[name]())
+
+
+def run(games, workers=os.cpu_count(), curve_names=None, chunk_guesses=CHUNK_GUESSES):
+    """Re-scores an iterable of (mode, map, rows) games. Returns the merged {(mode, map): stats}."""
+    curve_names = curve_names or {}
+    _init_worker(curve_names)
+    total = {}
+    chunks = iter_chunks(games, chunk_guesses)
+    if workers <= 1:
+        for payload in chunks:
+            merge_stats(total, score_chunk(payload))
+        return total
+
+    max_in_flight = workers * 2
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(curve_names,)) as pool:
+        in_flight = set()
+        for payload in chunks:
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    merge_stats(total, fut.result())
+            in_flight.add(pool.submit(score_chunk, payload))
+        for fut in concurrent.futures.as_completed(in_flight):
+            merge_stats(total, fut.result())
+    return total
+
+
+def _all_games(args):
+    if args.db:
+        yield from iter_db_games(args.db)
+    for path in args.ndjson:
+        yield from iter_ndjson_games(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored games and report per-map statistics")
+    parser.add_argument("--db", help="SQLite store (OTTERGUESSR_DB_PATH of the server)")
+    parser.add_argument("--ndjson", nargs="*", default=[], help="JSON-lines exports (.gz ok)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=CHUNK_GUESSES, help="guesses per chunk")
+    parser.add_argument("--classic-curve", choices=list(scoring.CURVES))
+    parser.add_argument("--custom-curve", choices=list(scoring.CURVES))
+    parser.add_argument("--out", help="write the report here instead of stdout")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not args.db and not args.ndjson:
+        parser.error("nothing to read: pass --db and/or --ndjson")
+
+    curve_names = {}
+    if args.classic_curve:
+        curve_names["classic"] = args.classic_curve
+    if args.custom_curve:
+        curve_names["custom"] = args.custom_curve
+
+    start = time.perf_counter()
+    total = run(_all_games(args), workers=args.workers, curve_names=curve_names, chunk_guesses=args.chunk)
+    report = summarize(total)
+    report["seconds"] = round(time.perf_counter() - start, 2)
+
+    body = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(body)
+        logging.info("[rescore] Wrote %s map reports to %s", len(report['maps']), args.out)
+    else:
+        print(body)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+round_pool.py
+
+Pre-generated, street-view-resolved round locations per map, so game creation only pops entries:
+ - RoundLocationPool -> FIFO of ready rounds for one map, with hit/miss/refill stats
+ - RoundPools.take(map_geom, k) -> k entries of (lat, lng, panoLat, panoLng, panoId)
+   (take_async for the ASGI app)
+ - RoundPools.stats() -> pool depth, hits, misses and refill latency per pool
+
+Entries are produced in batches by streetview_resolver, so a refill resolves many
+candidates concurrently. A daemon thread tops every pool that fell below the low-water
+mark back up to the target depth. If a pool runs dry, the missing entries are generated
+inline and counted as a miss.
+
+Config (env):
+  OTTERGUESSR_POOL_ENABLED    -> "0" disables pooling (every take generates inline)
+  OTTERGUESSR_POOL_LOW_WATER  -> refill below this depth (default 50)
+  OTTERGUESSR_POOL_TARGET     -> refill up to this depth (default 200)
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+
+from metrics import CallbackMetric, Histogram, span
+from streetview_resolver import get_resolver
+
+POOL_ENABLED = os.environ.get("OTTERGUESSR_POOL_ENABLED", "1").lower() not in ("0", "false", "no")
+POOL_LOW_WATER = int(os.environ.get("OTTERGUESSR_POOL_LOW_WATER", 50))
+POOL_TARGET = int(os.environ.get("OTTERGUESSR_POOL_TARGET", 200))
+
+REFILL_SECONDS = Histogram("otterguessr_pool_refill_seconds", "Round-pool refill time per map.", ("map",))
+
+
+def generate_rounds(map_geom, count):
+    """Samples and street-view-resolves 'count' rounds in one batch. Returns a list of entries."""
+    return get_resolver().resolve_many(map_geom, count)
+
+
+class RoundLocationPool:
+    """Ready-to-serve rounds for one map. All counters are guarded by 'lock'."""
+
+    def __init__(self, map_geom):
+        self.map_geom = map_geom
+        self.entries = collections.deque()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.last_refill_ms = 0.0
+        self.total_refill_ms = 0.0
+
+    def take_ready(self, k):
+        """Pops up to k ready entries (a miss if fewer than k were ready)."""
+        with self.lock:
+            n = min(k, len(self.entries))
+            taken = [self.entries.popleft() for _ in range(n)]
+            if n == k:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return taken
+
+    def take(self, k):
+        """Pops k entries; tops up inline (and counts a miss) if fewer are ready."""
+        taken = self.take_ready(k)
+        if len(taken) < k:
+            with span("pool_miss_generate"):
+                taken.extend(generate_rounds(self.map_geom, k - len(taken)))
+        return taken
+
+    def refill(self, target):
+        """Generates entries until the pool holds 'target'. Runs on the refill thread."""
+        missing = target - len(self.entries)
+        if missing <= 0:
+            return
+        start = time.perf_counter()
+        fresh = generate_rounds(self.map_geom, missing)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        REFILL_SECONDS.observe(elapsed_ms / 1000, self.map_geom.name)
+        with self.lock:
+            self.entries.extend(fresh)
+            self.refills += 1
+            self.last_refill_ms = elapsed_ms
+            self.total_refill_ms += elapsed_ms
+        logging.debug("[RoundLocationPool] Refilled %s with %s rounds in %.1fms", self.map_geom.name, missing, elapsed_ms)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "map": self.map_geom.name,
+                "depth": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "refills": self.refills,
+                "lastRefillMs": self.last_refill_ms,
+                "avgRefillMs": self.total_refill_ms / self.refills if self.refills else 0.0
+            }
+
+
+class RoundPools:
+    """All pools of the process plus the background refill thread (started on first use)."""
+
+    def __init__(self, low_water=POOL_LOW_WATER, target=POOL_TARGET, enabled=POOL_ENABLED):
+        self.low_water = low_water
+        self.target = max(target, low_water)
+        self.enabled = enabled
+        # map path -> RoundLocationPool
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _get_pool(self, map_geom):
+        key = map_geom.path
+        pool = self._pools.get(key)
+        # A new MapGeometry means the file changed on disk: old entries are stale
+        if pool is None or pool.map_geom is not map_geom:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None or pool.map_geom is not map_geom:
+                    pool = RoundLocationPool(map_geom)
+                    self._pools[key] = pool
+        return pool
+
+    def take(self, map_geom, k):
+        """
+        Returns k entries (lat, lng, panoLat, panoLng, panoId) for this map.
+        Wakes the refill thread when the pool drops below the low-water mark.
+        """
+        if not self.enabled:
+            return generate_rounds(map_geom, k)
+        pool = self._get_pool(map_geom)
+        taken = pool.take(k)
+        if len(pool.entries) < self.low_water:
+            self._ensure_worker()
+            self._wakeup.set()
+        return taken
+
+    async def take_async(self, map_geom, k, run_cpu):
+        """
+        take() for the ASGI app (asgi.py): ready entries are popped directly; on a miss the
+        sampling runs through run_cpu (an awaitable executor call) and the Street View
+        lookups on the event loop.
+        """
+        if not self.enabled:
+            return await get_resolver().resolve_many_async(map_geom, k, run_cpu)
+        pool = self._get_pool(map_geom)
+        taken = pool.take_ready(k)
+        if len(taken) < k:
+            taken.extend(await get_resolver().resolve_many_async(map_geom, k - len(taken), run_cpu))
+        if len(pool.entries) < self.low_water:
+            self._ensure_worker()
+            self._wakeup.set()
+        return taken
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._refill_loop, name="round-pool-refill", daemon=True)
+                self._thread.start()
+
+    def _refill_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            for pool in list(self._pools.values()):
+                if len(pool.entries) < self.low_water:
+                    try:
+                        pool.refill(self.target)
+                    except Exception:
+                        logging.exception("[RoundPools] Refill failed for %s", pool.map_geom.name)
+
+    def stats(self):
+        """Per-pool depth / hit / miss / refill latency, plus the pool settings."""
+        return {
+            "enabled": self.enabled,
+            "lowWater": self.low_water,
+            "target": self.target,
+            "pools": [pool.stats() for pool in list(self._pools.values())]
+        }
+
+
+# Shared by game_logic.create_custom_game and the /start_game route
+ROUND_POOLS = RoundPools()
+
+
+def _take_samples():
+    for pool in list(ROUND_POOLS._pools.values()):
+        yield (pool.map_geom.name, "hit"), pool.hits
+        yield (pool.map_geom.name, "miss"), pool.misses
+
+
+CallbackMetric("otterguessr_pool_depth", "Ready rounds per map pool.", "gauge", ("map",),
+               lambda: [((pool.map_geom.name,), len(pool.entries)) for pool in list(ROUND_POOLS._pools.values())])
+CallbackMetric("otterguessr_pool_takes", "Pool takes per map, hit (enough ready) or miss.", "counter",
+               ("map", "outcome"), _take_samples)
+
+
+def _clear_after_fork():
+    # Entries sampled before a fork would otherwise be served by every worker
+    ROUND_POOLS._pools = {}
+
+
+os.register_at_fork(after_in_child=_clear_after_fork)
@@ -0,0 +1,101 @@
+"""
+sampling_tables.py
+
+Precomputed per-map NumPy arrays in one memory-mapped file, so forked workers share them
+through the page cache instead of each holding a private copy:
+ - write_tables(path, entries, meta) -> writes {name: {"meta": {...}, "arrays": {key: ndarray}}}
+   plus optional file-level meta (e.g. a format version, see map_bundle)
+ - MappedTables(path) -> read-only, zero-copy views into the file
+
+The map bundle (map_bundle.py) is written in this format.
+
+File layout: MAGIC, uint64 header length, JSON header (per entry: meta + dtype/shape/offset
+of each array), then the raw arrays, each 64-byte aligned.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"OTGTBL01"
+ALIGN = 64
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_tables(path, entries, meta=None):
+    """
+    entries: {name: {"meta": dict, "arrays": {key: ndarray}}}
+    meta: optional dict for the whole file, read back as MappedTables.file_meta
+    Writes to a temp file and renames it into place, so readers never see a partial file.
+    """
+    header = {"meta": meta or {}, "entries": {}}
+    blobs = []
+    offset = 0
+    for name, entry in entries.items():
+        arrays_meta = {}
+        for key, arr in entry["arrays"].items():
+            arr = np.ascontiguousarray(arr)
+            arrays_meta[key] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+            blobs.append((offset, arr))
+            offset = _align(offset + arr.nbytes)
+        header["entries"][name] = {"meta": entry.get("meta", {}), "arrays": arrays_meta}
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for rel_offset, arr in blobs:
+            f.seek(data_start + rel_offset)
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+class MappedTables:
+    """A tables file opened with mmap. get() returns read-only arrays backed by the mapping."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a tables file")
+        (header_len,) = struct.unpack_from("<Q", self._mm, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(self._mm[header_start:header_start + header_len])
+        self._data_start = _align(header_start + header_len)
+
+    @property
+    def file_meta(self):
+        return self.header.get("meta", {})
+
+    def names(self):
+        return list(self.header["entries"])
+
+    def meta(self, name):
+        entry = self.header["entries"].get(name)
+        return entry["meta"] if entry else None
+
+    def get(self, name):
+        """{key: ndarray} for an entry, or None. No data is copied."""
+        entry = self.header["entries"].get(name)
+        if entry is None:
+            return None
+        arrays = {}
+        for key, spec in entry["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            arrays[key] = np.frombuffer(self._mm, dtype=dtype, count=count,
+                                        offset=self._data_start + spec["offset"]).reshape(spec["shape"])
+        return arrays
+
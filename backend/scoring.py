@@ -0,0 +1,150 @@
+"""
+scoring.py
+
+Distance + score for every game mode, one guess at a time or thousands at once:
+ - distance_km(lat1, lng1, lat2, lng2) -> haversine, scalar
+ - distances_km(lats1, lngs1, lats2, lngs2) -> haversine over NumPy arrays
+ - LinearCurve / TieredCurve -> score curves with score(d) (scalar) and score_many(d) (np.select)
+ - get_curve(mode) / score(d, mode) / score_many(d, mode) -> the curve configured for a mode
+ - score_guesses(correct_lats, correct_lngs, user_lats, user_lngs, mode) -> (distances, points)
+   for whole games / exports; NaN guesses give NaN distance and NO_POINTS
+
+Modes: "classic" (/create_game, game_logic) and "custom" (/start_game sessions).
+Config (env): OTTERGUESSR_SCORING_CLASSIC / OTTERGUESSR_SCORING_CUSTOM -> "linear" or "tiered"
+(defaults linear / tiered, i.e. the curves each mode always had).
+
+The scalar and batch paths give identical results; benchmarks/bench_scoring.py checks that.
+"""
+
+import math
+import os
+
+import numpy as np
+
+from game_models import NO_POINTS
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Haversine distance in kilometers."""
+    rlat1 = math.radians(lat1)
+    rlat2 = math.radians(lat2)
+    a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2
+         + math.cos(rlat1) * math.cos(rlat2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def distances_km(lats1, lngs1, lats2, lngs2):
+    """Haversine over arrays (anything np.asarray accepts); returns a float64 array."""
+    lats1 = np.asarray(lats1, dtype=np.float64)
+    lats2 = np.asarray(lats2, dtype=np.float64)
+    dlat = np.radians(lats2 - lats1)
+    dlng = np.radians(np.asarray(lngs2, dtype=np.float64) - np.asarray(lngs1, dtype=np.float64))
+    a = np.sin(dlat / 2) ** 2 + np.cos(np.radians(lats1)) * np.cos(np.radians(lats2)) * np.sin(dlng / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class LinearCurve:
+    """
+    Classic mode: max_points within perfect_km, then linear decay of
+    points_per_km per km (rounded), never below 0.
+    """
+
+    def __init__(self, max_points=5000, perfect_km=0.05, points_per_km=5):
+        self.max_points = max_points
+        self.perfect_km = perfect_km
+        self.points_per_km = points_per_km
+
+    def score(self, d):
+        if d < self.perfect_km:
+            return self.max_points
+        return max(0, int(round(self.max_points - d * self.points_per_km)))
+
+    def score_many(self, d):
+        return np.select(
+            [d < self.perfect_km],
+            [self.max_points],
+            default=np.maximum(0, np.round(self.max_points - d * self.points_per_km))
+        )
+
+
+class TieredCurve:
+    """
+    Custom mode: max_points within perfect_km, steep decay to near_points at near_km,
+    then linear to 0 at far_km.
+    """
+
+    def __init__(self, max_points=5000, perfect_km=0.01, near_km=10, near_points=300,
+                 near_points_per_km=470, far_km=500):
+        self.max_points = max_points
+        self.perfect_km = perfect_km
+        self.near_km = near_km
+        self.near_points = near_points
+        self.near_points_per_km = near_points_per_km
+        self.far_km = far_km
+
+    def score(self, d):
+        if d < self.perfect_km:
+            return self.max_points
+        if d <= self.near_km:
+            return max(self.near_points, int(self.max_points - d * self.near_points_per_km))
+        if d <= self.far_km:
+            frac = (d - self.near_km) / (self.far_km - self.near_km)
+            return max(0, self.near_points - int(frac * self.near_points))
+        return 0
+
+    def score_many(self, d):
+        frac = (d - self.near_km) / (self.far_km - self.near_km)
+        return np.select(
+            [d < self.perfect_km, d <= self.near_km, d <= self.far_km],
+            [
+                self.max_points,
+                np.maximum(self.near_points, np.trunc(self.max_points - d * self.near_points_per_km)),
+                np.maximum(0, self.near_points - np.trunc(frac * self.near_points))
+            ],
+            default=0
+        )
+
+
+CURVES = {
+    "linear": LinearCurve,
+    "tiered": TieredCurve
+}
+
+MODE_CURVES = {
+    "classic": CURVES[os.environ.get("OTTERGUESSR_SCORING_CLASSIC", "linear")](),
+    "custom": CURVES[os.environ.get("OTTERGUESSR_SCORING_CUSTOM", "tiered")]()
+}
+
+
+def get_curve(mode):
+    """Score curve for a mode. Raises ValueError for an unknown mode."""
+    curve = MODE_CURVES.get(mode)
+    if curve is None:
+        raise ValueError(f"Unknown scoring mode '{mode}', expected one of {list(MODE_CURVES)}")
+    return curve
+
+
+def set_curve(mode, curve):
+    """Replaces the curve for a mode (scoring-rule changes, re-scoring experiments)."""
+    MODE_CURVES[mode] = curve
+
+
+def score(d, mode):
+    """Points for one distance in km."""
+    return get_curve(mode).score(d)
+
+
+def score_many(distances, mode):
+    """Points for an array of distances in km, as int32; NaN distances give NO_POINTS."""
+    d = np.asarray(distances, dtype=np.float64)
+    missing = np.isnan(d)
+    points = get_curve(mode).score_many(np.where(missing, np.inf, d))
+    return np.where(missing, NO_POINTS, points).astype(np.int32)
+
+
+def score_guesses(correct_lats, correct_lngs, user_lats, user_lngs, mode):
+    """Distances (float64, NaN where not guessed) and points (int32, NO_POINTS where not guessed)."""
+    distances = distances_km(correct_lats, correct_lngs, user_lats, user_lngs)
+    return distances, score_many(distances, mode)
@@ -0,0 +1,177 @@
+"""
+seeded_rounds.py
+
+Deterministic round generation, so a game can be shared and replayed as
+(map, seed, roundCount, algoVersion) instead of its coordinates:
+ - generate_rounds(map_geom, seed, count) -> the rounds (lat, lng, panoLat, panoLng, panoId) of a
+   seed, from its own NumPy Generator (generate_rounds_async for asgi.py); recently used seeds
+   are cached, so players of one shared challenge don't resample it
+ - parse_seed(data) -> (seed, algoVersion) requested by a /create_game or /start_game body
+ - parse_round_count(value) -> a roundCount checked against 1..MAX_ROUND_COUNT
+ - take_rounds(map_geom, count, seed, algo_version) -> a seed's rounds, or pooled ones for
+   seed None (take_rounds_async for asgi.py)
+ - rounds_payload(...) -> a seed's rounds for /replay
+
+ALGO_VERSION names the sampling algorithm. Version 1: PCG64(seed) -> point_sampler's
+triangulation (TriangleSampler.sample_many, regardless of OTTERGUESSR_SAMPLER) -> the
+Street View resolver, resampling candidates without coverage from the same stream.
+Anything that changes which points a seed yields must bump ALGO_VERSION and keep the old
+version generating as before, or stored games and shared links change under their players.
+
+A seed replays the same rounds as long as the map file is unchanged and the Street View
+backend reports the same coverage (exact with the default mock backend, up to the
+resolver cache's ~11 m quantization when two candidates share a cell).
+
+Config (env):
+  OTTERGUESSR_SEEDED_GAMES  -> "1" seeds every new game (default: only on request, pooled otherwise)
+  OTTERGUESSR_SEED_CACHE    -> seeds kept in the generated-rounds cache (default 1024)
+"""
+
+import collections
+import os
+import secrets
+import threading
+
+import numpy as np
+
+from geometry_registry import MAPS_DIR
+from point_sampler import get_sampler
+from round_pool import ROUND_POOLS
+from streetview_resolver import get_resolver
+from world_index import load_map
+
+ALGO_VERSION = 1
+SUPPORTED_ALGO_VERSIONS = (1,)
+# Seeds stay exact integers in JavaScript clients
+MAX_SEED = 2 ** 53 - 1
+MAX_ROUND_COUNT = 100
+SEEDED_GAMES = os.environ.get("OTTERGUESSR_SEEDED_GAMES", "").lower() in ("1", "true", "yes")
+SEED_CACHE_SIZE = int(os.environ.get("OTTERGUESSR_SEED_CACHE", 1024))
+
+
+def new_seed():
+    return secrets.randbelow(MAX_SEED + 1)
+
+
+def _check(seed, algo_version):
+    if not isinstance(seed, int) or isinstance(seed, bool) or not 0 <= seed <= MAX_SEED:
+        raise ValueError(f"seed must be an integer between 0 and {MAX_SEED}.")
+    if algo_version not in SUPPORTED_ALGO_VERSIONS:
+        raise ValueError(f"Unsupported algoVersion {algo_version}, expected one of {list(SUPPORTED_ALGO_VERSIONS)}.")
+
+
+def parse_round_count(value):
+    """roundCount of a request as an int in 1..MAX_ROUND_COUNT. Raises ValueError otherwise."""
+    try:
+        round_count = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("roundCount must be an integer.")
+    if not 1 <= round_count <= MAX_ROUND_COUNT:
+        raise ValueError(f"roundCount must be between 1 and {MAX_ROUND_COUNT}.")
+    return round_count
+
+
+def parse_seed(data):
+    """
+    (seed, algoVersion) for a request body: its "seed" (+ optional "algoVersion"), a fresh
+    seed for "seeded": true or with OTTERGUESSR_SEEDED_GAMES=1, else (None, None) for a pooled game.
+    Raises ValueError for a malformed seed or an unknown algoVersion.
+    """
+    seed = data.get("seed")
+    if seed is None:
+        if not (data.get("seeded") or SEEDED_GAMES):
+            return None, None
+        seed = new_seed()
+    try:
+        seed = int(seed)
+        algo_version = int(data.get("algoVersion", ALGO_VERSION))
+    except (TypeError, ValueError):
+        raise ValueError("seed and algoVersion must be integers.")
+    _check(seed, algo_version)
+    return seed, algo_version
+
+
+def _sample_v1(map_geom, n, rng):
+    xs, ys = get_sampler(map_geom).sample_many(n, rng)
+    return ys, xs
+
+
+_SAMPLERS = {1: _sample_v1}
+
+# (map_geom, seed, count, algo_version) -> tuple of rounds; a changed map is a new MapGeometry
+_CACHE = collections.OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def _cached(key):
+    with _CACHE_LOCK:
+        rounds = _CACHE.get(key)
+        if rounds is not None:
+            _CACHE.move_to_end(key)
+        return rounds
+
+
+def _remember(key, rounds):
+    rounds = tuple(rounds)
+    with _CACHE_LOCK:
+        _CACHE[key] = rounds
+        while len(_CACHE) > SEED_CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return rounds
+
+
+def generate_rounds(map_geom, seed, count, algo_version=ALGO_VERSION):
+    """
+    The 'count' rounds (lat, lng, panoLat, panoLng, panoId) of a seed on a map (a tuple).
+    Raises ValueError for a bad seed/version, or if the map has too little coverage.
+    """
+    _check(seed, algo_version)
+    key = (map_geom, seed, count, algo_version)
+    rounds = _cached(key)
+    if rounds is None:
+        rng = np.random.Generator(np.random.PCG64(seed))
+        rounds = _remember(key, get_resolver().resolve_many(map_geom, count, rng=rng, sample=_SAMPLERS[algo_version]))
+    return rounds
+
+
+async def generate_rounds_async(map_geom, seed, count, algo_version, run_cpu):
+    """generate_rounds() for the event loop (see StreetViewResolver.resolve_many_async)."""
+    _check(seed, algo_version)
+    key = (map_geom, seed, count, algo_version)
+    rounds = _cached(key)
+    if rounds is None:
+        rng = np.random.Generator(np.random.PCG64(seed))
+        rounds = _remember(key, await get_resolver().resolve_many_async(
+            map_geom, count, run_cpu, rng=rng, sample=_SAMPLERS[algo_version]))
+    return rounds
+
+
+def take_rounds(map_geom, count, seed=None, algo_version=ALGO_VERSION):
+    """Rounds for a new game: generated from its seed, or popped from the map's pool if it has none."""
+    if seed is None:
+        return ROUND_POOLS.take(map_geom, count)
+    return list(generate_rounds(map_geom, seed, count, algo_version))
+
+
+async def take_rounds_async(map_geom, count, seed, algo_version, run_cpu):
+    """take_rounds() for the event loop."""
+    if seed is None:
+        return await ROUND_POOLS.take_async(map_geom, count, run_cpu)
+    return list(await generate_rounds_async(map_geom, seed, count, algo_version, run_cpu))
+
+
+def rounds_payload(map_file, seed, round_count, algo_version=ALGO_VERSION):
+    """The /replay response: a seed's settings and every round's location."""
+    map_geom = load_map(os.path.join(MAPS_DIR, map_file))
+    rounds = generate_rounds(map_geom, seed, round_count, algo_version)
+    return {
+        "mapFile": map_file,
+        "seed": seed,
+        "roundCount": round_count,
+        "algoVersion": algo_version,
+        "rounds": [
+            {"lat": lat, "lng": lng, "streetLat": s_lat, "streetLng": s_lng, "panoId": pano_id}
+            for lat, lng, s_lat, s_lng, pano_id in rounds
+        ]
+    }
+
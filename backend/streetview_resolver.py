@@ -0,0 +1,472 @@
+"""
+streetview_resolver.py
+
+Batched Street View lookup for whole games:
+ - StreetViewBackend -> one panorama lookup: lookup(lat, lng) -> (panoLat, panoLng, panoId) or None
+   - MockBackend: today's behaviour, the point itself + a fake pano id (default)
+   - StubBackend: in-process stand-in with configurable latency and miss rate
+   - HttpBackend: Street View metadata API (or streetview_stub.py) over pooled keep-alive connections
+ - LookupCache -> LRU + TTL cache keyed by quantized lat/lng (also remembers "no panorama here",
+   but only for definite answers: quota, key and server errors raise StreetViewError instead)
+ - StreetViewResolver.resolve_many(map_geom, count) -> count rounds, looked up concurrently;
+   points without coverage are replaced by fresh samples from the same map
+   (resolve_many_async: same on an asyncio event loop, for asgi.py)
+
+Config (env):
+  OTTERGUESSR_STREETVIEW_BACKEND  -> mock | stub | http (default mock)
+  OTTERGUESSR_STREETVIEW_URL      -> metadata endpoint for http (default Google's)
+  OTTERGUESSR_STREETVIEW_KEY      -> API key for http
+  OTTERGUESSR_STREETVIEW_WORKERS  -> max concurrent lookups (default 8)
+  OTTERGUESSR_STREETVIEW_LATENCY_MS, OTTERGUESSR_STREETVIEW_MISS_RATE -> stub backend tuning
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+from metrics import ATTEMPT_BUCKETS, CallbackMetric, Histogram, span
+from point_sampler import random_points
+
+MOCK_PANO_ID = "mockpanoid-12345"
+DEFAULT_METADATA_URL = "https://maps.googleapis.com/maps/api/streetview/metadata"
+# 4 decimals ~ 11m: two candidates that close share one lookup
+QUANTIZE_DECIMALS = 4
+MAX_RESAMPLE_ROUNDS = 5
+# Metadata statuses that mean "no panorama here"; any other non-OK status is an error
+NO_COVERAGE_STATUSES = ("ZERO_RESULTS", "NOT_FOUND")
+# What a keep-alive connection the server already closed fails with; retried once on a new one
+STALE_CONNECTION_ERRORS = (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine)
+STALE_STREAM_ERRORS = (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError, ValueError)
+
+
+class StreetViewError(RuntimeError):
+    """The backend could not answer (quota, key or server error); not the same as no coverage."""
+
+
+class StreetViewBackend:
+    """
+    Interface: lookup(lat, lng) -> (panoLat, panoLng, panoId), or None if there is no coverage.
+    lookup_async() is the event-loop version used by the ASGI app; by default it runs
+    lookup() in a thread.
+    """
+
+    def lookup(self, lat, lng):
+        raise NotImplementedError
+
+    async def lookup_async(self, lat, lng):
+        return await asyncio.to_thread(self.lookup, lat, lng)
+
+
+class MockBackend(StreetViewBackend):
+    """Returns the same lat/lng + a fake pano ID."""
+
+    def lookup(self, lat, lng):
+        return (lat, lng, MOCK_PANO_ID)
+
+    async def lookup_async(self, lat, lng):
+        return (lat, lng, MOCK_PANO_ID)
+
+
+class StubBackend(StreetViewBackend):
+    """
+    Offline stand-in for benchmarking: sleeps latency_ms per lookup and reports no
+    coverage for a deterministic miss_rate fraction of locations.
+    """
+
+    def __init__(self, latency_ms=50.0, miss_rate=0.0):
+        self.latency_s = latency_ms / 1000.0
+        self.miss_rate = miss_rate
+
+    def lookup(self, lat, lng):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self._result(lat, lng)
+
+    async def lookup_async(self, lat, lng):
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return self._result(lat, lng)
+
+    def _result(self, lat, lng):
+        pano_id = stub_pano_id(lat, lng)
+        if int(pano_id[:8], 16) / 0xFFFFFFFF < self.miss_rate:
+            return None
+        return (lat, lng, pano_id)
+
+
+def stub_pano_id(lat, lng):
+    """Deterministic fake pano id for a location (shared by StubBackend and streetview_stub.py)."""
+    key = f"{round(lat, QUANTIZE_DECIMALS)},{round(lng, QUANTIZE_DECIMALS)}"
+    return hashlib.sha1(key.encode()).hexdigest()[:22]
+
+
+class HttpBackend(StreetViewBackend):
+    """
+    Street View Static API metadata lookups. Each worker thread keeps one keep-alive
+    connection, so a game's lookups don't pay a TCP/TLS handshake each.
+    lookup_async() speaks HTTP/1.1 over asyncio streams, with its own pool of idle
+    keep-alive connections.
+    """
+
+    def __init__(self, url=DEFAULT_METADATA_URL, api_key="", radius_m=1000, timeout=5.0):
+        parsed = urllib.parse.urlsplit(url)
+        self.scheme = parsed.scheme
+        self.netloc = parsed.netloc
+        self.path = parsed.path or "/"
+        self.api_key = api_key
+        self.radius_m = radius_m
+        self.timeout = timeout
+        self._local = threading.local()
+        # Idle asyncio (reader, writer) pairs; only ever used from the ASGI event loop
+        self._idle = []
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn_cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = conn_cls(self.netloc, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _query(self, lat, lng):
+        return urllib.parse.urlencode({
+            "location": f"{lat},{lng}",
+            "radius": self.radius_m,
+            "source": "outdoor",
+            "key": self.api_key
+        })
+
+    @staticmethod
+    def _result(body):
+        """(panoLat, panoLng, panoId), None for no coverage; raises StreetViewError otherwise."""
+        status = body.get("status")
+        if status == "OK":
+            loc = body["location"]
+            return (loc["lat"], loc["lng"], body["pano_id"])
+        if status in NO_COVERAGE_STATUSES:
+            return None
+        raise StreetViewError(f"Street View metadata status {status}: {body.get('error_message', '')}")
+
+    def _request(self, lat, lng):
+        conn = self._connection()
+        try:
+            conn.request("GET", f"{self.path}?{self._query(lat, lng)}")
+            resp = conn.getresponse()
+            return json.loads(resp.read())
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection; the next request on this thread reconnects
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def lookup(self, lat, lng):
+        try:
+            body = self._request(lat, lng)
+        except STALE_CONNECTION_ERRORS:
+            logging.debug("[HttpBackend] Stale keep-alive connection, retrying on a new one")
+            body = self._request(lat, lng)
+        return self._result(body)
+
+    async def _open(self):
+        host, _, port = self.netloc.partition(":")
+        default_port = 443 if self.scheme == "https" else 80
+        return await asyncio.wait_for(asyncio.open_connection(
+            host, int(port or default_port), ssl=self.scheme == "https"), self.timeout)
+
+    async def _exchange(self, reader, writer, lat, lng):
+        """One request on a connection; pools it again if the server keeps it alive."""
+        try:
+            request = (f"GET {self.path}?{self._query(lat, lng)} HTTP/1.1\r\n"
+                       f"Host: {self.netloc}\r\nAccept: application/json\r\n\r\n")
+            writer.write(request.encode("ascii"))
+            await writer.drain()
+            body, keep_alive = await asyncio.wait_for(_read_http_response(reader), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            writer.close()
+            raise
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return body
+
+    async def lookup_async(self, lat, lng):
+        if self._idle:
+            reader, writer = self._idle.pop()
+            try:
+                body = await self._exchange(reader, writer, lat, lng)
+            except STALE_STREAM_ERRORS:
+                logging.debug("[HttpBackend] Stale keep-alive connection, retrying on a new one")
+                body = await self._exchange(*await self._open(), lat, lng)
+        else:
+            body = await self._exchange(*await self._open(), lat, lng)
+        return self._result(json.loads(body))
+
+
+async def _read_http_response(reader):
+    """Reads one HTTP/1.1 response (Content-Length or chunked). Returns (body, keep_alive)."""
+    status_line = await reader.readline()
+    parts = status_line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+        raise ValueError(f"Bad status line: {status_line!r}")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(chunks)
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    keep_alive = headers.get("connection", "").lower() != "close" and parts[0] == b"HTTP/1.1"
+    return body, keep_alive
+
+
+class LookupCache:
+    """
+    LRU cache with a TTL, keyed by lat/lng rounded to QUANTIZE_DECIMALS.
+    Values are backend results, including None ("no coverage").
+    """
+    _MISSING = object()
+
+    def __init__(self, max_entries=100000, ttl_s=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(lat, lng):
+        return (round(lat, QUANTIZE_DECIMALS), round(lng, QUANTIZE_DECIMALS))
+
+    def get(self, key):
+        """Returns the cached result, or LookupCache._MISSING."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return self._MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class StreetViewResolver:
+    """Resolves a game's worth of candidate points concurrently through a backend + cache."""
+
+    def __init__(self, backend, max_workers=8, cache=None):
+        self.backend = backend
+        self.cache = cache if cache is not None else LookupCache()
+        self.max_workers = max_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="streetview")
+        # Created on first lookup_async, inside the running event loop
+        self._async_limit = None
+
+    def lookup(self, lat, lng):
+        """Single cached lookup. Returns (panoLat, panoLng, panoId) or None."""
+        key = LookupCache.key(lat, lng)
+        result = self.cache.get(key)
+        if result is LookupCache._MISSING:
+            start = time.perf_counter()
+            result = self.backend.lookup(lat, lng)
+            _observe_lookup(self.backend, result, time.perf_counter() - start)
+            self.cache.put(key, result)
+        return result
+
+    async def lookup_async(self, lat, lng):
+        """lookup() on the event loop, at most max_workers backend calls in flight."""
+        key = LookupCache.key(lat, lng)
+        result = self.cache.get(key)
+        if result is LookupCache._MISSING:
+            if self._async_limit is None:
+                self._async_limit = asyncio.Semaphore(self.max_workers)
+            async with self._async_limit:
+                start = time.perf_counter()
+                result = await self.backend.lookup_async(lat, lng)
+                _observe_lookup(self.backend, result, time.perf_counter() - start)
+            self.cache.put(key, result)
+        return result
+
+    def lookup_many(self, points):
+        """Looks up [(lat, lng), ...] with at most max_workers in flight. Same order as 'points'."""
+        if len(points) <= 1 or isinstance(self.backend, MockBackend):
+            return [self.lookup(lat, lng) for lat, lng in points]
+        return list(self._executor.map(lambda p: self.lookup(*p), points))
+
+    def resolve_many(self, map_geom, count, rng=None, sample=random_points):
+        """
+        Returns 'count' rounds (lat, lng, panoLat, panoLng, panoId) inside map_geom.
+        Candidates without coverage are resampled, up to MAX_RESAMPLE_ROUNDS times.
+        Candidates come from sample(map_geom, n, rng) -> (lats, lngs); seeded_rounds passes
+        its own generator and sampler.
+        Raises ValueError if the map still has too little coverage.
+        """
+        rounds = []
+        candidates = 0
+        for _ in range(MAX_RESAMPLE_ROUNDS):
+            missing = count - len(rounds)
+            if missing <= 0:
+                break
+            with span("sample_points"):
+                lats, lngs = sample(map_geom, missing, rng)
+            points = list(zip(lats.tolist(), lngs.tolist()))
+            candidates += len(points)
+            with span("streetview_lookup"):
+                found_all = self.lookup_many(points)
+            for (lat, lng), found in zip(points, found_all):
+                if found is not None:
+                    rounds.append((lat, lng) + tuple(found))
+        _observe_round_attempts(map_geom, candidates, len(rounds))
+        if len(rounds) < count:
+            raise ValueError(f"Could not find Street View coverage in {map_geom.name}.")
+        return rounds[:count]
+
+    async def resolve_many_async(self, map_geom, count, run_cpu, rng=None, sample=random_points):
+        """
+        resolve_many() for the event loop: sampling goes through run_cpu(fn, *args)
+        (an awaitable executor call), the lookups run concurrently on the loop.
+        """
+        rounds = []
+        candidates = 0
+        for _ in range(MAX_RESAMPLE_ROUNDS):
+            missing = count - len(rounds)
+            if missing <= 0:
+                break
+            with span("sample_points"):
+                lats, lngs = await run_cpu(sample, map_geom, missing, rng)
+            points = list(zip(lats.tolist(), lngs.tolist()))
+            candidates += len(points)
+            with span("streetview_lookup"):
+                found_all = await asyncio.gather(*(self.lookup_async(lat, lng) for lat, lng in points))
+            for (lat, lng), found in zip(points, found_all):
+                if found is not None:
+                    rounds.append((lat, lng) + tuple(found))
+        _observe_round_attempts(map_geom, candidates, len(rounds))
+        if len(rounds) < count:
+            raise ValueError(f"Could not find Street View coverage in {map_geom.name}.")
+        return rounds[:count]
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "maxWorkers": self.max_workers,
+            "cacheEntries": len(self.cache),
+            "cacheHits": self.cache.hits,
+            "cacheMisses": self.cache.misses
+        }
+
+
+LOOKUP_SECONDS = Histogram(
+    "otterguessr_streetview_lookup_seconds",
+    "Street View backend lookups (cache misses only) by backend and result.",
+    ("backend", "result")
+)
+ROUND_ATTEMPTS = Histogram(
+    "otterguessr_round_attempts",
+    "Candidate points sampled per round with Street View coverage, per map.",
+    ("map",),
+    buckets=ATTEMPT_BUCKETS
+)
+
+
+def _observe_lookup(backend, result, seconds):
+    LOOKUP_SECONDS.observe(seconds, type(backend).__name__, "found" if result is not None else "none")
+
+
+def _observe_round_attempts(map_geom, candidates, accepted):
+    if accepted:
+        ROUND_ATTEMPTS.observe_many(candidates / accepted, accepted, map_geom.name)
+
+
+def _cache_samples():
+    if _RESOLVER is None:
+        return []
+    cache = _RESOLVER.cache
+    return [(("hit",), cache.hits), (("miss",), cache.misses)]
+
+
+CallbackMetric("otterguessr_streetview_cache_lookups", "Resolver cache lookups by outcome.",
+               "counter", ("outcome",), _cache_samples)
+CallbackMetric("otterguessr_streetview_cache_entries", "Entries in the resolver cache.", "gauge", (),
+               lambda: [((), len(_RESOLVER.cache))] if _RESOLVER is not None else [])
+
+
+def _backend_from_env():
+    kind = os.environ.get("OTTERGUESSR_STREETVIEW_BACKEND", "mock").lower()
+    if kind == "stub":
+        return StubBackend(
+            latency_ms=float(os.environ.get("OTTERGUESSR_STREETVIEW_LATENCY_MS", 50)),
+            miss_rate=float(os.environ.get("OTTERGUESSR_STREETVIEW_MISS_RATE", 0))
+        )
+    if kind == "http":
+        return HttpBackend(
+            url=os.environ.get("OTTERGUESSR_STREETVIEW_URL", DEFAULT_METADATA_URL),
+            api_key=os.environ.get("OTTERGUESSR_STREETVIEW_KEY", "")
+        )
+    return MockBackend()
+
+
+_RESOLVER = None
+_RESOLVER_LOCK = threading.Lock()
+
+
+def get_resolver():
+    """Returns the process-wide StreetViewResolver, built from env on first use."""
+    global _RESOLVER
+    if _RESOLVER is None:
+        with _RESOLVER_LOCK:
+            if _RESOLVER is None:
+                _RESOLVER = StreetViewResolver(
+                    _backend_from_env(),
+                    max_workers=int(os.environ.get("OTTERGUESSR_STREETVIEW_WORKERS", 8))
+                )
+                logging.info("[streetview_resolver] Using %s", type(_RESOLVER.backend).__name__)
+    return _RESOLVER
+
+
+def set_resolver(resolver):
+    """Replaces the process-wide resolver (benchmarks, tests, custom backends)."""
+    global _RESOLVER
+    _RESOLVER = resolver
+
+
+def _reset_after_fork():
+    # The thread pool's workers don't exist in a forked child; build a fresh resolver there
+    global _RESOLVER
+    _RESOLVER = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,76 @@
+"""
+streetview_stub.py
+
+Local stand-in for the Street View metadata API, for benchmarking the resolver offline.
+Answers GET <any path>?location=<lat>,<lng> like the real endpoint:
+  { "status": "OK", "location": {"lat":..., "lng":...}, "pano_id": "..." } or { "status": "ZERO_RESULTS" }
+
+Usage:
+  python streetview_stub.py --port 8765 --latency-ms 80 --miss-rate 0.1
+  OTTERGUESSR_STREETVIEW_BACKEND=http OTTERGUESSR_STREETVIEW_URL=http://127.0.0.1:8765/metadata python app.py
+"""
+
+import argparse
+import json
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from streetview_resolver import stub_pano_id
+
+
+def make_handler(latency_ms, miss_rate):
+    class StubHandler(BaseHTTPRequestHandler):
+        # Keep-alive, so the resolver's pooled connections are actually reused
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; don't let Nagle hold the body back
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            try:
+                lat, lng = (float(v) for v in query["location"][0].split(","))
+            except (KeyError, ValueError):
+                self._send({"status": "INVALID_REQUEST"}, 400)
+                return
+
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            pano_id = stub_pano_id(lat, lng)
+            if int(pano_id[:8], 16) / 0xFFFFFFFF < miss_rate:
+                self._send({"status": "ZERO_RESULTS"})
+            else:
+                self._send({"status": "OK", "location": {"lat": lat, "lng": lng}, "pano_id": pano_id})
+
+        def _send(self, payload, status=200):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Street View metadata stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--miss-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    # The default listen backlog (5) drops SYNs when an async client opens many connections at once
+    ThreadingHTTPServer.request_queue_size = 128
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.latency_ms, args.miss_rate))
+    print(f"Street View stub on http://{args.host}:{args.port}/metadata "
+          f"(latency={args.latency_ms}ms, miss rate={args.miss_rate})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
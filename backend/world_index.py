@@ -0,0 +1,225 @@
+"""
+world_index.py
+
+Every bundled map as one "World" map, plus reverse country lookup:
+ - WorldIndex -> an STRtree over the coarse outlines of all maps, and one TriangleSampler over
+   all of their triangles, weighted per country. Quacks like a geometry_registry.MapGeometry,
+   so round pools and the Street View resolver take it as a map.
+ - get_world() -> the process-wide WorldIndex, rebuilt when a map changes on disk
+ - country_at(lat, lng) / countries_at(lats, lngs) -> filename of the map containing the point(s)
+ - is_world(name_or_path), load_map(path) -> World-aware get_map_geometry for the game routes
+   ("mapName": "World" / "mapFile": "World")
+
+Lookups query the tree for candidate maps by bounding box (O(log n)) and test only those,
+instead of testing all 180 maps one by one, going through the maps' precision tiers like
+MapGeometry.contains_xy (see geometry_registry): the simplified outer and core tiers decide
+most points, and full geometries are only loaded for maps with points in their border band.
+
+Weights (OTTERGUESSR_WORLD_WEIGHTS):
+  area        -> (default) approximate surface area: triangle areas in degrees² times
+                 cos(latitude), so high-latitude countries are not oversampled
+  population  -> {filename: population} from the JSON file OTTERGUESSR_WORLD_POPULATIONS;
+                 maps without an entry are never sampled (but still found by country_at)
+Within a country, points stay uniform in lng/lat degrees like on every other map.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import shapely
+
+from geometry_registry import CONTAINMENT_CHECKS, MAPS_DIR, get_map_geometry
+from map_catalog import MAP_CATALOG, display_name
+from point_sampler import TriangleSampler, get_sampler
+
+WORLD_MAP_NAME = "World"
+WORLD_WEIGHTS = os.environ.get("OTTERGUESSR_WORLD_WEIGHTS", "area").lower()
+WORLD_POPULATIONS = os.environ.get("OTTERGUESSR_WORLD_POPULATIONS", "")
+
+
+def is_world(name_or_path):
+    """True for the virtual World map, given a mapName/mapFile or a path built from one."""
+    return os.path.basename(str(name_or_path or "")) == WORLD_MAP_NAME
+
+
+def _load_populations(path):
+    with open(path, "r", encoding="utf-8") as f:
+        populations = json.load(f)
+    if not isinstance(populations, dict):
+        raise ValueError(f"{path} must map .geojson filenames to populations.")
+    return {name: float(value) for name, value in populations.items()}
+
+
+def _country_weight(sampler, weights, population):
+    """Sampling weight of one country for the given scheme."""
+    if weights == "population":
+        return population or 0.0
+    triangles = sampler.triangles
+    areas = np.diff(sampler.cum_areas, prepend=0.0)
+    centroid_lats = triangles[:, :, 1].mean(axis=1)
+    return float((areas * np.cos(np.radians(centroid_lats))).sum())
+
+
+class WorldIndex:
+    """
+    All maps of a directory at once. 'names' are the map filenames in index order;
+    everything else is derived from them at build time and never mutated.
+    """
+
+    def __init__(self, map_geoms, weights="area", populations=None, signature=None):
+        if weights not in ("area", "population"):
+            raise ValueError(f"Unknown world weights '{weights}', expected area or population.")
+        if not map_geoms:
+            raise ValueError("No maps to build the world from.")
+        populations = populations or {}
+        self.signature = signature
+        self.weights = weights
+        self.names = [m.name for m in map_geoms]
+
+        # Reverse lookup: one tree item per part of each map's outer tier, so a country's
+        # far-flung islands don't give it one huge bounding box
+        self._maps = list(map_geoms)
+        parts, owners = [], []
+        for i, map_geom in enumerate(map_geoms):
+            outline = map_geom.outer if map_geom.outer is not None else map_geom.geometry
+            geom_parts = shapely.get_parts(outline)
+            parts.append(geom_parts)
+            owners.append(np.full(len(geom_parts), i, dtype=np.int32))
+        self._parts = np.concatenate(parts)
+        self._owners = np.concatenate(owners)
+        shapely.prepare(self._parts)
+        self._tree = shapely.STRtree(self._parts)
+        # Per map; None (no core) never contains a point, so those go to the full geometry
+        self._cores = np.empty(len(map_geoms), dtype=object)
+        self._cores[:] = [m.core for m in map_geoms]
+
+        # Sampling: one triangle table for the whole world, each country's triangles
+        # scaled so that the country as a whole gets its weight
+        triangles, cum_weights = [], []
+        self.country_weights = {}
+        total = 0.0
+        for map_geom in map_geoms:
+            sampler = get_sampler(map_geom)
+            weight = _country_weight(sampler, weights, populations.get(map_geom.name))
+            self.country_weights[map_geom.name] = weight
+            if weight <= 0:
+                continue
+            triangles.append(sampler.triangles)
+            cum_weights.append(total + np.asarray(sampler.cum_areas) / sampler.total_area * weight)
+            total += weight
+        if not triangles:
+            raise ValueError(f"No map has a positive '{weights}' weight.")
+        self.sampler = TriangleSampler.from_arrays(np.concatenate(triangles), np.concatenate(cum_weights))
+
+        # MapGeometry interface (round_pool, streetview_resolver, point_sampler)
+        self.name = WORLD_MAP_NAME
+        self.path = os.path.join(MAPS_DIR, WORLD_MAP_NAME)
+        self.mtime = hash(signature)
+        self.geometry = None
+        self.bounds = (-180.0, -90.0, 180.0, 90.0)
+        self.area = float(sum(m.area for m in map_geoms))
+
+    def __repr__(self):
+        return f"WorldIndex({len(self.names)} maps, weights={self.weights!r})"
+
+    def countries_at(self, lats, lngs):
+        """
+        Map filename containing each (lat, lng), or None (sea, or no bundled map there).
+        Vectorized: lats/lngs are sequences or arrays of the same length.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        owner = np.full(len(lats), -1, dtype=np.int32)
+        if not len(lats):
+            return []
+        point_idx, part_idx = self._tree.query(shapely.points(lngs, lats))
+        # Outer tier: drop candidates outside the map's coarse outline
+        inside = shapely.contains_xy(self._parts[part_idx], lngs[point_idx], lats[point_idx])
+        CONTAINMENT_CHECKS.inc("outer", amount=len(inside) - int(inside.sum()))
+        point_idx, map_idx = point_idx[inside], self._owners[part_idx[inside]]
+        # Core tier: inside the map's simplified interior means inside the map
+        in_core = shapely.contains_xy(self._cores[map_idx], lngs[point_idx], lats[point_idx])
+        owner[point_idx[in_core]] = map_idx[in_core]
+        CONTAINMENT_CHECKS.inc("core", amount=int(in_core.sum()))
+        # Border band: full geometries, loaded on first use, of just the maps involved
+        point_idx, map_idx = point_idx[~in_core], map_idx[~in_core]
+        if len(point_idx):
+            full = np.empty(len(self._maps), dtype=object)
+            for i in np.unique(map_idx).tolist():
+                full[i] = self._maps[i].geometry
+            hit = shapely.contains_xy(full[map_idx], lngs[point_idx], lats[point_idx])
+            owner[point_idx[hit]] = map_idx[hit]
+            CONTAINMENT_CHECKS.inc("full", amount=len(point_idx))
+        return [self.names[i] if i >= 0 else None for i in owner.tolist()]
+
+    def country_at(self, lat, lng):
+        """Map filename containing (lat, lng), or None."""
+        return self.countries_at([lat], [lng])[0]
+
+    def stats(self):
+        return {
+            "maps": len(self.names),
+            "parts": len(self._parts),
+            "fullGeometriesLoaded": sum(m.geometry_loaded for m in self._maps),
+            "triangles": len(self.sampler),
+            "weights": self.weights
+        }
+
+
+_WORLD = None
+_WORLD_LOCK = threading.Lock()
+
+
+def _build(signature, maps_dir):
+    start = time.perf_counter()
+    map_geoms = []
+    for name, _mtime in signature:
+        try:
+            map_geoms.append(get_map_geometry(os.path.join(maps_dir, name)))
+        except Exception:
+            logging.exception("[world_index] Leaving %s out of the world", name)
+    populations = _load_populations(WORLD_POPULATIONS) if WORLD_WEIGHTS == "population" else None
+    world = WorldIndex(map_geoms, WORLD_WEIGHTS, populations, signature)
+    logging.info("[world_index] Built %r in %.2fs", world, time.perf_counter() - start)
+    return world
+
+
+def get_world():
+    """
+    Returns the WorldIndex over assets/maps, building it on first use and again whenever
+    MAP_CATALOG sees a map added, removed or modified.
+    """
+    global _WORLD
+    signature = MAP_CATALOG.signature()
+    world = _WORLD
+    if world is not None and world.signature == signature:
+        return world
+    with _WORLD_LOCK:
+        if _WORLD is None or _WORLD.signature != signature:
+            _WORLD = _build(signature, MAP_CATALOG.maps_dir)
+        return _WORLD
+
+
+def load_map(geojson_path):
+    """get_map_geometry, except that the World map resolves to the WorldIndex."""
+    if is_world(geojson_path):
+        return get_world()
+    return get_map_geometry(geojson_path)
+
+
+def country_at(lat, lng):
+    return get_world().country_at(lat, lng)
+
+
+def countries_at(lats, lngs):
+    return get_world().countries_at(lats, lngs)
+
+
+def country_result(lat, lng):
+    """{"name", "displayName"} of the map containing (lat, lng), or None; for API responses."""
+    name = country_at(lat, lng)
+    return {"name": name, "displayName": display_name(name)} if name is not None else None
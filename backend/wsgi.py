@@ -0,0 +1,50 @@
+"""
+wsgi.py
+
+Production entry point (instead of app.run(debug=True)):
+  gunicorn -c gunicorn.conf.py          # uses wsgi_app = "wsgi:create_app()"
+
+create_app() loads every map's geometry and sampling tables from the memory-mapped map
+bundle (compiling it first if it is missing or stale, see map_bundle). With preload_app this
+runs once in the gunicorn master, so forked workers share the geometry copy-on-write and
+the sampling tables through the page cache, and start serving without any parsing.
+
+Config (env): OTTERGUESSR_BUNDLE_PATH -> compiled map bundle (default assets/maps.bundle)
+"""
+
+import logging
+import time
+
+import map_bundle
+from geometry_registry import MAPS_DIR, cached_maps, invalidate, warm_up
+from point_sampler import get_sampler
+from world_index import get_world
+
+
+def preload_maps(maps_dir=MAPS_DIR, bundle_path=None):
+    """Loads all maps from the map bundle and binds their samplers to it. Returns the map count."""
+    bundle_path = bundle_path or map_bundle.DEFAULT_BUNDLE_PATH
+    start = time.perf_counter()
+    if not map_bundle.attach(bundle_path) or map_bundle.stale_maps(maps_dir):
+        logging.info("[wsgi] Map bundle missing or stale, compiling %s", bundle_path)
+        map_bundle.compile_bundle(maps_dir, bundle_path)
+        map_bundle.attach(bundle_path)
+        # Entries cached before the recompile were parsed from their .geojson
+        invalidate()
+
+    warm_up(maps_dir)
+    maps = cached_maps()
+    for map_geom in maps:
+        map_geom.sampler = None
+        get_sampler(map_geom)
+    # World mode + country lookups, built from the samplers above
+    get_world()
+    logging.info("[wsgi] Preloaded %s maps in %.2fs", len(maps), time.perf_counter() - start)
+    return len(maps)
+
+
+def create_app():
+    """WSGI app factory: preload maps, then hand out the Flask app from app.py."""
+    preload_maps()
+    from app import app
+    return app